@@ -5,9 +5,11 @@ import { useParams, useRouter } from "next/navigation";
 import { motion, AnimatePresence } from "framer-motion";
 import { TrendingUp, AlertCircle, Clock, BookOpen, Pen, Loader2, ChevronDown, Search, ArrowLeft } from "lucide-react";
 import { AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from "recharts";
-import { analyzeCompany, getAnalysisResult, type AnalysisResult } from "@/lib/api";
+import { analyzeCompany, cancelAnalysis, waitForAnalysis, type AnalysisResult } from "@/lib/api";
 import ThemeToggle from "../../components/ThemeToggle";
 
+type Analysis = NonNullable<AnalysisResult["result"]>["analysis"];
+
 // 支持的生物医药公司列表
 const COMPANIES = [
   { ticker: "LEGN", name: "传奇生物", nameEn: "Legend Biotech", focus: "CAR-T细胞疗法" },
@@ -31,6 +33,10 @@ export default function AnalysisPage() {
   const [showSelector, setShowSelector] = useState(false);
 
   useEffect(() => {
+    const controller = new AbortController();
+    let jobId: string | null = null;
+    let finished = false;
+
     async function fetchAnalysis() {
       try {
         setLoading(true);
@@ -38,23 +44,34 @@ export default function AnalysisPage() {
 
         // 启动分析
         const job = await analyzeCompany(ticker);
+        jobId = job.job_id;
 
-        // 获取分析结果
-        const result = await getAnalysisResult(job.job_id);
+        // 轮询分析结果
+        const result = await waitForAnalysis(job.job_id, controller.signal);
+        finished = true;
 
-        if (result.status === "failed") {
+        if (result.status !== "completed") {
           setError(result.error || "分析失败");
         } else {
           setAnalysisData(result);
         }
       } catch (err) {
+        if (controller.signal.aborted) return;
         setError(err instanceof Error ? err.message : "加载数据失败");
       } finally {
-        setLoading(false);
+        if (!controller.signal.aborted) setLoading(false);
       }
     }
 
     fetchAnalysis();
+
+    // 离开页面或切换公司时取消仍在进行的分析，释放后端的上游调用
+    return () => {
+      controller.abort();
+      if (jobId && !finished) {
+        cancelAnalysis(jobId).catch(() => {});
+      }
+    };
   }, [ticker]);
 
   // 切换公司
@@ -116,6 +133,12 @@ export default function AnalysisPage() {
     return "最新";
   };
 
+  // 降级模式下模块可能只有降级标记，字段一律按可能缺失处理
+  const reality: Analysis["reality"] = result.analysis?.reality ?? {};
+  const survival: Analysis["survival"] = result.analysis?.survival ?? {};
+  const competition: Analysis["competition"] = result.analysis?.competition ?? {};
+  const PLACEHOLDER = "暂无数据";
+
   const companyData = {
     ticker: result.ticker,
     name: result.company_name,
@@ -123,72 +146,97 @@ export default function AnalysisPage() {
     focus: result.focus || "",
     keyProducts: result.key_products || [],
     therapeuticAreas: result.therapeutic_areas || [],
-    narrativeIdentity: result.analysis.reality.narrative_label,
-    economicIdentity: result.analysis.reality.economic_label,
-    realityGapScore: result.analysis.reality.reality_gap_score,
-    keyInsight: result.analysis.reality.key_insight || "",
+    narrativeIdentity: reality.narrative_label || PLACEHOLDER,
+    economicIdentity: reality.economic_label || PLACEHOLDER,
+    realityGapScore: reality.reality_gap_score,
+    keyInsight: reality.key_insight || "",
     lastUpdated: getLastUpdated(),
   };
 
+  // 降级提示：哪些模块来自后备结果，以及数据时间
+  const SECTION_LABELS: Record<string, string> = {
+    reality: "业务实质",
+    survival: "财务生存",
+    competition: "竞争格局",
+    history: "营收历史",
+    pipeline: "研发管线",
+  };
+  const degradedSections = result.degraded_sections || [];
+  const staleAsOf = result.stale_as_of ? new Date(result.stale_as_of).toLocaleDateString("zh-CN") : null;
+
+  const keyRisks = survival.key_risks || [];
+  const competitors = competition.competitors || [];
+
   const financialMetrics = {
     revenue: {
-      value: result.analysis.survival.quarterly_revenue
-        ? `$${result.analysis.survival.quarterly_revenue.toFixed(1)}M`
+      value: typeof survival.quarterly_revenue === "number"
+        ? `$${survival.quarterly_revenue.toFixed(1)}M`
         : "N/A",
-      change: result.analysis.survival.revenue_change_yoy || "N/A",
-      trend: result.analysis.survival.revenue_change_yoy?.startsWith("+") ? "up" : "stable"
+      change: survival.revenue_change_yoy || "N/A",
+      trend: survival.revenue_change_yoy?.startsWith("+") ? "up" : "stable"
     },
     netIncome: {
-      value: result.analysis.survival.net_income !== undefined
-        ? `$${result.analysis.survival.net_income.toFixed(1)}M`
+      value: typeof survival.net_income === "number"
+        ? `$${survival.net_income.toFixed(1)}M`
         : "N/A",
-      change: result.analysis.survival.net_income_change || "N/A",
-      trend: result.analysis.survival.net_income !== undefined && result.analysis.survival.net_income > 0 ? "up" : "improving"
+      change: survival.net_income_change || "N/A",
+      trend: typeof survival.net_income === "number" && survival.net_income > 0 ? "up" : "improving"
     },
     cashPosition: {
-      value: result.analysis.survival.cash_position
-        ? `$${result.analysis.survival.cash_position.toFixed(1)}M`
+      value: typeof survival.cash_position === "number"
+        ? `$${survival.cash_position.toFixed(1)}M`
         : "N/A",
-      change: result.analysis.survival.cash_change || "N/A",
+      change: survival.cash_change || "N/A",
       trend: "stable"
     },
     burnRate: {
-      value: result.analysis.survival.runway_months
-        ? `${result.analysis.survival.runway_months}个月`
-        : "充裕",
-      description: result.analysis.survival.financial_health,
-      risk: result.analysis.survival.runway_months && result.analysis.survival.runway_months < 24 ? "medium" : "low",
+      value: survival.runway_months
+        ? `${survival.runway_months}个月`
+        : survival.degraded ? "N/A" : "充裕",
+      description: survival.financial_health || PLACEHOLDER,
+      risk: survival.runway_months && survival.runway_months < 24 ? "medium" : "low",
     },
   };
 
   // 使用真实的历史营收数据，如果没有则使用空数组
-  const revenueData = result.analysis.history?.revenue_history || [];
+  const revenueData = result.analysis?.history?.revenue_history || [];
+
+  const rdIntensity = survival.rd_intensity ? `研发投入强度：${survival.rd_intensity}。` : "";
+  const riskText = keyRisks.length > 0 ? `关键风险包括：${keyRisks.slice(0, 3).join("、")}。` : "";
 
   const aiInsights = [
     {
       type: "reality",
       title: "业务实质还原",
-      content: `${result.company_name} 的叙事身份是"${result.analysis.reality.narrative_label}"，但经济实质是"${result.analysis.reality.economic_label}"。现实差距评分为 ${result.analysis.reality.reality_gap_score}/10。`,
-      score: result.analysis.reality.reality_gap_score,
-      label: result.analysis.reality.reality_gap_score >= 7 ? "叙事与现实存在显著差距" : "叙事与现实基本一致",
+      content: reality.narrative_label || reality.economic_label
+        ? `${result.company_name} 的叙事身份是"${companyData.narrativeIdentity}"，但经济实质是"${companyData.economicIdentity}"。现实差距评分为 ${reality.reality_gap_score ?? "-"}/10。`
+        : PLACEHOLDER,
+      score: reality.reality_gap_score,
+      label: reality.reality_gap_score === undefined
+        ? ""
+        : reality.reality_gap_score >= 7 ? "叙事与现实存在显著差距" : "叙事与现实基本一致",
     },
     {
       type: "survival",
       title: "财务生存透视",
-      content: result.analysis.survival.runway_months
-        ? `公司拥有约 ${result.analysis.survival.runway_months} 个月的现金跑道。${result.analysis.survival.rd_intensity ? `研发投入强度：${result.analysis.survival.rd_intensity}。` : ""}${result.analysis.survival.financial_health}。关键风险包括：${result.analysis.survival.key_risks.slice(0, 3).join("、")}。`
-        : `${result.analysis.survival.rd_intensity ? `研发投入强度：${result.analysis.survival.rd_intensity}。` : ""}${result.analysis.survival.financial_health}。关键风险包括：${result.analysis.survival.key_risks.slice(0, 3).join("、")}。`,
-      score: result.analysis.survival.runway_months
-        ? (result.analysis.survival.runway_months >= 18 ? 6 : 8)
-        : 4,
-      label: result.analysis.survival.financial_health?.slice(0, 30) + "...",
+      content: survival.runway_months
+        ? `公司拥有约 ${survival.runway_months} 个月的现金跑道。${rdIntensity}${survival.financial_health ? `${survival.financial_health}。` : ""}${riskText}`
+        : `${rdIntensity}${survival.financial_health ? `${survival.financial_health}。` : ""}${riskText}` || PLACEHOLDER,
+      score: survival.degraded && !survival.financial_health
+        ? undefined
+        : survival.runway_months
+          ? (survival.runway_months >= 18 ? 6 : 8)
+          : 4,
+      label: survival.financial_health ? survival.financial_health.slice(0, 30) + "..." : "",
     },
     {
       type: "competition",
       title: "竞争格局分析",
-      content: `直接竞争对手：${result.analysis.competition.competitors.join("、")}。${result.analysis.competition.competitive_advantage ? `核心优势：${result.analysis.competition.competitive_advantage}。` : ""}Kill Switch：${result.analysis.competition.kill_switch}。`,
-      score: 7,
-      label: result.analysis.competition.kill_switch?.slice(0, 30) + "...",
+      content: competitors.length > 0 || competition.kill_switch
+        ? `${competitors.length > 0 ? `直接竞争对手：${competitors.join("、")}。` : ""}${competition.competitive_advantage ? `核心优势：${competition.competitive_advantage}。` : ""}${competition.kill_switch ? `Kill Switch：${competition.kill_switch}。` : ""}`
+        : PLACEHOLDER,
+      score: competition.degraded && competitors.length === 0 ? undefined : 7,
+      label: competition.kill_switch ? competition.kill_switch.slice(0, 30) + "..." : "",
     },
   ];
 
@@ -273,6 +321,20 @@ export default function AnalysisPage() {
 
       {/* Main Content */}
       <div className="max-w-7xl mx-auto px-6 py-12 relative z-10">
+        {/* Degraded Banner */}
+        {result.degraded && (
+          <div className="mb-8 p-4 flex items-start gap-3 bg-amber-50 dark:bg-amber-900/20 border border-amber-300 dark:border-amber-700/40 rounded-xl text-amber-800 dark:text-amber-300">
+            <AlertCircle className="w-5 h-5 mt-0.5 shrink-0" />
+            <div className="text-sm leading-relaxed">
+              <div className="font-medium">AI 服务暂时不可用，部分模块显示的是降级数据</div>
+              <div>
+                降级模块：{degradedSections.map((section) => SECTION_LABELS[section] || section).join("、") || "未知"}
+                {staleAsOf ? `；数据截至 ${staleAsOf}` : "；暂无可用的历史数据"}
+              </div>
+            </div>
+          </div>
+        )}
+
         {/* Company Header */}
         <motion.div
           initial={{ opacity: 0, y: 20 }}
@@ -327,10 +389,12 @@ export default function AnalysisPage() {
             <div className="text-right ancient-border p-6 rounded-xl bg-gradient-to-br from-orange-50 to-amber-50 dark:from-amber-900/20 dark:to-orange-900/20 border border-orange-200 dark:border-orange-800/30">
               <div className="text-sm text-muted-foreground mb-2">现实差距评分</div>
               <div className="text-6xl font-bold font-mono gradient-text mb-2">
-                {companyData.realityGapScore}
+                {companyData.realityGapScore ?? "-"}
               </div>
               <div className="text-xs text-orange-600 dark:text-orange-400 font-medium">
-                {companyData.realityGapScore >= 7 ? "需要警惕" : companyData.realityGapScore >= 4 ? "适度关注" : "基本一致"}
+                {companyData.realityGapScore === undefined
+                  ? PLACEHOLDER
+                  : companyData.realityGapScore >= 7 ? "需要警惕" : companyData.realityGapScore >= 4 ? "适度关注" : "基本一致"}
               </div>
             </div>
           </div>
@@ -423,7 +487,7 @@ export default function AnalysisPage() {
         </motion.div>
 
         {/* Pipeline Analysis */}
-        {result.analysis.pipeline && (
+        {result.analysis?.pipeline?.pipeline && result.analysis.pipeline.pipeline.length > 0 && (
           <motion.div
             initial={{ opacity: 0, y: 20 }}
             animate={{ opacity: 1, y: 0 }}
@@ -446,7 +510,7 @@ export default function AnalysisPage() {
                   </tr>
                 </thead>
                 <tbody>
-                  {result.analysis.pipeline.pipeline?.map((drug, idx) => (
+                  {result.analysis.pipeline.pipeline.map((drug, idx) => (
                     <tr key={idx} className="border-b border-border/50 hover:bg-muted/30 transition-colors">
                       <td className="py-3 px-4 font-medium">{drug.name}</td>
                       <td className="py-3 px-4">
@@ -549,9 +613,11 @@ function InsightCard({ insight, delay }: { insight: any; delay: number }) {
         <div className="flex-1">
           <div className="flex items-center justify-between mb-4">
             <h4 className="text-2xl font-serif font-semibold">{insight.title}</h4>
-            <span className={`text-lg font-mono font-bold ${insight.score >= 7 ? "text-orange-600" : "text-blue-600"}`}>
-              {insight.score}/10
-            </span>
+            {insight.score !== undefined && (
+              <span className={`text-lg font-mono font-bold ${insight.score >= 7 ? "text-orange-600" : "text-blue-600"}`}>
+                {insight.score}/10
+              </span>
+            )}
           </div>
           <p className="text-foreground/80 leading-relaxed mb-4 text-lg">{insight.content}</p>
           <div className="text-sm text-orange-600 italic font-medium">{insight.label}</div>
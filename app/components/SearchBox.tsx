@@ -4,6 +4,7 @@ import { useState, useRef, useEffect } from "react";
 import { useRouter } from "next/navigation";
 import { motion, AnimatePresence } from "framer-motion";
 import { Search, ArrowRight } from "lucide-react";
+import { prefetchCompany, searchCompanies } from "@/lib/api";
 
 const COMPANIES = [
   { ticker: "LEGN", name: "传奇生物", focus: "CAR-T细胞疗法" },
@@ -16,26 +17,67 @@ const COMPANIES = [
   { ticker: "ALNY", name: "Alnylam", focus: "RNAi疗法" },
 ];
 
+type Suggestion = { ticker: string; name: string; focus: string };
+
 export default function SearchBox() {
   const [query, setQuery] = useState("");
   const [isFocused, setIsFocused] = useState(false);
   const [showSuggestions, setShowSuggestions] = useState(false);
+  const [remoteCompanies, setRemoteCompanies] = useState<Suggestion[] | null>(null);
   const inputRef = useRef<HTMLInputElement>(null);
   const router = useRouter();
 
-  const filteredCompanies = COMPANIES.filter(
+  const localCompanies = COMPANIES.filter(
     (company) =>
       company.ticker.toLowerCase().includes(query.toLowerCase()) ||
       company.name.toLowerCase().includes(query.toLowerCase())
   );
 
+  // 后端检索不可用时回退到本地列表
+  const filteredCompanies = remoteCompanies ?? localCompanies;
+
+  // 输入防抖后调用后端注册表检索（支持前缀、模糊和中文名）
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setRemoteCompanies(null);
+      return;
+    }
+
+    const controller = new AbortController();
+    const timer = setTimeout(() => {
+      searchCompanies(q, controller.signal)
+        .then((results) =>
+          setRemoteCompanies(
+            results.map((company) => ({
+              ticker: company.ticker,
+              name: company.company_name_cn || company.company_name,
+              focus: company.focus || company.company_name,
+            }))
+          )
+        )
+        .catch(() => {
+          if (!controller.signal.aborted) setRemoteCompanies(null);
+        });
+    }, 150);
+
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [query]);
+
   const handleSubmit = (e: React.FormEvent) => {
     e.preventDefault();
     const ticker = query.toUpperCase();
-    const isValid = COMPANIES.some((c) => c.ticker === ticker);
+    const isValid =
+      COMPANIES.some((c) => c.ticker === ticker) ||
+      filteredCompanies.some((c) => c.ticker === ticker);
     if (isValid) {
+      prefetchCompany(ticker);
       router.push(`/analysis/${ticker}`);
     } else if (filteredCompanies.length > 0) {
+      prefetchCompany(filteredCompanies[0].ticker);
       router.push(`/analysis/${filteredCompanies[0].ticker}`);
     }
   };
@@ -43,6 +85,8 @@ export default function SearchBox() {
   const handleSelect = (ticker: string) => {
     setQuery(ticker);
     setShowSuggestions(false);
+    // 页面跳转期间后端已开始获取数据，分析请求到达时直接接管
+    prefetchCompany(ticker);
     router.push(`/analysis/${ticker}`);
   };
 
@@ -85,31 +85,37 @@ export default function TestPage() {
                     <p>{result.result.company_name} ({result.result.ticker})</p>
                   </div>
 
+                  {result.result.degraded && (
+                    <div className="p-4 bg-amber-50 border border-amber-300 rounded-lg text-sm text-amber-800">
+                      降级数据：{(result.result.degraded_sections || []).join(', ')}（数据截至 {result.result.stale_as_of || '无'}）
+                    </div>
+                  )}
+
                   <div className="p-4 bg-card border rounded-lg">
                     <h3 className="font-bold mb-2">业务实质还原</h3>
                     <p className="text-sm mb-1">
-                      <span className="font-medium">叙事身份:</span> {result.result.analysis.reality.narrative_label}
+                      <span className="font-medium">叙事身份:</span> {result.result.analysis.reality?.narrative_label}
                     </p>
                     <p className="text-sm mb-1">
-                      <span className="font-medium">经济身份:</span> {result.result.analysis.reality.economic_label}
+                      <span className="font-medium">经济身份:</span> {result.result.analysis.reality?.economic_label}
                     </p>
                     <p className="text-sm">
-                      <span className="font-medium">现实差距评分:</span> {result.result.analysis.reality.reality_gap_score}/10
+                      <span className="font-medium">现实差距评分:</span> {result.result.analysis.reality?.reality_gap_score ?? '-'}/10
                     </p>
                   </div>
 
                   <div className="p-4 bg-card border rounded-lg">
                     <h3 className="font-bold mb-2">财务生存透视</h3>
                     <p className="text-sm mb-1">
-                      <span className="font-medium">现金跑道:</span> {result.result.analysis.survival.runway_months} 个月
+                      <span className="font-medium">现金跑道:</span> {result.result.analysis.survival?.runway_months} 个月
                     </p>
                     <p className="text-sm mb-2">
-                      <span className="font-medium">财务健康:</span> {result.result.analysis.survival.financial_health}
+                      <span className="font-medium">财务健康:</span> {result.result.analysis.survival?.financial_health}
                     </p>
                     <div className="text-sm">
                       <span className="font-medium">关键风险:</span>
                       <ul className="list-disc list-inside mt-1 space-y-1">
-                        {result.result.analysis.survival.key_risks.map((risk, i) => (
+                        {(result.result.analysis.survival?.key_risks || []).map((risk, i) => (
                           <li key={i}>{risk}</li>
                         ))}
                       </ul>
@@ -119,13 +125,13 @@ export default function TestPage() {
                   <div className="p-4 bg-card border rounded-lg">
                     <h3 className="font-bold mb-2">战场推演</h3>
                     <p className="text-sm mb-1">
-                      <span className="font-medium">竞争对手:</span> {result.result.analysis.competition.competitors.join(', ')}
+                      <span className="font-medium">竞争对手:</span> {(result.result.analysis.competition?.competitors || []).join(', ')}
                     </p>
                     <p className="text-sm mb-1">
-                      <span className="font-medium">Kill Switch:</span> {result.result.analysis.competition.kill_switch}
+                      <span className="font-medium">Kill Switch:</span> {result.result.analysis.competition?.kill_switch}
                     </p>
                     <p className="text-sm">
-                      <span className="font-medium">市场动态:</span> {result.result.analysis.competition.market_dynamics}
+                      <span className="font-medium">市场动态:</span> {result.result.analysis.competition?.market_dynamics}
                     </p>
                   </div>
                 </div>
@@ -0,0 +1,121 @@
+"""
+准入控制 - 超出处理能力时直接拒绝新的分析任务，而不是让所有请求一起超时
+
+依据：提供方槽位排队深度、进行中的上游调用数、进行中的任务数，以及根据近期 protocol 调用延迟
+估算的排队等待时间。低优先级（batch / background）的阈值更低，过载时优先被拒绝。
+"""
+import math
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Dict, Any
+
+import metrics
+from scheduler import PriorityLimiter
+
+# 每个分析任务发起的 protocol 调用数
+CALLS_PER_JOB = 5
+
+MAX_ACTIVE_JOBS = int(os.getenv("ADMISSION_MAX_ACTIVE_JOBS", "50"))
+MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "100"))
+MAX_ESTIMATED_WAIT = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "60"))
+
+# 没有延迟样本时假设的单次调用耗时（秒）
+DEFAULT_CALL_LATENCY = 20.0
+
+# 失败的调用（超时、异常、非 200）至少按该耗时（秒）计入延迟样本：快速失败（如连接被拒绝）
+# 不能让估算的排队时间变短，过载时的失败恰恰最需要计入
+FAILED_CALL_PENALTY = float(os.getenv("ADMISSION_FAILED_CALL_PENALTY_SECONDS", str(DEFAULT_CALL_LATENCY)))
+
+# 各优先级可使用的阈值比例
+PRIORITY_HEADROOM = {
+    "interactive": 1.0,
+    "batch": 0.5,
+    "background": 0.25,
+}
+
+metrics.describe("llm_call_seconds", "Provider call latency, by protocol")
+metrics.describe("admission_rejected_total", "Analysis requests rejected by admission control")
+metrics.describe("llm_call_failures_total", "Failed provider calls counted into the latency estimate, by protocol")
+
+
+@dataclass
+class Rejection:
+    status_code: int
+    retry_after: int
+    reason: str
+
+
+class AdmissionController:
+    def __init__(self, limiter: PriorityLimiter):
+        self.limiter = limiter
+        self._latencies: Dict[str, deque] = {}
+
+    def record_latency(self, protocol: str, seconds: float):
+        self._latencies.setdefault(protocol, deque(maxlen=100)).append(seconds)
+        metrics.observe("llm_call_seconds", seconds, protocol=protocol)
+
+    def record_failure(self, protocol: str, seconds: float):
+        """失败的调用按实际耗时与 FAILED_CALL_PENALTY 中的较大值计入"""
+        metrics.inc("llm_call_failures_total", protocol=protocol)
+        self.record_latency(protocol, max(seconds, FAILED_CALL_PENALTY))
+
+    def call_latency(self) -> float:
+        """近期单次 protocol 调用的平均耗时"""
+        samples = [s for window in self._latencies.values() for s in window]
+        if not samples:
+            return DEFAULT_CALL_LATENCY
+        return sum(samples) / len(samples)
+
+    def job_latency(self) -> float:
+        """一个任务的执行耗时（5 个 protocol 并行，取最慢的 protocol 的平均耗时）"""
+        means = [sum(window) / len(window) for window in self._latencies.values() if window]
+        return max(means) if means else DEFAULT_CALL_LATENCY
+
+    def estimate_wait(self, extra_calls: int = CALLS_PER_JOB) -> float:
+        """新任务的调用需要排在当前所有排队和进行中的调用之后，估算其排队等待时间"""
+        backlog = self.limiter.queue_depth() + self.limiter.in_use + extra_calls - self.limiter.capacity
+        if backlog <= 0:
+            return 0.0
+        return backlog / self.limiter.capacity * self.call_latency()
+
+    def check(self, priority: str, active_jobs: int) -> Optional[Rejection]:
+        """返回 None 表示接受，否则返回拒绝原因和建议的重试等待秒数"""
+        headroom = PRIORITY_HEADROOM.get(priority, 1.0)
+        # interactive 过载属于服务端容量问题（503），低优先级被限流（429）
+        status_code = 503 if priority == "interactive" else 429
+
+        wait = self.estimate_wait()
+        max_wait = MAX_ESTIMATED_WAIT * headroom
+        rejection = None
+        if active_jobs >= MAX_ACTIVE_JOBS * headroom:
+            # 估算要有多少任务完成才能空出名额
+            excess = active_jobs - MAX_ACTIVE_JOBS * headroom + 1
+            rejection = Rejection(status_code, self._retry_after(excess * CALLS_PER_JOB), "Too many analyses in progress")
+        elif self.limiter.queue_depth() >= MAX_QUEUE_DEPTH * headroom:
+            excess = self.limiter.queue_depth() - MAX_QUEUE_DEPTH * headroom + 1
+            rejection = Rejection(status_code, self._retry_after(excess), "Provider queue is full")
+        elif wait > max_wait:
+            rejection = Rejection(status_code, max(1, math.ceil(wait - max_wait)), f"Estimated wait {wait:.0f}s exceeds {max_wait:.0f}s")
+
+        if rejection:
+            metrics.inc("admission_rejected_total", priority=priority, status=str(status_code))
+        return rejection
+
+    def _retry_after(self, calls: float) -> int:
+        """按当前吞吐（槽位数 / 单次调用耗时）估算完成指定数量调用所需的秒数"""
+        return max(1, math.ceil(calls / self.limiter.capacity * self.call_latency()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "estimated_wait_seconds": round(self.estimate_wait(), 1),
+            "call_latency_seconds": round(self.call_latency(), 2),
+            "job_latency_seconds": round(self.job_latency(), 2),
+            "queue_depth": self.limiter.queue_depth(),
+            "in_flight": self.limiter.in_use,
+            "limits": {
+                "max_active_jobs": MAX_ACTIVE_JOBS,
+                "max_queue_depth": MAX_QUEUE_DEPTH,
+                "max_wait_seconds": MAX_ESTIMATED_WAIT,
+            },
+        }
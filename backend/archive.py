@@ -0,0 +1,272 @@
+"""
+历史分析快照归档 - 按公司和财报保存每一次完成的分析，支持按时间点查询和字段级对比
+
+存储方式（SQLite，默认 data/archive.db，可通过 ARCHIVE_DB 指定）：
+- 分析结果按模块拆分（analysis 下每个模块一份，其余顶层字段各一份），模块内容按哈希去重并用 zlib 压缩，
+  内容未变化的模块在多次快照之间只存一份；
+- 快照只记录相对同一公司上一次快照变化的模块（delta），每 KEYFRAME_INTERVAL 个快照存一次完整清单，
+  因此按时间点还原时最多回溯 KEYFRAME_INTERVAL 个快照。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+
+import metrics
+
+ARCHIVE_DB = os.getenv("ARCHIVE_DB", os.path.join(os.path.dirname(__file__), "data", "archive.db"))
+KEYFRAME_INTERVAL = int(os.getenv("ARCHIVE_KEYFRAME_INTERVAL", "16"))
+
+metrics.describe("archive_snapshots_total", "Analysis snapshots archived")
+metrics.describe("archive_sections_deduplicated_total", "Archived sections that reused an existing blob")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker TEXT NOT NULL,
+    filing TEXT,
+    created_at REAL NOT NULL,
+    keyframe INTEGER NOT NULL,
+    manifest TEXT NOT NULL,
+    changed TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_ticker_time ON snapshots (ticker, created_at);
+CREATE INDEX IF NOT EXISTS snapshots_ticker_keyframe ON snapshots (ticker, keyframe, id);
+"""
+
+
+def _units(result: Dict[str, Any]) -> Dict[str, Any]:
+    """把分析结果拆成存储单元：analysis 下每个模块一个单元，其余顶层字段各一个单元"""
+    units = {}
+    for key, value in result.items():
+        if key == "analysis" and isinstance(value, dict):
+            for section, section_value in value.items():
+                units[f"analysis.{section}"] = section_value
+        else:
+            units[key] = value
+    return units
+
+
+def _assemble(units: Dict[str, Any]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    for name, value in units.items():
+        if name.startswith("analysis."):
+            result.setdefault("analysis", {})[name.split(".", 1)[1]] = value
+        else:
+            result[name] = value
+    return result
+
+
+def filing_key(result: Dict[str, Any]) -> Optional[str]:
+    """快照对应的财报，如 "10-K 2024-02-28"（没有财报信息时为 None）"""
+    latest = (result.get("sec_data") or {}).get("latest_filing") or {}
+    form_type = latest.get("formType") or result.get("filing_type")
+    filed_at = latest.get("filedAt") or result.get("filing_date")
+    if not form_type:
+        return None
+    return f"{form_type} {filed_at[:10]}" if filed_at else form_type
+
+
+def parse_as_of(value: str) -> float:
+    """解析 as_of（ISO 日期或时间，无时区按 UTC）；只有日期时表示当天结束时的状态"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    timestamp = parsed.timestamp()
+    if len(value) == 10:
+        timestamp += 86400 - 0.001
+    return timestamp
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def diff_values(before: Any, after: Any, path: str = "") -> List[Dict[str, Any]]:
+    """字段级对比：递归比较字典，其他类型（包括列表）整体比较"""
+    if isinstance(before, dict) and isinstance(after, dict):
+        changes = []
+        for key in list(before) + [k for k in after if k not in before]:
+            child = f"{path}.{key}" if path else str(key)
+            if key not in after:
+                changes.append({"path": child, "op": "removed", "before": before[key], "after": None})
+            elif key not in before:
+                changes.append({"path": child, "op": "added", "before": None, "after": after[key]})
+            else:
+                changes.extend(diff_values(before[key], after[key], child))
+        return changes
+    if before != after:
+        return [{"path": path, "op": "changed", "before": before, "after": after}]
+    return []
+
+
+class AnalysisArchive:
+    def __init__(self, path: str = ARCHIVE_DB, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def record(self, result: Dict[str, Any], created_at: Optional[float] = None) -> int:
+        """归档一次完成的分析，返回快照 ID"""
+        ticker = result["ticker"].upper()
+        created_at = created_at or time.time()
+        hashes = {}
+        blobs = []
+        for name, value in _units(result).items():
+            body = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+            digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+            hashes[name] = digest
+            blobs.append((digest, zlib.compress(body)))
+
+        with self._lock, self._conn:
+            previous = self._latest_rows(ticker)
+            before = self._replay(previous) if previous else {}
+            changed = {name: digest for name, digest in hashes.items() if before.get(name) != digest}
+            removed = [name for name in before if name not in hashes]
+            keyframe = not previous or len(previous) >= self.keyframe_interval
+            manifest = hashes if keyframe else {"set": changed, "unset": removed}
+
+            for digest, body in blobs:
+                inserted = self._conn.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?)", (digest, body)).rowcount
+                if not inserted:
+                    metrics.inc("archive_sections_deduplicated_total")
+            cursor = self._conn.execute(
+                "INSERT INTO snapshots (ticker, filing, created_at, keyframe, manifest, changed) VALUES (?, ?, ?, ?, ?, ?)",
+                (ticker, filing_key(result), created_at, int(keyframe), json.dumps(manifest), json.dumps(sorted(changed) + removed))
+            )
+        metrics.inc("archive_snapshots_total")
+        return cursor.lastrowid
+
+    def _latest_rows(self, ticker: str, before_id: Optional[int] = None) -> List[sqlite3.Row]:
+        """
+        从指定快照（默认最新）往前直到最近的完整清单，按时间正序返回。
+        显式查找完整清单而不是按 keyframe_interval 限制行数：间隔在两次运行之间调小时，已有的 delta 链可能更长
+        """
+        condition = "ticker = ?"
+        params: List[Any] = [ticker]
+        if before_id is not None:
+            condition += " AND id <= ?"
+            params.append(before_id)
+        keyframe_id = self._conn.execute(
+            f"SELECT MAX(id) FROM snapshots WHERE {condition} AND keyframe = 1", params
+        ).fetchone()[0]
+        return self._conn.execute(
+            f"SELECT * FROM snapshots WHERE {condition} AND id >= ? ORDER BY id", (*params, keyframe_id or 0)
+        ).fetchall()
+
+    @staticmethod
+    def _replay(rows: List[sqlite3.Row]) -> Dict[str, str]:
+        """从完整清单开始依次应用 delta，得到最后一个快照的 模块 -> 哈希"""
+        hashes: Dict[str, str] = {}
+        for row in rows:
+            manifest = json.loads(row["manifest"])
+            if row["keyframe"]:
+                hashes = dict(manifest)
+            else:
+                hashes.update(manifest["set"])
+                for name in manifest["unset"]:
+                    hashes.pop(name, None)
+        return hashes
+
+    def _load(self, hashes: Dict[str, str]) -> Dict[str, Any]:
+        if not hashes:
+            return {}
+        placeholders = ",".join("?" * len(set(hashes.values())))
+        bodies = {
+            row["hash"]: json.loads(zlib.decompress(row["body"]))
+            for row in self._conn.execute(f"SELECT * FROM blobs WHERE hash IN ({placeholders})", list(set(hashes.values())))
+        }
+        return _assemble({name: bodies[digest] for name, digest in hashes.items()})
+
+    def _find(self, ticker: str, as_of: Optional[float] = None, filing: Optional[str] = None) -> Optional[sqlite3.Row]:
+        query = "SELECT * FROM snapshots WHERE ticker = ?"
+        params: List[Any] = [ticker.upper()]
+        if as_of is not None:
+            query += " AND created_at <= ?"
+            params.append(as_of)
+        if filing:
+            query += " AND filing = ?"
+            params.append(filing)
+        return self._conn.execute(query + " ORDER BY created_at DESC, id DESC LIMIT 1", params).fetchone()
+
+    @staticmethod
+    def _metadata(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "snapshot_id": row["id"],
+            "ticker": row["ticker"],
+            "filing": row["filing"],
+            "created_at": _isoformat(row["created_at"]),
+            # 相对上一次快照发生变化的模块
+            "changed": json.loads(row["changed"]),
+        }
+
+    def snapshot(
+        self,
+        ticker: str,
+        as_of: Optional[float] = None,
+        filing: Optional[str] = None,
+        snapshot_id: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """还原某个时间点（默认最新）或指定 ID 的快照"""
+        with self._lock:
+            if snapshot_id is not None:
+                row = self._conn.execute(
+                    "SELECT * FROM snapshots WHERE id = ? AND ticker = ?", (snapshot_id, ticker.upper())
+                ).fetchone()
+            else:
+                row = self._find(ticker, as_of, filing)
+            if row is None:
+                return None
+            result = self._load(self._replay(self._latest_rows(row["ticker"], before_id=row["id"])))
+            return {**self._metadata(row), "result": result}
+
+    def history(self, ticker: str, filing: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """某公司的快照列表（新的在前）"""
+        query = "SELECT * FROM snapshots WHERE ticker = ?"
+        params: List[Any] = [ticker.upper()]
+        if filing:
+            query += " AND filing = ?"
+            params.append(filing)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit)).fetchall()
+        return [self._metadata(row) for row in rows]
+
+    def latest_snapshots(self) -> List[Dict[str, Any]]:
+        """每家公司的最新快照"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ticker, MAX(id) AS id FROM snapshots GROUP BY ticker"
+            ).fetchall()
+        return [self.snapshot(row["ticker"], snapshot_id=row["id"]) for row in rows]
+
+    def diff(self, ticker: str, from_id: int, to_id: int) -> Optional[Dict[str, Any]]:
+        """两个快照之间的字段级差异"""
+        before = self.snapshot(ticker, snapshot_id=from_id)
+        after = self.snapshot(ticker, snapshot_id=to_id)
+        if before is None or after is None:
+            return None
+        return {
+            "ticker": ticker.upper(),
+            "from": {key: before[key] for key in ("snapshot_id", "filing", "created_at")},
+            "to": {key: after[key] for key in ("snapshot_id", "filing", "created_at")},
+            "changes": diff_values(before["result"], after["result"]),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
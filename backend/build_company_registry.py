@@ -0,0 +1,149 @@
+"""
+生成公司注册表数据文件（data/company_registry.json）
+
+SEC 的 company_tickers_exchange.json 只有 cik / name / ticker / exchange，没有 SIC；
+SIC 来自各公司的 submissions 数据（"sic" 字段），两者按 CIK 合并：
+
+    # 逐个公司请求 data.sec.gov/submissions（约 1 万家公司，按 SEC 限速约需 20 分钟）
+    python build_company_registry.py --user-agent "Veritas admin@example.com"
+
+    # 或使用 SEC 每日打包的 submissions.zip（先下载到本地，约 1.5 GB，不再逐个请求）
+    python build_company_registry.py --user-agent "..." --submissions-zip submissions.zip
+
+    # 只保留生物医药公司（SIC 2834 / 2836）
+    python build_company_registry.py --user-agent "..." --sic 2834,2836
+
+SEC 要求请求带可联系的 User-Agent，并限制每秒不超过 10 个请求。
+已有数据文件中的 SIC 会被复用（--refresh 时重新获取），不带 --sic 重复运行时只请求新增的公司。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zipfile
+from typing import Optional, Dict, Any, List, Iterable
+
+import httpx
+
+from company_registry import DEFAULT_REGISTRY_PATH
+
+TICKERS_URL = "https://www.sec.gov/files/company_tickers_exchange.json"
+SUBMISSIONS_URL = "https://data.sec.gov/submissions/CIK{cik:010d}.json"
+FIELDS = ["cik", "name", "ticker", "exchange", "sic"]
+# SEC 限速 10 次/秒，留一点余量
+REQUEST_INTERVAL = 0.11
+
+
+def submission_name(cik: int) -> str:
+    return f"CIK{cik:010d}.json"
+
+
+def load_existing_sic(path: str) -> Dict[int, str]:
+    """已有数据文件中的 CIK -> SIC"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    fields = raw.get("fields", [])
+    if "sic" not in fields:
+        return {}
+    rows = (dict(zip(fields, row)) for row in raw.get("data", []))
+    return {int(row["cik"]): str(row["sic"]) for row in rows if row.get("sic")}
+
+
+def sic_from_zip(path: str, ciks: Iterable[int]) -> Dict[int, str]:
+    """从 submissions.zip 中只读取需要的公司"""
+    sic: Dict[int, str] = {}
+    with zipfile.ZipFile(path) as archive:
+        members = set(archive.namelist())
+        for cik in ciks:
+            name = submission_name(cik)
+            if name not in members:
+                continue
+            with archive.open(name) as f:
+                value = json.load(f).get("sic")
+            if value:
+                sic[cik] = str(value)
+    return sic
+
+
+def sic_from_api(client: httpx.Client, ciks: List[int]) -> Dict[int, str]:
+    """逐个请求 submissions 接口（按 SEC 限速）"""
+    sic: Dict[int, str] = {}
+    for n, cik in enumerate(ciks, 1):
+        started = time.monotonic()
+        try:
+            response = client.get(SUBMISSIONS_URL.format(cik=cik))
+            if response.status_code == 200:
+                value = response.json().get("sic")
+                if value:
+                    sic[cik] = str(value)
+            elif response.status_code != 404:
+                print(f"CIK {cik}: HTTP {response.status_code}", file=sys.stderr)
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"CIK {cik}: {str(e)}", file=sys.stderr)
+        if n % 500 == 0:
+            print(f"{n}/{len(ciks)} submissions fetched", file=sys.stderr)
+        time.sleep(max(0.0, REQUEST_INTERVAL - (time.monotonic() - started)))
+    return sic
+
+
+def build_rows(tickers: Dict[str, Any], sic: Dict[int, str], sic_filter: Optional[Iterable[str]] = None) -> List[List[Any]]:
+    """合并 SEC ticker 数据与 SIC，输出注册表的行（没有 SIC 的公司 sic 为空字符串）"""
+    allowed = set(sic_filter) if sic_filter else None
+    fields = tickers["fields"]
+    rows = []
+    for values in tickers["data"]:
+        row = dict(zip(fields, values))
+        if not row.get("ticker"):
+            continue
+        code = sic.get(int(row["cik"]), "")
+        if allowed is not None and code not in allowed:
+            continue
+        rows.append([int(row["cik"]), row.get("name") or "", row["ticker"], row.get("exchange") or "", code])
+    return rows
+
+
+def write_registry(path: str, rows: List[List[Any]]):
+    """与现有数据文件相同的格式：每行一家公司，便于 diff"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write('{"fields": ' + json.dumps(FIELDS) + ', "data": [\n')
+        f.write(",\n".join(json.dumps(row, ensure_ascii=False) for row in rows))
+        f.write("\n]}\n")
+    os.replace(tmp_path, path)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="从 SEC 数据生成公司注册表（含 SIC）")
+    parser.add_argument("--user-agent", required=True, help="SEC 要求的 User-Agent，如 \"Veritas admin@example.com\"")
+    parser.add_argument("--output", default=DEFAULT_REGISTRY_PATH)
+    parser.add_argument("--submissions-zip", help="本地的 SEC submissions.zip，提供时不再逐个请求")
+    parser.add_argument("--sic", help="只保留这些 SIC（逗号分隔），默认保留全部公司")
+    parser.add_argument("--refresh", action="store_true", help="忽略已有数据文件中的 SIC，全部重新获取")
+    args = parser.parse_args(argv)
+
+    with httpx.Client(headers={"User-Agent": args.user_agent}, timeout=30.0) as client:
+        response = client.get(TICKERS_URL)
+        response.raise_for_status()
+        tickers = response.json()
+        ciks = sorted({int(dict(zip(tickers["fields"], row))["cik"]) for row in tickers["data"]})
+
+        sic = {} if args.refresh else load_existing_sic(args.output)
+        missing = [cik for cik in ciks if cik not in sic]
+        print(f"{len(ciks)} companies, {len(ciks) - len(missing)} with known SIC, fetching {len(missing)}", file=sys.stderr)
+        if args.submissions_zip:
+            sic.update(sic_from_zip(args.submissions_zip, missing))
+        else:
+            sic.update(sic_from_api(client, missing))
+
+    sic_filter = [code.strip() for code in args.sic.split(",") if code.strip()] if args.sic else None
+    rows = build_rows(tickers, sic, sic_filter)
+    write_registry(args.output, rows)
+    print(f"Wrote {len(rows)} companies to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
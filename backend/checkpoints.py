@@ -0,0 +1,149 @@
+"""
+分析任务检查点 - 每个 protocol 模块完成后立即持久化，任务元数据记录尚未完成的模块
+
+使用 SQLite（WAL 模式）保存，进程崩溃或重启后，未完成的任务只需补跑缺失的模块，
+不必重新支付已完成模块的 LLM 调用费用。部署在临时文件系统上时，可通过 CHECKPOINT_DB
+指向持久化卷。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List, Iterable
+
+import metrics
+
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.path.join(os.path.dirname(__file__), "data", "checkpoints.db"))
+
+# 超过该时长（秒）的中断任务不再恢复（用户早已离开，数据也可能过期）
+RESUME_MAX_AGE = float(os.getenv("CHECKPOINT_RESUME_MAX_AGE", "3600"))
+# 已结束任务的检查点保留时长（秒）
+RETENTION_SECONDS = float(os.getenv("CHECKPOINT_RETENTION_SECONDS", "86400"))
+
+metrics.describe("checkpoint_sections_saved_total", "Protocol section results checkpointed")
+metrics.describe("checkpoint_jobs_resumed_total", "Interrupted analysis jobs resumed from checkpoints")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    ticker TEXT NOT NULL,
+    filing_type TEXT,
+    priority TEXT NOT NULL,
+    status TEXT NOT NULL,
+    sections TEXT NOT NULL,
+    remaining TEXT NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS section_results (
+    job_id TEXT NOT NULL,
+    section TEXT NOT NULL,
+    result TEXT NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (job_id, section)
+);
+"""
+
+
+class CheckpointStore:
+    def __init__(self, path: str = CHECKPOINT_DB):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL + NORMAL：每次提交不强制 fsync，进程崩溃不丢数据，写入只需亚毫秒
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def create_job(
+        self,
+        job_id: str,
+        ticker: str,
+        sections: Iterable[str],
+        priority: str = "interactive",
+        filing_type: Optional[str] = None,
+        created_at: Optional[str] = None
+    ):
+        sections = list(sections)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, 'processing', ?, ?, NULL, ?, ?)",
+                (job_id, ticker, filing_type, priority, json.dumps(sections), json.dumps(sections),
+                 created_at or time.strftime("%Y-%m-%dT%H:%M:%S"), time.time())
+            )
+
+    def save_section(self, job_id: str, section: str, result: Dict[str, Any]):
+        """保存一个模块的结果，并在同一事务中更新任务的剩余模块"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT remaining FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            remaining = [s for s in json.loads(row["remaining"]) if s != section]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO section_results VALUES (?, ?, ?, ?)",
+                (job_id, section, json.dumps(result, ensure_ascii=False), time.time())
+            )
+            self._conn.execute(
+                "UPDATE jobs SET remaining = ?, updated_at = ? WHERE job_id = ?",
+                (json.dumps(remaining), time.time(), job_id)
+            )
+        metrics.inc("checkpoint_sections_saved_total", section=section)
+
+    def finish_job(self, job_id: str, status: str, error: Optional[str] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, time.time(), job_id)
+            )
+
+    def completed_sections(self, job_id: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT section, result FROM section_results WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {row["section"]: json.loads(row["result"]) for row in rows}
+
+    def interrupted_jobs(self, max_age: float = RESUME_MAX_AGE) -> List[Dict[str, Any]]:
+        """
+        上次进程退出时仍在进行的任务（附已完成的模块）。超过 max_age 未更新的任务标记为失败，不再恢复。
+        """
+        cutoff = time.time() - max_age
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted and not resumed' "
+                "WHERE status = 'processing' AND updated_at < ?",
+                (cutoff,)
+            )
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = 'processing' ORDER BY created_at"
+            ).fetchall()
+
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["sections"] = json.loads(job["sections"])
+            job["remaining"] = json.loads(job["remaining"])
+            job["completed"] = self.completed_sections(job["job_id"])
+            jobs.append(job)
+        return jobs
+
+    def purge(self, older_than: float = RETENTION_SECONDS):
+        """删除早已结束的任务及其模块结果"""
+        cutoff = time.time() - older_than
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM section_results WHERE job_id IN "
+                "(SELECT job_id FROM jobs WHERE status != 'processing' AND updated_at < ?)",
+                (cutoff,)
+            )
+            self._conn.execute("DELETE FROM jobs WHERE status != 'processing' AND updated_at < ?", (cutoff,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
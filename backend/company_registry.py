@@ -0,0 +1,218 @@
+"""
+公司注册表 - 从打包的 SEC ticker/CIK/SIC 数据集懒加载，提供前缀、模糊和中文名检索
+
+数据文件由 build_company_registry.py 从 SEC 数据生成：列名和行与 SEC company_tickers_exchange.json 相同，
+另加各公司 submissions 中的 sic 列（SEC 的 ticker 文件本身不含 SIC）：
+{
+  "fields": ["cik", "name", "ticker", "exchange", "sic"],
+  "data": [[1801198, "Legend Biotech Corp", "LEGN", "Nasdaq", "2834"], ...]
+}
+
+建立索引（万级公司约 200 ms）在服务启动后于线程中预热；预热完成前的请求由接口在线程中等待加载，不阻塞事件循环。
+
+索引全部是排好序的 Python 列表 + bisect，以及 ticker 的单字符删除变体表（SymSpell 思路），
+单次查询只做对数级查找和少量候选比较，不遍历全部公司。前缀索引另按 SIC 分组各建一份，
+按 SIC 过滤时在分组索引内查找，候选数上限不会被其他行业的公司占满。
+"""
+import json
+import os
+import threading
+import unicodedata
+from bisect import bisect_left
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "company_registry.json")
+
+# 生物医药相关 SIC：2834 医药制剂，2836 生物制品
+BIOTECH_SIC_CODES = ("2834", "2836")
+
+# 每种匹配方式最多收集的候选数，保证查询耗时与注册表规模无关
+_CANDIDATE_CAP = 64
+
+# 匹配类型排序权重（越小越靠前）
+_MATCH_RANK = {"exact": 0, "ticker_prefix": 1, "name_prefix": 2, "name_cn": 3, "fuzzy": 4}
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").strip().lower()
+
+
+def _deletes(word: str) -> Iterable[str]:
+    """单字符删除变体，用于编辑距离 1 的模糊匹配"""
+    for i in range(len(word)):
+        yield word[:i] + word[i + 1:]
+
+
+def _prefix_range(keys: List[str], prefix: str) -> range:
+    start = bisect_left(keys, prefix)
+    end = bisect_left(keys, prefix + "\uffff", lo=start)
+    return range(start, min(end, start + _CANDIDATE_CAP))
+
+
+class _PrefixIndex:
+    """排好序的 (key, 条目下标) 列表，支持前缀查找"""
+
+    def __init__(self, pairs: List[Tuple[str, int]]):
+        pairs.sort()
+        self.keys = [k for k, _ in pairs]
+        self.ids = [i for _, i in pairs]
+
+    def lookup(self, prefix: str) -> Iterator[int]:
+        return (self.ids[j] for j in _prefix_range(self.keys, prefix))
+
+
+class CompanyRegistry:
+    """懒加载的公司注册表，首次访问时才读取数据文件并建立索引"""
+
+    def __init__(self, path: Optional[str] = None, tracked: Optional[Dict[str, Dict[str, Any]]] = None):
+        self._path = path or os.getenv("COMPANY_REGISTRY_PATH", DEFAULT_REGISTRY_PATH)
+        self._tracked = tracked or {}
+        self._entries: Optional[List[Dict[str, Any]]] = None
+        self._by_ticker: Dict[str, int] = {}
+        # SIC（None 表示全部公司）-> {"ticker" / "name" / "cn": 前缀索引}
+        self._indexes: Dict[Optional[str], Dict[str, _PrefixIndex]] = {}
+        self._ticker_deletes: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    @property
+    def loaded(self) -> bool:
+        return self._entries is not None
+
+    def load(self):
+        """读取数据文件并建立索引（阻塞，应在线程中调用）；已加载时直接返回"""
+        self._load()
+
+    def _read_rows(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Company registry load failed ({self._path}): {str(e)}")
+            return []
+        fields = raw.get("fields", [])
+        return [dict(zip(fields, row)) for row in raw.get("data", [])]
+
+    def _load(self) -> List[Dict[str, Any]]:
+        if self._entries is not None:
+            return self._entries
+        # 启动预热线程与请求线程可能同时触发加载，只建一次索引
+        with self._lock:
+            if self._entries is None:
+                self._build()
+            return self._entries
+
+    def _build(self):
+        entries: List[Dict[str, Any]] = []
+        for row in self._read_rows():
+            ticker = str(row.get("ticker") or "").upper()
+            if not ticker or ticker in self._by_ticker:
+                continue
+            self._by_ticker[ticker] = len(entries)
+            entries.append({
+                "ticker": ticker,
+                "company_name": row.get("name", ""),
+                "company_name_cn": "",
+                "cik": str(row.get("cik", "")).zfill(10),
+                "sic": str(row.get("sic") or ""),
+                "exchange": row.get("exchange", ""),
+                "tracked": False,
+            })
+
+        # 重点跟踪的公司覆盖/补充数据集中的条目（带中文名、研究方向等）
+        for ticker, profile in self._tracked.items():
+            entry = {**profile, "ticker": ticker, "tracked": True}
+            if ticker in self._by_ticker:
+                entries[self._by_ticker[ticker]].update(entry)
+            else:
+                self._by_ticker[ticker] = len(entries)
+                entries.append({"exchange": "", **entry})
+
+        pairs: Dict[Optional[str], Dict[str, List[Tuple[str, int]]]] = {}
+        for i, entry in enumerate(entries):
+            groups = [pairs.setdefault(None, {"ticker": [], "name": [], "cn": []})]
+            if entry.get("sic"):
+                groups.append(pairs.setdefault(entry["sic"], {"ticker": [], "name": [], "cn": []}))
+
+            ticker = entry["ticker"].lower()
+            for variant in set(_deletes(ticker)):
+                self._ticker_deletes.setdefault(variant, []).append(i)
+            keys = {"ticker": [ticker], "name": [], "cn": []}
+
+            name = _normalize(entry.get("company_name", ""))
+            if name:
+                keys["name"].append(name)
+                keys["name"].extend(name.replace(",", " ").split()[1:])
+
+            # 中文名按所有后缀建索引，前缀查找即可实现子串匹配
+            cn = _normalize(entry.get("company_name_cn", ""))
+            keys["cn"].extend(cn[start:] for start in range(len(cn)))
+
+            for group in groups:
+                for kind, values in keys.items():
+                    group[kind].extend((value, i) for value in values)
+
+        self._indexes = {
+            sic: {kind: _PrefixIndex(kind_pairs) for kind, kind_pairs in group.items()}
+            for sic, group in pairs.items()
+        }
+
+        self._entries = entries
+
+    def get(self, ticker: str) -> Optional[Dict[str, Any]]:
+        entries = self._load()
+        i = self._by_ticker.get(ticker.upper())
+        return entries[i] if i is not None else None
+
+    def search(self, query: str, limit: int = 10, sic_codes: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """按 ticker 前缀、公司名前缀、中文名子串、ticker 模糊（编辑距离 1）检索"""
+        entries = self._load()
+        q = _normalize(query)
+        if not q:
+            return []
+        allowed = set(sic_codes) if sic_codes else None
+        # 按 SIC 过滤时只查对应分组的索引，过滤发生在候选数上限之前
+        indexes = [self._indexes[sic] for sic in sorted(allowed) if sic in self._indexes] if allowed else [self._indexes.get(None, {})]
+
+        def permitted(i: int) -> bool:
+            return allowed is None or entries[i].get("sic") in allowed
+
+        matches: Dict[int, str] = {}
+
+        def collect(ids: Iterable[int], match_type: str):
+            for i in ids:
+                if i not in matches and permitted(i):
+                    matches[i] = match_type
+
+        def lookup(kind: str):
+            for index in indexes:
+                if kind in index:
+                    yield from index[kind].lookup(q)
+
+        if q.isascii():
+            exact = self._by_ticker.get(q.upper())
+            if exact is not None:
+                collect([exact], "exact")
+            collect(lookup("ticker"), "ticker_prefix")
+            collect(lookup("name"), "name_prefix")
+            if len(q) >= 2:
+                # 查询串本身、及其删除变体，与 ticker 的删除变体求交，覆盖替换/插入/删除各一次
+                fuzzy: List[int] = []
+                exact_hit = self._by_ticker.get
+                for variant in {q, *_deletes(q)}:
+                    hit = exact_hit(variant.upper())
+                    if hit is not None:
+                        fuzzy.append(hit)
+                    fuzzy.extend(self._ticker_deletes.get(variant, ()))
+                collect([i for i in fuzzy if permitted(i)][:_CANDIDATE_CAP], "fuzzy")
+        else:
+            collect(lookup("cn"), "name_cn")
+            collect(lookup("name"), "name_prefix")
+
+        ranked = sorted(
+            matches,
+            key=lambda i: (_MATCH_RANK[matches[i]], not entries[i].get("tracked"), len(entries[i]["ticker"]), entries[i]["ticker"]),
+        )
+        return [{**entries[i], "match": matches[i]} for i in ranked[:limit]]
@@ -0,0 +1,198 @@
+"""
+运行时诊断 - 事件循环延迟监控与按需采样剖析
+
+- LoopLagMonitor：事件循环中定时打点测量调度延迟并导出为指标；另起看门狗线程，
+  当循环超过阈值未打点（某个回调阻塞了循环）时记录事件循环线程当前的调用栈。
+- SamplingProfiler：定时采样事件循环线程的调用栈，生成 collapsed stack 格式
+  （flamegraph.pl / speedscope 可直接打开），用于剖析单次分析的耗时分布。
+  事件循环同时在执行其他请求的协程，因此只保留采样时正在运行的任务属于被剖析任务的样本：
+  剖析开始后由该任务（及其子任务）创建的任务通过任务工厂登记，空闲（等待 selector）和其他任务的样本只计数。
+"""
+import asyncio
+import os
+import secrets
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
+import metrics
+
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+LOOP_LAG_INTERVAL = 0.05
+
+# 允许请求剖析的令牌（未设置时关闭剖析功能）
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_INTERVAL = 0.005
+_MAX_STORED_PROFILES = 20
+
+metrics.describe("event_loop_lag_seconds", "Event loop scheduling delay")
+metrics.describe("event_loop_blocked_total", "Times the event loop was blocked longer than the threshold")
+
+
+def _collapse(frame) -> str:
+    """把调用栈转成 collapsed stack 格式：外层在前，分号分隔"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float = LOOP_LAG_THRESHOLD_MS, interval: float = LOOP_LAG_INTERVAL):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        threading.Thread(target=self._watchdog, name="loop-lag-watchdog", daemon=True).start()
+
+    def stop(self):
+        """停止打点和看门狗（事件循环结束后不再打点，看门狗不能把它当成阻塞）"""
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, lag)
+            metrics.set_gauge("event_loop_lag_seconds", lag)
+
+    def _watchdog(self):
+        reported = False
+        while not self._stop.wait(self.threshold / 2):
+            blocked_for = time.monotonic() - self._heartbeat
+            if blocked_for < self.threshold + self.interval:
+                reported = False
+                continue
+            if reported:
+                continue
+            # 每次阻塞只记录一次调用栈
+            reported = True
+            metrics.inc("event_loop_blocked_total")
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>"
+            print(f"Event loop blocked for {blocked_for * 1000:.0f} ms, current stack:\n{stack}")
+
+
+# 当前任务所属的剖析（子任务继承创建时的上下文）
+_active_profiler: ContextVar[Optional["SamplingProfiler"]] = ContextVar("active_profiler", default=None)
+
+
+def _install_task_factory(loop: asyncio.AbstractEventLoop):
+    """包装事件循环的任务工厂：在被剖析任务的上下文中创建的任务登记到对应的剖析"""
+    previous = loop.get_task_factory()
+    if getattr(previous, "_profiling", False):
+        return
+
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        profiler = _active_profiler.get()
+        if profiler is not None:
+            profiler.tasks.add(task)
+        return task
+
+    factory._profiling = True
+    loop.set_task_factory(factory)
+
+
+class SamplingProfiler:
+    """
+    在后台线程中定时采样事件循环线程的调用栈，只保留当前任务（调用 start 的任务）及其子任务运行时的样本。
+    必须在事件循环中调用 start / stop（同一个任务内）。
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        # 循环线程在执行其他任务或空闲时的样本数
+        self.other_samples = 0
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._target_thread_id = threading.get_ident()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._token = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._target_thread_id = threading.get_ident()
+        _install_task_factory(self._loop)
+        current = asyncio.current_task()
+        if current is not None:
+            self.tasks.add(current)
+        self._token = _active_profiler.set(self)
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._token is not None:
+            _active_profiler.reset(self._token)
+            self._token = None
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            # 采样时循环正在执行的任务（空闲或执行普通回调时为 None）
+            if asyncio.current_task(self._loop) in self.tasks:
+                self.samples[_collapse(frame)] += 1
+            else:
+                self.other_samples += 1
+
+    def collapsed(self) -> str:
+        header = (
+            f"# duration_ms={self.duration * 1000:.1f} samples={sum(self.samples.values())} "
+            f"other_samples={self.other_samples} interval_ms={self.interval * 1000:.1f}\n"
+        )
+        return header + "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# 已完成的剖析结果（profile_id -> collapsed stack 文本），只保留最近若干份
+profiles: "OrderedDict[str, str]" = OrderedDict()
+
+
+def profiling_authorized(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN and token and secrets.compare_digest(token, PROFILE_TOKEN))
+
+
+def profiling_requested(query_flag: Optional[str], header_flag: Optional[str], token: Optional[str]) -> bool:
+    """请求带 profile=1 或 X-Profile: 1，且 X-Profile-Token 与 PROFILE_TOKEN 一致"""
+    requested = query_flag in ("1", "true") or header_flag in ("1", "true")
+    return requested and profiling_authorized(token)
+
+
+def new_profile_id() -> str:
+    return secrets.token_hex(8)
+
+
+def store_profile(profile_id: str, profiler: SamplingProfiler):
+    profiles[profile_id] = profiler.collapsed()
+    while len(profiles) > _MAX_STORED_PROFILES:
+        profiles.popitem(last=False)
@@ -0,0 +1,119 @@
+"""
+降级模式的后备结果 - 提供方故障、超时或返回无法解析的内容时，按 (ticker, protocol 模块) 直接返回该公司
+最近一次成功的分析结果（启动时从历史归档的最新快照加载，运行中每次成功分析后更新，之后按字典查找，O(1)）。
+
+返回的模块结果带 degraded: true、来源和数据时间（stale_as_of），前端可明确提示数据已过期；
+没有成功分析过的公司只返回降级标记，不会借用其他公司的数据，也没有打包的示例数据。
+
+CircuitBreaker：提供方连续失败达到阈值后断开一段时间，期间调用直接返回后备结果，不再等待超时；
+冷却后放行一次试探调用，成功则恢复。
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Iterable
+
+import metrics
+
+# 连续失败多少次后断开，断开多少秒后放行一次试探调用
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+metrics.describe("degraded_sections_total", "Protocol sections served from the fallback store, by source")
+metrics.describe("circuit_open", "1 while the provider circuit breaker is open")
+metrics.describe("circuit_rejected_total", "Provider calls skipped because the circuit breaker was open")
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def _marked(section: Dict[str, Any], source: Optional[str], stale_as_of: Optional[str]) -> Dict[str, Any]:
+    return {**section, "degraded": True, "degraded_source": source, "stale_as_of": stale_as_of}
+
+
+def is_degraded(section: Any) -> bool:
+    return isinstance(section, dict) and section.get("degraded") is True
+
+
+class FallbackStore:
+    def __init__(self):
+        # (ticker, 模块) -> 已带降级标记的结果
+        self._entries: Dict[tuple, Dict[str, Any]] = {}
+
+    def load_snapshots(self, snapshots: Iterable[Dict[str, Any]]):
+        """加载历史归档中各公司的最新快照"""
+        for snapshot in snapshots:
+            analysis = snapshot["result"].get("analysis") or {}
+            self._update(snapshot["ticker"], analysis, snapshot["created_at"])
+
+    def update(self, result: Dict[str, Any], completed_at: Optional[float] = None):
+        """记录一次成功的分析（降级的模块不会成为后备）"""
+        stale_as_of = _isoformat(completed_at or time.time())
+        self._update(result["ticker"], result.get("analysis") or {}, stale_as_of)
+
+    def _update(self, ticker: str, analysis: Dict[str, Any], stale_as_of: str):
+        for section, value in analysis.items():
+            if isinstance(value, dict) and not is_degraded(value):
+                self._entries[(ticker.upper(), section)] = _marked(value, "last_good", stale_as_of)
+
+    def get(self, ticker: Optional[str], section: str) -> Dict[str, Any]:
+        entry = self._entries.get(((ticker or "").upper(), section))
+        if entry is None:
+            metrics.inc("degraded_sections_total", source="none")
+            return _marked({}, None, None)
+        metrics.inc("degraded_sections_total", source=entry["degraded_source"])
+        # 浅拷贝，避免调用方修改共享的后备结果
+        return dict(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        sources: Dict[str, int] = {}
+        for entry in self._entries.values():
+            sources[entry["degraded_source"]] = sources.get(entry["degraded_source"], 0) + 1
+        return {
+            "tickers": len({ticker for ticker, _ in self._entries}),
+            "sections": len(self._entries),
+            "by_source": sources,
+        }
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """是否发起调用：断开期间拒绝，每过 open_seconds 放行一次试探"""
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.open_seconds:
+            # 试探调用的结果未返回前（或被取消时）其他调用继续等待下一个冷却周期
+            self.opened_at = now
+            return True
+        metrics.inc("circuit_rejected_total", circuit=self.name)
+        return False
+
+    def record(self, ok: bool):
+        if ok:
+            if self.opened_at is not None:
+                print(f"Circuit {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+        else:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"Circuit {self.name} open after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+        metrics.set_gauge("circuit_open", 1.0 if self.is_open else 0.0, circuit=self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"open": self.is_open, "consecutive_failures": self.failures}
@@ -1,17 +1,41 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal, Set
 import os
 from dotenv import load_dotenv
 import httpx
 import uuid
 from datetime import datetime
 import json
+import re
+import time
+import asyncio
 
-# 加载环境变量
+# 加载环境变量（必须在导入本地模块之前：这些模块在导入时读取配置）
 load_dotenv()
 
+import metrics
+from admission import AdmissionController
+from archive import AnalysisArchive, parse_as_of
+from checkpoints import CheckpointStore
+from company_registry import CompanyRegistry, BIOTECH_SIC_CODES
+from diagnostics import (
+    LoopLagMonitor, SamplingProfiler, new_profile_id, profiles, profiling_authorized, profiling_requested, store_profile
+)
+from fallbacks import CircuitBreaker, FallbackStore, is_degraded
+from message_batches import MessageBatchClient, MessageBatchError
+from prefetch import SpeculativePrefetcher
+from responses import json_response, parse_fields, project_fields
+from routing import Router
+from scheduler import PriorityLimiter
+from shutdown import ShutdownCoordinator
+from screening import ScreeningIndex, parse_condition
+from token_usage import TokenBudgetExceeded, token_ledger
+from tracked_companies import BIOTECH_COMPANIES
+from tracing import SPAN_KIND_CLIENT, SPAN_KIND_SERVER, UNRECORDED_ROUTES, current_span, get_trace, set_attributes, start_span
+
 # 初始化 FastAPI
 app = FastAPI(
     title="Veritas API",
@@ -26,104 +50,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 前端跨域读取退避、条件请求和链路追踪用到的响应头
+    expose_headers=["Retry-After", "ETag", "X-Trace-Id"],
 )
 
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """每个请求一个 server span（延续请求头中的 W3C traceparent），响应头 X-Trace-Id 返回 trace ID"""
+    with start_span(
+        request.method,
+        kind=SPAN_KIND_SERVER,
+        traceparent=request.headers.get("traceparent"),
+        **{"http.request.method": request.method, "url.path": request.url.path}
+    ) as span:
+        response = await call_next(request)
+        # span 名使用路由模板（如 /api/analyze/{job_id}），避免每个 ID 一个名字
+        route = request.scope.get("route")
+        if route is not None:
+            span.name = f"{request.method} {route.path}"
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+        elif request.method == "GET" and route is not None and route.path in UNRECORDED_ROUTES:
+            # 状态轮询、健康检查不保存 span
+            span.recorded = False
+        response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
 # 数据模型
 class AnalyzeRequest(BaseModel):
     ticker: str
     filing_type: str = "10-K"
+    priority: Literal["interactive", "batch", "background"] = "interactive"
 
-# 生物医药公司数据库
-BIOTECH_COMPANIES = {
-    "LEGN": {
-        "ticker": "LEGN",
-        "company_name": "Legend Biotech Corporation",
-        "company_name_cn": "传奇生物",
-        "cik": "0001801198",
-        "sic": "2834",
-        "sector": "Biotechnology",
-        "focus": "CAR-T细胞疗法",
-        "key_products": ["Carvykti (cilta-cel)"],
-        "therapeutic_areas": ["多发性骨髓瘤", "血液肿瘤"]
-    },
-    "SMMT": {
-        "ticker": "SMMT",
-        "company_name": "Summit Therapeutics Inc.",
-        "company_name_cn": "Summit Therapeutics",
-        "cik": "0001499620",
-        "sic": "2834",
-        "sector": "Biotechnology",
-        "focus": "PD-1/VEGF双抗",
-        "key_products": ["Ivonescimab (依沃西单抗)"],
-        "therapeutic_areas": ["非小细胞肺癌", "实体瘤"]
-    },
-    "LLY": {
-        "ticker": "LLY",
-        "company_name": "Eli Lilly and Company",
-        "company_name_cn": "礼来",
-        "cik": "0000059478",
-        "sic": "2834",
-        "sector": "Pharmaceuticals",
-        "focus": "GLP-1/糖尿病/肥胖症",
-        "key_products": ["Mounjaro", "Zepbound", "Verzenio"],
-        "therapeutic_areas": ["糖尿病", "肥胖症", "肿瘤"]
-    },
-    "MRNA": {
-        "ticker": "MRNA",
-        "company_name": "Moderna, Inc.",
-        "company_name_cn": "Moderna",
-        "cik": "0001682852",
-        "sic": "2836",
-        "sector": "Biotechnology",
-        "focus": "mRNA技术平台",
-        "key_products": ["Spikevax (COVID疫苗)"],
-        "therapeutic_areas": ["传染病", "肿瘤", "罕见病"]
-    },
-    "REGN": {
-        "ticker": "REGN",
-        "company_name": "Regeneron Pharmaceuticals, Inc.",
-        "company_name_cn": "再生元",
-        "cik": "0000872589",
-        "sic": "2834",
-        "sector": "Biotechnology",
-        "focus": "单克隆抗体",
-        "key_products": ["Eylea", "Dupixent", "Libtayo"],
-        "therapeutic_areas": ["眼科", "免疫", "肿瘤"]
-    },
-    "VRTX": {
-        "ticker": "VRTX",
-        "company_name": "Vertex Pharmaceuticals Incorporated",
-        "company_name_cn": "福泰制药",
-        "cik": "0000875320",
-        "sic": "2834",
-        "sector": "Biotechnology",
-        "focus": "基因疗法/囊性纤维化",
-        "key_products": ["Trikafta", "Casgevy"],
-        "therapeutic_areas": ["囊性纤维化", "镰刀型细胞贫血症", "疼痛"]
-    },
-    "BMRN": {
-        "ticker": "BMRN",
-        "company_name": "BioMarin Pharmaceutical Inc.",
-        "company_name_cn": "BioMarin",
-        "cik": "0001048477",
-        "sic": "2834",
-        "sector": "Biotechnology",
-        "focus": "罕见病",
-        "key_products": ["Voxzogo", "Roctavian"],
-        "therapeutic_areas": ["软骨发育不全", "血友病A", "罕见病"]
-    },
-    "ALNY": {
-        "ticker": "ALNY",
-        "company_name": "Alnylam Pharmaceuticals, Inc.",
-        "company_name_cn": "Alnylam",
-        "cik": "0001178670",
-        "sic": "2834",
-        "sector": "Biotechnology",
-        "focus": "RNAi疗法",
-        "key_products": ["Onpattro", "Amvuttra", "Givlaari"],
-        "therapeutic_areas": ["罕见病", "心血管", "肝病"]
-    }
-}
+# 公司注册表（SEC ticker/CIK/SIC 数据集 + 重点跟踪公司），首次查询时才加载
+company_registry = CompanyRegistry(tracked=BIOTECH_COMPANIES)
+
+class BulkRefreshRequest(BaseModel):
+    tickers: Optional[List[str]] = None
 
 class AnalyzeResponse(BaseModel):
     job_id: str
@@ -137,10 +102,123 @@ class AnalysisResult(BaseModel):
     ticker: str
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    trace_id: Optional[str] = None
 
 # 临时存储
 analysis_jobs = {}
 
+# 正在执行的分析任务（job_id -> asyncio.Task），用于取消
+job_tasks: Dict[str, asyncio.Task] = {}
+
+# 不需要等待结果的后台任务：事件循环只持有任务的弱引用，这里保留引用直到完成，避免执行中被垃圾回收
+background_tasks: Set[asyncio.Task] = set()
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# 正在订阅事件流的客户端数量，全部断开时自动取消任务
+job_watchers: Dict[str, int] = {}
+
+# 提供方并发槽位，interactive / batch / background 三类请求加权公平共享
+provider_limiter = PriorityLimiter()
+
+# 按 protocol 的模型路由（根据各路由的延迟/错误率 EWMA 选择满足质量等级的最快模型）
+router = Router()
+
+def choose_route(protocol_name: str) -> tuple:
+    """返回 (路由名, 模型名)；本服务只直连 Anthropic，没有可用路由时使用 ANTHROPIC_MODEL"""
+    route = router.choose(protocol_name, providers=("anthropic",))
+    if route is None:
+        return None, os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
+    return route, router.routes[route]["model"]
+
+# 准入控制：过载时拒绝新任务（附 Retry-After），有新鲜缓存时直接返回缓存
+admission = AdmissionController(provider_limiter)
+
+# 每家公司最近一次成功的分析结果（ticker -> {"result", "completed_at"}）
+latest_results: Dict[str, Dict[str, Any]] = {}
+
+# 缓存结果在该时长（秒）内视为新鲜
+RESULT_FRESH_SECONDS = float(os.getenv("RESULT_FRESH_SECONDS", "21600"))
+
+async def store_completed_result(result: Dict[str, Any]):
+    """
+    保存一次成功的分析结果（缓存 + 筛选索引 + 历史归档 + 降级后备）；含降级模块的结果不保存。
+    归档涉及 SQLite 写入和序列化压缩，放到线程中执行，不阻塞事件循环
+    """
+    if result.get("degraded"):
+        return
+    completed_at = time.time()
+    latest_results[result["ticker"]] = {"result": result, "completed_at": completed_at}
+    screening_index.upsert(result["ticker"], result)
+    await asyncio.to_thread(archive.record, result, completed_at)
+    fallbacks.update(result, completed_at=completed_at)
+
+def get_fresh_result(ticker: str) -> Optional[Dict[str, Any]]:
+    cached = latest_results.get(ticker.upper())
+    if cached and time.time() - cached["completed_at"] <= RESULT_FRESH_SECONDS:
+        return cached
+    return None
+
+# 共享的上游 HTTP 客户端：连接池复用 TLS 连接，投机预取时可以提前建立连接
+_http_client: Optional[httpx.AsyncClient] = None
+
+def http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60.0))
+    return _http_client
+
+# 投机预取：查看公司时提前预热连接、获取 SEC 数据，重点跟踪公司直接开始分析
+prefetcher = SpeculativePrefetcher()
+WARM_UP_INTERVAL = 20.0
+_last_warm_up = 0.0
+
+# 批量刷新任务（bulk_id -> 状态），批量提交走 Message Batches API
+bulk_jobs: Dict[str, Dict[str, Any]] = {}
+bulk_tasks: Dict[str, asyncio.Task] = {}
+BULK_POLL_SECONDS = float(os.getenv("BULK_POLL_SECONDS", "30"))
+BULK_MAX_WAIT_SECONDS = float(os.getenv("BULK_MAX_WAIT_SECONDS", "86400"))
+BULK_PREPARE_CONCURRENCY = 8
+
+# 各模块结果的检查点，重启后中断的任务只补跑缺失的模块
+checkpoints = CheckpointStore()
+
+# 历史分析快照归档（按公司/财报，模块去重 + delta 存储）
+archive = AnalysisArchive()
+
+# 降级模式的后备结果（按 ticker + 模块索引，启动时从历史归档加载）
+fallbacks = FallbackStore()
+
+# Anthropic 连续失败时断开，断开期间直接返回后备结果，不再逐个等待超时
+provider_circuit = CircuitBreaker("anthropic")
+
+# 停机时等待进行中任务完成的最长时间（秒，从收到 SIGTERM 起算，与 uvicorn 的 --timeout-graceful-shutdown 同时计时）；
+# 收到信号后（draining）不再接收新任务
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "25"))
+shutdown = ShutdownCoordinator()
+
+# 单个分析任务的截止时间（秒），传递给每一次 protocol 调用和 SEC 查询
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "120"))
+
+class DeadlineExceeded(Exception):
+    pass
+
+def time_left(deadline: Optional[float], cap: float) -> float:
+    """距截止时间的剩余秒数（不超过 cap），已超时则抛出 DeadlineExceeded"""
+    if deadline is None:
+        return cap
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Analysis deadline exceeded")
+    return min(cap, remaining)
+
+# 跨公司筛选索引（每家公司最近一次完成的分析）
+screening_index = ScreeningIndex()
+
 # AI Prompts - 专注生物医药/创新药领域分析
 PROTOCOL_A = """
 Role: 生物医药行业资深分析师
@@ -291,23 +369,234 @@ Return ONLY a JSON object in this exact format:
 }
 """
 
+# 各分析模块：结果字段名 -> (Protocol, 任务说明)
+ANALYSIS_SECTIONS = {
+    "reality": (PROTOCOL_A, "分析这家生物医药公司的业务实质。"),
+    "survival": (PROTOCOL_B, "分析财务生存能力，提取最新财务指标。"),
+    "competition": (PROTOCOL_C, "分析竞争格局，重点关注同靶点/同适应症竞品。"),
+    "history": (PROTOCOL_D, "提取最近6-8个季度的营收数据。"),
+    "pipeline": (PROTOCOL_E, "分析公司的研发管线（Pipeline），包括各产品的临床阶段和预计里程碑。"),
+}
+
+# 事件循环延迟监控（阻塞超过 LOOP_LAG_THRESHOLD_MS 时打印调用栈）
+lag_monitor = LoopLagMonitor()
+
+@app.on_event("startup")
+async def on_startup():
+    shutdown.install_signal_handlers()
+    lag_monitor.start()
+    # 公司注册表索引在线程中预热，第一次自动补全请求不必等待建索引
+    spawn(asyncio.to_thread(company_registry.load))
+    await restore_from_archive()
+    checkpoints.purge()
+    resume_interrupted_jobs()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """
+    等待进行中的任务完成（uvicorn 等待连接期间任务已在继续执行，这里只等待 SHUTDOWN_DRAIN_SECONDS 中剩余的时间）；
+    超时仍未完成的任务保留检查点，重启后恢复
+    """
+    shutdown.begin()
+    lag_monitor.stop()
+    pending = [task for task in job_tasks.values() if not task.done()]
+    if pending:
+        timeout = shutdown.remaining(SHUTDOWN_DRAIN_SECONDS)
+        print(f"Draining {len(pending)} analysis jobs (up to {timeout:.1f}s)")
+        _, still_running = await asyncio.wait(pending, timeout=timeout) if timeout > 0 else (set(), set(pending))
+        for task in still_running:
+            task.cancel()
+        if still_running:
+            print(f"{len(still_running)} analysis jobs interrupted, will resume from checkpoints on restart")
+            await asyncio.wait(still_running, timeout=5.0)
+
+    if _http_client is not None:
+        await _http_client.aclose()
+    checkpoints.close()
+    archive.close()
+
+async def restore_from_archive():
+    """用历史归档中各公司的最新快照恢复筛选索引和降级后备结果（否则重启后筛选结果为空）"""
+    snapshots = await asyncio.to_thread(archive.latest_snapshots)
+    for snapshot in snapshots:
+        screening_index.upsert(snapshot["ticker"], snapshot["result"], updated_at=snapshot["created_at"])
+    fallbacks.load_snapshots(snapshots)
+
+def resume_interrupted_jobs():
+    """恢复上次进程退出时中断的任务（沿用原 job_id），只补跑没有检查点的模块"""
+    for saved in checkpoints.interrupted_jobs():
+        job_id = saved["job_id"]
+        analysis_jobs[job_id] = {
+            "status": "processing",
+            "ticker": saved["ticker"],
+            "created_at": saved["created_at"],
+            "priority": saved["priority"],
+            "prefetched": False,
+            "resumed": True,
+            "result": None,
+            "error": None,
+            "trace_id": None
+        }
+        job_tasks[job_id] = asyncio.create_task(
+            run_analysis_job(job_id, saved["ticker"], saved["priority"], completed=saved["completed"])
+        )
+        metrics.inc("checkpoint_jobs_resumed_total")
+        print(f"Resuming analysis {job_id} ({saved['ticker']}): {len(saved['completed'])} sections checkpointed, {len(saved['remaining'])} remaining")
+
 @app.get("/")
 async def root():
     """健康检查"""
     return {
         "status": "healthy",
         "service": "Veritas API",
-        "version": "0.1.0"
+        "version": "0.1.0",
+        # 前端据此决定是否调用预取和取消接口（main.py 没有这两个接口）
+        "features": ["prefetch", "cancel"]
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def export_metrics():
+    """Prometheus 格式指标"""
+    return metrics.render()
+
+@app.get("/api/scheduler")
+async def get_scheduler_stats():
+    """提供方并发槽位使用情况与各优先级排队耗时"""
+    return {**provider_limiter.stats(), "admission": admission.stats(), "prefetch": prefetcher.stats()}
+
+@app.get("/api/routing")
+async def get_routing_stats():
+    """各路由的延迟/错误率 EWMA、各 protocol 当前的候选顺序，以及降级后备结果的覆盖情况"""
+    return {**router.stats(), "fallbacks": fallbacks.stats(), "circuit": provider_circuit.stats()}
+
+@app.get("/api/traces/{trace_id}")
+async def get_trace_spans(trace_id: str):
+    """最近的 trace 中已结束的 span（OTLP JSON 格式，按开始时间排序）"""
+    spans = get_trace(trace_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return {"trace_id": trace_id, "spans": spans}
+
+@app.get("/api/usage")
+async def get_usage(job_id: Optional[str] = None):
+    """Token 用量统计（按 protocol / ticker / 天，可选指定 job）"""
+    usage = token_ledger.summary()
+    if job_id:
+        usage["job"] = token_ledger.by_job.get(job_id)
+    return usage
+
+@app.get("/api/profiles/{profile_id}", response_class=PlainTextResponse)
+async def download_profile(request: Request, profile_id: str):
+    """下载剖析结果（collapsed stack 格式，需 X-Profile-Token）"""
+    if not profiling_authorized(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Profiling not authorized")
+    if profile_id not in profiles:
+        raise HTTPException(status_code=404, detail="Profile not found or not finished yet")
+    return profiles[profile_id]
+
+@app.get("/api/companies/search")
+async def search_companies(
+    q: str = Query(..., min_length=1, description="ticker、英文名或中文名"),
+    limit: int = Query(default=10, ge=1, le=50),
+    sic: Optional[str] = Query(default=None, description="SIC 代码，逗号分隔；all 表示不过滤"),
+):
+    """公司检索（用于搜索框自动补全）"""
+    if sic == "all":
+        sic_codes = None
+    elif sic:
+        sic_codes = [code.strip() for code in sic.split(",") if code.strip()]
+    else:
+        sic_codes = BIOTECH_SIC_CODES
+
+    if not company_registry.loaded:
+        await asyncio.to_thread(company_registry.load)
+    results = company_registry.search(q, limit=limit, sic_codes=sic_codes)
+    return {
+        "query": q,
+        "results": results,
+        "total": len(results)
+    }
+
+@app.get("/api/companies/{ticker}/history")
+async def get_company_history(
+    request: Request,
+    ticker: str,
+    as_of: Optional[str] = Query(default=None, description="ISO 日期或时间，返回该时间点的分析快照（默认最新）"),
+    filing: Optional[str] = Query(default=None, description="只看指定财报的快照，如 10-K 2024-02-28"),
+    limit: int = Query(default=20, ge=1, le=200),
+    fields: Optional[str] = Query(default=None, description="只返回快照 result 中的指定字段，如 analysis.survival"),
+):
+    """历史分析快照（本地归档，不调用 LLM）：快照列表 + as_of 时间点的完整结果"""
+    try:
+        as_of_ts = parse_as_of(as_of) if as_of else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid as_of: {as_of}")
+
+    snapshot = await asyncio.to_thread(archive.snapshot, ticker, as_of_ts, filing)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"No archived analysis for {ticker.upper()}")
+    paths = parse_fields(fields)
+    if paths:
+        snapshot["result"] = project_fields(snapshot["result"], paths)
+
+    snapshots = await asyncio.to_thread(archive.history, ticker, filing, limit)
+    return json_response(request, {
+        "ticker": ticker.upper(),
+        "as_of": as_of,
+        "snapshot": snapshot,
+        "snapshots": snapshots
+    })
+
+@app.get("/api/companies/{ticker}/history/diff")
+async def diff_company_history(
+    ticker: str,
+    from_id: int = Query(..., alias="from", description="起始快照 ID"),
+    to_id: int = Query(..., alias="to", description="目标快照 ID"),
+):
+    """两个历史快照之间的字段级差异"""
+    diff = await asyncio.to_thread(archive.diff, ticker, from_id, to_id)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return diff
+
 @app.get("/api/companies/{ticker}")
-async def get_company(ticker: str):
-    """获取公司基本信息"""
+async def get_company_endpoint(
+    request: Request,
+    ticker: str,
+    fields: Optional[str] = Query(default=None, description="只返回指定字段，逗号分隔"),
+    prefetch: Optional[str] = Query(default=None, description="prefetch=1 时为随后的分析请求启动投机预取"),
+):
+    """获取公司基本信息（支持 ETag/304 与字段投影）"""
+    company = await get_company(ticker)
+    paths = parse_fields(fields)
+    response = json_response(request, project_fields(company, paths) if paths else company)
+    if prefetch in ("1", "true"):
+        kind = start_prefetch(ticker)
+        if kind:
+            response.headers["X-Prefetch"] = kind
+    return response
+
+@app.post("/api/prefetch/{ticker}", status_code=202)
+async def prefetch_company(ticker: str):
+    """搜索框选中公司时调用：为随后的分析请求启动投机预取"""
+    # 重点跟踪公司不必查注册表，在任何 await 之前登记预取
+    if ticker.upper() not in BIOTECH_COMPANIES:
+        await get_company(ticker)
+    return {"ticker": ticker.upper(), "prefetch": start_prefetch(ticker)}
+
+async def get_company(ticker: str) -> Dict[str, Any]:
+    """按 ticker 查找公司信息（重点跟踪公司优先，其次注册表中的生物医药公司）"""
     ticker_upper = ticker.upper()
     if ticker_upper in BIOTECH_COMPANIES:
         return BIOTECH_COMPANIES[ticker_upper]
-    else:
-        raise HTTPException(status_code=404, detail=f"公司 {ticker} 不在支持列表中。本平台专注于美股生物医药公司。")
+
+    if not company_registry.loaded:
+        await asyncio.to_thread(company_registry.load)
+    entry = company_registry.get(ticker_upper)
+    if entry and entry.get("sic") in BIOTECH_SIC_CODES:
+        return entry
+
+    raise HTTPException(status_code=404, detail=f"公司 {ticker} 不在支持列表中。本平台专注于美股生物医药公司。")
 
 @app.get("/api/companies")
 async def list_companies():
@@ -318,67 +607,393 @@ async def list_companies():
         "focus": "美股生物医药/创新药公司"
     }
 
+@app.get("/api/screen")
+async def screen_companies(
+    where: List[str] = Query(default=[], description="筛选条件，可重复，如 runway_months<12"),
+    sort: Optional[str] = Query(default=None, description="排序字段，前缀 - 表示降序，如 -rd_intensity"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=500),
+    fields: Optional[str] = Query(default=None, description="返回字段，逗号分隔"),
+):
+    """基于已完成的分析结果进行跨公司筛选和排序"""
+    started = time.perf_counter()
+    try:
+        conditions = [parse_condition(expression) for expression in where]
+        selected = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        result = screening_index.query(conditions, sort=sort, offset=offset, limit=limit, fields=selected)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result["indexed"] = len(screening_index)
+    result["took_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+def create_analysis_job(job_id: str, ticker: str, priority: str, prefetched: bool = False):
+    created_at = datetime.now().isoformat()
+    checkpoints.create_job(job_id, ticker.upper(), ANALYSIS_SECTIONS, priority=priority, created_at=created_at)
+    analysis_jobs[job_id] = {
+        "status": "processing",
+        "ticker": ticker.upper(),
+        "created_at": created_at,
+        "priority": priority,
+        "prefetched": prefetched,
+        "result": None,
+        "error": None,
+        # 后台任务继承本次请求的 trace，可通过 GET /api/traces/{trace_id} 查看
+        "trace_id": current_span().trace_id if current_span() else None
+    }
+
+async def run_analysis_job(
+    job_id: str,
+    ticker: str,
+    priority: str = "interactive",
+    profile_id: Optional[str] = None,
+    completed: Optional[Dict[str, Any]] = None
+):
+    """
+    后台执行分析任务，超过截止时间或被取消时停止所有未完成的上游请求。
+    completed 为检查点中已完成的模块（恢复中断的任务时只补跑其余模块）。
+    """
+    with start_span("analysis.job", **{"job.id": job_id, "ticker": ticker, "scheduler.priority": priority}) as span:
+        job = analysis_jobs[job_id]
+        deadline = time.monotonic() + JOB_DEADLINE_SECONDS
+        profiler = SamplingProfiler() if profile_id else None
+        if profiler:
+            profiler.start()
+        interrupted = False
+        try:
+            async with asyncio.timeout(JOB_DEADLINE_SECONDS):
+                result = await perform_analysis(ticker, job_id=job_id, deadline=deadline, priority=priority, completed=completed)
+            job["status"] = "completed"
+            job["result"] = result
+            await store_completed_result(result)
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            # 停机时被中断的任务保留检查点，重启后继续
+            interrupted = shutdown.draining
+            job["error"] = "Analysis interrupted by shutdown" if interrupted else "Analysis cancelled"
+        except (TimeoutError, DeadlineExceeded):
+            job["status"] = "failed"
+            job["error"] = f"Analysis deadline exceeded ({JOB_DEADLINE_SECONDS:.0f}s)"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            span.set_attribute("job.status", job["status"])
+            if job["status"] != "completed":
+                span.set_error(job["error"])
+            job_tasks.pop(job_id, None)
+            if profiler:
+                profiler.stop()
+                store_profile(profile_id, profiler)
+            if not interrupted:
+                await asyncio.to_thread(checkpoints.finish_job, job_id, job["status"], job["error"])
+
+async def run_bulk_refresh(bulk_id: str, tickers: List[str]):
+    """
+    批量刷新：把多家公司的全部 protocol 打包成一次 Message Batches 提交，轮询完成后
+    按与 perform_analysis 相同的方式解析、组装和保存结果。批量提交失败或个别请求失败时
+    自动回退到实时调用（batch 优先级，不挤占交互请求）。
+    """
+    with start_span("bulk.refresh", **{"bulk.id": bulk_id, "bulk.tickers": len(tickers)}) as span:
+        bulk = bulk_jobs[bulk_id]
+        try:
+            api_key = os.getenv("ANTHROPIC_API_KEY")
+            if not api_key:
+                raise Exception("ANTHROPIC_API_KEY not set")
+
+            # 1. 获取公司信息和 SEC 数据
+            semaphore = asyncio.Semaphore(BULK_PREPARE_CONCURRENCY)
+
+            async def prepare(ticker: str):
+                async with semaphore:
+                    return await prepare_analysis(ticker)
+
+            outcomes = await asyncio.gather(*(prepare(t) for t in tickers), return_exceptions=True)
+            prepared: Dict[str, Dict[str, Any]] = {}
+            for ticker, outcome in zip(tickers, outcomes):
+                if isinstance(outcome, Exception):
+                    bulk["tickers"][ticker] = {"status": "failed", "error": str(outcome)}
+                else:
+                    prepared[ticker] = outcome
+
+            # 2. 组装批量请求（custom_id 只允许字母数字、- 和 _）
+            requests = []
+            request_index: Dict[str, tuple] = {}
+            for ticker, item in prepared.items():
+                for section, (protocol, _) in ANALYSIS_SECTIONS.items():
+                    custom_id = f"{re.sub(r'[^A-Za-z0-9_-]', '_', ticker)}-{section}"
+                    request_index[custom_id] = (ticker, section)
+                    requests.append({
+                        "custom_id": custom_id,
+                        "params": build_message_params(protocol, section_context(item, section), section)
+                    })
+
+            # 3. 提交并轮询批次
+            sections: Dict[str, Dict[str, Any]] = {ticker: {} for ticker in prepared}
+            if requests:
+                try:
+                    client = MessageBatchClient(api_key)
+                    batch = await client.create(requests)
+                    bulk["batch_id"] = batch["id"]
+                    bulk["status"] = "batch_submitted"
+                    started = time.monotonic()
+                    while batch.get("processing_status") != "ended":
+                        if time.monotonic() - started > BULK_MAX_WAIT_SECONDS:
+                            await client.cancel(batch["id"])
+                            raise MessageBatchError("Batch did not finish in time")
+                        await asyncio.sleep(BULK_POLL_SECONDS)
+                        batch = await client.retrieve(batch["id"])
+
+                    for custom_id, result in (await client.results(batch)).items():
+                        if custom_id not in request_index or not isinstance(result, dict) or result.get("type") != "succeeded":
+                            continue
+                        ticker, section = request_index[custom_id]
+                        try:
+                            parsed = parse_message(result["message"], section, ticker=ticker)
+                        except (KeyError, IndexError, TypeError, ValueError) as e:
+                            # 单条结果格式异常（如 content 为空）只影响该模块，按缺失处理
+                            print(f"Malformed batch result {custom_id}: {type(e).__name__}: {str(e)}")
+                            continue
+                        # 解析失败得到的降级结果视为缺失，交给下面的实时调用重试
+                        if not is_degraded(parsed):
+                            sections[ticker][section] = parsed
+                except (MessageBatchError, httpx.HTTPError, KeyError, IndexError, TypeError, ValueError) as e:
+                    print(f"Message batch failed, falling back to realtime calls: {str(e)}")
+                    bulk["batch_error"] = str(e)
+                    span.add_event("batch_failed", **{"exception.message": str(e)})
+
+            # 4. 批量中缺失的模块回退到实时调用
+            bulk["status"] = "realtime_fallback"
+            missing = [(t, section) for t in prepared for section in ANALYSIS_SECTIONS if section not in sections[t]]
+            bulk["realtime_fallbacks"] = len(missing)
+            span.set_attribute("bulk.realtime_fallbacks", len(missing))
+            fallback_results = await asyncio.gather(*(
+                analyze_with_claude(
+                    api_key,
+                    ANALYSIS_SECTIONS[section][0],
+                    section_context(prepared[t], section),
+                    protocol_name=section,
+                    ticker=t,
+                    priority="batch"
+                )
+                for t, section in missing
+            ))
+            for (t, section), result in zip(missing, fallback_results):
+                sections[t][section] = result
+
+            # 5. 保存结果
+            for ticker, item in prepared.items():
+                result = assemble_result(ticker, item, sections[ticker])
+                await store_completed_result(result)
+                bulk["tickers"][ticker] = {"status": "completed"}
+                if result.get("degraded"):
+                    bulk["tickers"][ticker].update(degraded=True, degraded_sections=result["degraded_sections"])
+
+            bulk["status"] = "completed"
+        except Exception as e:
+            bulk["status"] = "failed"
+            bulk["error"] = str(e)
+            span.set_error(str(e))
+        finally:
+            bulk["finished_at"] = datetime.now().isoformat()
+            bulk_tasks.pop(bulk_id, None)
+
+async def cancel_job(job_id: str):
+    """取消正在执行的任务，并等待其清理完成"""
+    task = job_tasks.get(job_id)
+    if task and not task.done():
+        task.cancel()
+        await asyncio.wait([task], timeout=5.0)
+
 @app.post("/api/analyze", response_model=AnalyzeResponse)
-async def analyze_company(request: AnalyzeRequest):
-    """分析公司财报"""
+async def analyze_company(
+    request: AnalyzeRequest,
+    http_request: Request,
+    response: Response,
+    profile: Optional[str] = Query(default=None, description="profile=1 时对本次分析采样剖析（需 X-Profile-Token）")
+):
+    """分析公司财报（后台任务，通过 GET /api/analyze/{job_id} 轮询结果）"""
+    ticker = request.ticker.upper()
+
+    # 接管查看公司时启动的投机分析，并提升到本次请求的优先级
+    speculative = prefetcher.claim(ticker, "analysis")
+    if speculative and analysis_jobs[speculative["job_id"]]["status"] in ("processing", "completed"):
+        job_id = speculative["job_id"]
+        job = analysis_jobs[job_id]
+        job["priority"] = request.priority
+        provider_limiter.promote(job_id, request.priority)
+        set_attributes(**{"prefetch.attached": True})
+        return AnalyzeResponse(
+            job_id=job_id,
+            status=job["status"],
+            ticker=ticker,
+            message="Attached to prefetched analysis"
+        )
+
+    if shutdown.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "30"})
+
+    rejection = admission.check(request.priority, active_jobs=len(job_tasks))
+    if rejection:
+        # 过载时优先返回新鲜的缓存结果，否则拒绝并告知何时重试
+        cached = get_fresh_result(ticker)
+        set_attributes(**{"admission.rejected": True, "analysis.cache_hit": cached is not None})
+        if cached:
+            job_id = str(uuid.uuid4())
+            analysis_jobs[job_id] = {
+                "status": "completed",
+                "ticker": ticker,
+                "created_at": datetime.now().isoformat(),
+                "priority": request.priority,
+                "result": cached["result"],
+                "error": None
+            }
+            return AnalyzeResponse(
+                job_id=job_id,
+                status="completed",
+                ticker=ticker,
+                message="Server busy, served cached analysis"
+            )
+        raise HTTPException(
+            status_code=rejection.status_code,
+            detail=rejection.reason,
+            headers={"Retry-After": str(rejection.retry_after)}
+        )
+
     try:
         job_id = str(uuid.uuid4())
 
         # 创建分析任务
-        analysis_jobs[job_id] = {
-            "status": "processing",
-            "ticker": request.ticker.upper(),
-            "created_at": datetime.now().isoformat(),
-            "result": None,
-            "error": None
-        }
+        create_analysis_job(job_id, ticker, request.priority)
 
-        # 执行分析
-        error_msg = None
-        try:
-            result = await perform_analysis(request.ticker)
-            analysis_jobs[job_id]["status"] = "completed"
-            analysis_jobs[job_id]["result"] = result
-        except Exception as e:
-            analysis_jobs[job_id]["status"] = "failed"
-            analysis_jobs[job_id]["error"] = str(e)
-            error_msg = str(e)
+        # 按需剖析：剖析结果在任务结束后可通过 GET /api/profiles/{profile_id} 下载
+        profile_id = None
+        if profiling_requested(profile, http_request.headers.get("x-profile"), http_request.headers.get("x-profile-token")):
+            profile_id = new_profile_id()
+            analysis_jobs[job_id]["profile_id"] = profile_id
+            response.headers["X-Profile-Id"] = profile_id
+
+        job_tasks[job_id] = asyncio.create_task(run_analysis_job(job_id, request.ticker, request.priority, profile_id))
 
         return AnalyzeResponse(
             job_id=job_id,
-            status=analysis_jobs[job_id]["status"],
+            status="processing",
             ticker=request.ticker.upper(),
-            message="Analysis completed" if analysis_jobs[job_id]["status"] == "completed" else f"Analysis failed: {error_msg}"
+            message="Analysis started"
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/analyze/{job_id}", response_model=AnalysisResult)
-async def get_analysis_result(job_id: str):
-    """查询分析结果"""
+@app.post("/api/bulk")
+async def start_bulk_refresh(request: BulkRefreshRequest):
+    """批量刷新（默认全部重点跟踪公司），通过 Message Batches API 离线执行"""
+    if shutdown.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "30"})
+    tickers = [t.upper() for t in (request.tickers or BIOTECH_COMPANIES.keys())]
+    bulk_id = str(uuid.uuid4())
+    bulk_jobs[bulk_id] = {
+        "bulk_id": bulk_id,
+        "status": "preparing",
+        "created_at": datetime.now().isoformat(),
+        "batch_id": None,
+        "tickers": {ticker: {"status": "pending"} for ticker in tickers},
+        "error": None
+    }
+    bulk_tasks[bulk_id] = asyncio.create_task(run_bulk_refresh(bulk_id, tickers))
+    return bulk_jobs[bulk_id]
+
+@app.get("/api/bulk/{bulk_id}")
+async def get_bulk_refresh(bulk_id: str):
+    """查询批量刷新进度"""
+    if bulk_id not in bulk_jobs:
+        raise HTTPException(status_code=404, detail="Bulk job not found")
+    return bulk_jobs[bulk_id]
+
+@app.delete("/api/analyze/{job_id}", response_model=AnalyzeResponse)
+async def cancel_analysis(job_id: str):
+    """取消分析任务"""
     if job_id not in analysis_jobs:
         raise HTTPException(status_code=404, detail="Job not found")
 
+    await cancel_job(job_id)
     job = analysis_jobs[job_id]
 
-    return AnalysisResult(
+    return AnalyzeResponse(
         job_id=job_id,
         status=job["status"],
         ticker=job["ticker"],
-        result=job.get("result"),
-        error=job.get("error")
+        message="Analysis cancelled" if job["status"] == "cancelled" else f"Analysis already {job['status']}"
     )
 
-async def fetch_sec_filings(ticker: str, cik: str) -> Dict[str, Any]:
+@app.get("/api/analyze/{job_id}/events")
+async def stream_analysis_events(request: Request, job_id: str):
+    """以 SSE 推送任务状态；所有订阅者断开时自动取消任务"""
+    if job_id not in analysis_jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        job = analysis_jobs[job_id]
+        job_watchers[job_id] = job_watchers.get(job_id, 0) + 1
+        finished = False
+        try:
+            yield f"event: status\ndata: {json.dumps({'status': job['status']})}\n\n"
+            while job["status"] == "processing":
+                if await request.is_disconnected():
+                    return
+                await asyncio.sleep(0.5)
+            finished = True
+            payload = {"status": job["status"], "result": job.get("result"), "error": job.get("error")}
+            yield f"event: done\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        finally:
+            job_watchers[job_id] -= 1
+            if not finished and job_watchers[job_id] == 0:
+                # 客户端断开时生成器可能已被取消，另起任务完成取消
+                spawn(cancel_job(job_id))
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.get("/api/analyze/{job_id}", response_model=AnalysisResult)
+async def get_analysis_result(
+    request: Request,
+    job_id: str,
+    fields: Optional[str] = Query(default=None, description="只返回 result 中的指定字段，如 analysis.survival"),
+):
+    """查询分析结果（支持 ETag/304 与字段投影）"""
+    if job_id not in analysis_jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job = analysis_jobs[job_id]
+    paths = parse_fields(fields)
+
+    def payload() -> Dict[str, Any]:
+        result = job.get("result")
+        if result is not None and paths:
+            result = project_fields(result, paths)
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "ticker": job["ticker"],
+            "result": result,
+            "error": job.get("error"),
+            "trace_id": job.get("trace_id")
+        }
+
+    # 任务结果只会整体替换（不会原地修改），状态、结果对象、错误和投影字段确定一个响应版本；
+    # 轮询时版本不变则不再序列化和哈希整个结果
+    version = ("job", job_id, job["status"], id(job.get("result")), job.get("error"), fields)
+    return json_response(request, payload, version=version)
+
+async def fetch_sec_filings(ticker: str, cik: str, deadline: Optional[float] = None) -> Dict[str, Any]:
     """使用 SEC API 获取公司财报数据"""
     sec_api_key = os.getenv("SEC_API_KEY")
     if not sec_api_key:
         return None
 
-    try:
-        async with httpx.AsyncClient() as client:
+    with start_span("sec.fetch_filings", kind=SPAN_KIND_CLIENT, ticker=ticker, **{"sec.cik": cik}) as span:
+        try:
             # 查询最新的财报文件（包括美国公司的 10-K/10-Q 和外国公司的 20-F/6-K）
-            response = await client.post(
+            response = await http_client().post(
                 "https://api.sec-api.io",
                 headers={
                     "Authorization": sec_api_key,
@@ -394,14 +1009,16 @@ async def fetch_sec_filings(ticker: str, cik: str) -> Dict[str, Any]:
                     "size": "5",
                     "sort": [{"filedAt": {"order": "desc"}}]
                 },
-                timeout=30.0
+                timeout=time_left(deadline, 30.0)
             )
 
+            span.set_attribute("http.response.status_code", response.status_code)
             if response.status_code == 200:
                 data = response.json()
                 filings = data.get("filings", [])
                 # 过滤确保 ticker 匹配
                 filings = [f for f in filings if f.get("ticker", "").upper() == ticker.upper()]
+                span.set_attribute("sec.filing_count", len(filings))
                 if filings:
                     return {
                         "latest_filing": filings[0] if filings else None,
@@ -410,15 +1027,17 @@ async def fetch_sec_filings(ticker: str, cik: str) -> Dict[str, Any]:
                     }
             else:
                 print(f"SEC API error: {response.status_code} - {response.text}")
-    except Exception as e:
-        print(f"SEC API exception: {str(e)}")
-
-    return None
+                span.set_error(f"HTTP {response.status_code}")
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"SEC API exception: {str(e)}")
+            span.set_error(str(e))
 
-import asyncio
+        return None
 
-async def perform_analysis(ticker: str) -> Dict[str, Any]:
-    """执行完整的财报分析（并行调用 Claude API 加速）"""
+async def prepare_analysis(ticker: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """获取公司信息和 SEC 数据，构建各 protocol 共用的分析上下文"""
     # 获取公司信息
     try:
         company_info = await get_company(ticker)
@@ -426,7 +1045,7 @@ async def perform_analysis(ticker: str) -> Dict[str, Any]:
         raise Exception(f"Company not found: {ticker}")
 
     # 尝试获取 SEC 真实数据
-    sec_data = await fetch_sec_filings(ticker, company_info.get("cik", ""))
+    sec_data = await fetch_sec_filings(ticker, company_info.get("cik", ""), deadline=deadline)
 
     # 构建分析上下文 - 增加生物医药特有信息
     sec_context = ""
@@ -451,212 +1070,306 @@ Company Profile:
 - Therapeutic Areas: {', '.join(company_info.get('therapeutic_areas', []))}
 """
 
-    # 调用 Claude API 进行分析
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        raise Exception("ANTHROPIC_API_KEY not set")
+    return {
+        "company_info": company_info,
+        "sec_data": sec_data,
+        "context": f"{biotech_context}\n{sec_context}"
+    }
 
-    # 并行调用 5 个 Protocol 分析（包括新增的管线分析）
-    reality_task = analyze_with_claude(
-        api_key,
-        PROTOCOL_A,
-        f"{biotech_context}\n{sec_context}\n分析这家生物医药公司的业务实质。"
-    )
+async def warm_up_connections():
+    """提前建立到 Anthropic / SEC API 的连接（TLS 握手完成后留在共享连接池中）"""
+    global _last_warm_up
+    if time.monotonic() - _last_warm_up < WARM_UP_INTERVAL:
+        return
+    _last_warm_up = time.monotonic()
+
+    targets = [os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")]
+    if os.getenv("SEC_API_KEY"):
+        targets.append("https://api.sec-api.io")
+    await asyncio.gather(*(http_client().head(url, timeout=5.0) for url in targets), return_exceptions=True)
+
+async def prefetch_context(ticker: str) -> Optional[Dict[str, Any]]:
+    """预取：预热连接的同时获取 SEC 数据并构建分析上下文，失败时返回 None"""
+    with start_span("prefetch.prepare", ticker=ticker):
+        try:
+            _, prepared = await asyncio.gather(
+                warm_up_connections(),
+                prepare_analysis(ticker, deadline=time.monotonic() + JOB_DEADLINE_SECONDS)
+            )
+            return prepared
+        except Exception as e:
+            print(f"Prefetch failed for {ticker}: {str(e)}")
+            return None
 
-    survival_task = analyze_with_claude(
-        api_key,
-        PROTOCOL_B,
-        f"{biotech_context}\n{sec_context}\n分析财务生存能力，提取最新财务指标。"
-    )
+def start_prefetch(ticker: str) -> Optional[str]:
+    """为随后的分析请求启动投机预取，返回启动的预取类型（analysis / prepare），未启动时返回 None"""
+    ticker = ticker.upper()
+    if shutdown.draining:
+        return None
+    if get_fresh_result(ticker):
+        metrics.inc("prefetch_skipped_total", reason="fresh")
+        return None
+    # 分析请求先于预取请求到达时（两者由前端几乎同时发出），不再重复启动
+    if any(analysis_jobs[job_id]["ticker"] == ticker for job_id in job_tasks):
+        metrics.inc("prefetch_skipped_total", reason="running")
+        return None
 
-    competition_task = analyze_with_claude(
-        api_key,
-        PROTOCOL_C,
-        f"{biotech_context}\n{sec_context}\n分析竞争格局，重点关注同靶点/同适应症竞品。"
-    )
+    # 以下检查和登记之间没有 await：随后的 POST /api/analyze 一定能看到这里登记的预取
+    # 重点跟踪公司在提供方空闲时直接以 background 优先级开始分析（结果同时写入缓存）
+    if ticker in BIOTECH_COMPANIES and os.getenv("ANTHROPIC_API_KEY") and not provider_limiter.queue_depth():
+        job_id = str(uuid.uuid4())
 
-    history_task = analyze_with_claude(
-        api_key,
-        PROTOCOL_D,
-        f"{biotech_context}\n{sec_context}\n提取最近6-8个季度的营收数据。"
-    )
+        def launch() -> asyncio.Task:
+            create_analysis_job(job_id, ticker, "background", prefetched=True)
+            job_tasks[job_id] = asyncio.create_task(run_analysis_job(job_id, ticker, "background"))
+            spawn(warm_up_connections())
+            return job_tasks[job_id]
 
-    pipeline_task = analyze_with_claude(
-        api_key,
-        PROTOCOL_E,
-        f"{biotech_context}\n{sec_context}\n分析公司的研发管线（Pipeline），包括各产品的临床阶段和预计里程碑。"
-    )
+        return "analysis" if prefetcher.start(ticker, "analysis", launch, job_id=job_id) else None
 
-    # 并行执行所有分析
-    reality_analysis, survival_analysis, competition_analysis, history_analysis, pipeline_analysis = await asyncio.gather(
-        reality_task, survival_task, competition_task, history_task, pipeline_task
-    )
+    if prefetcher.start(ticker, "prepare", lambda: asyncio.create_task(prefetch_context(ticker))):
+        return "prepare"
+    return None
 
-    return {
+async def claim_prefetched_context(ticker: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """接管预取的分析上下文（仍在获取中则等待其完成），没有可用的预取时直接获取"""
+    entry = prefetcher.claim(ticker.upper(), "prepare")
+    if entry and not entry["task"].cancelled():
+        prepared = await asyncio.wait_for(asyncio.shield(entry["task"]), time_left(deadline, 30.0))
+        if prepared:
+            return prepared
+    return await prepare_analysis(ticker, deadline=deadline)
+
+def section_context(prepared: Dict[str, Any], section: str) -> str:
+    """某个分析模块的完整上下文（公共上下文 + 模块任务说明）"""
+    return f"{prepared['context']}\n{ANALYSIS_SECTIONS[section][1]}"
+
+def assemble_result(ticker: str, prepared: Dict[str, Any], sections: Dict[str, Any]) -> Dict[str, Any]:
+    """把各模块的分析结果组装成前端需要的结构"""
+    company_info = prepared["company_info"]
+    analysis = {section: sections.get(section) for section in ANALYSIS_SECTIONS}
+    result = {
         "company_name": company_info["company_name"],
         "company_name_cn": company_info.get("company_name_cn", ""),
         "ticker": ticker.upper(),
+        "sector": company_info.get("sector", ""),
         "focus": company_info.get("focus", ""),
         "key_products": company_info.get("key_products", []),
         "therapeutic_areas": company_info.get("therapeutic_areas", []),
-        "sec_data": sec_data,
-        "analysis": {
-            "reality": reality_analysis,
-            "survival": survival_analysis,
-            "competition": competition_analysis,
-            "history": history_analysis,
-            "pipeline": pipeline_analysis
-        }
+        "sec_data": prepared["sec_data"],
+        "analysis": analysis
     }
+    # 有模块来自降级后备时，在顶层标明哪些模块降级以及其中最旧的数据时间
+    degraded = {section: value for section, value in analysis.items() if is_degraded(value)}
+    if degraded:
+        stale = [value["stale_as_of"] for value in degraded.values() if value["stale_as_of"]]
+        result["degraded"] = True
+        result["degraded_sections"] = list(degraded)
+        result["stale_as_of"] = min(stale) if stale else None
+    return result
+
+async def perform_analysis(
+    ticker: str,
+    job_id: Optional[str] = None,
+    deadline: Optional[float] = None,
+    priority: str = "interactive",
+    completed: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """执行完整的财报分析（并行调用 Claude API 加速；completed 中已有的模块不再调用）"""
+    prepared = await claim_prefetched_context(ticker, deadline=deadline)
 
-async def analyze_with_claude(api_key: str, protocol: str, context: str) -> Dict[str, Any]:
-    """使用 Claude API 进行分析"""
-    try:
-        # 支持中转 API - 从环境变量读取 base URL
-        base_url = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
-        api_url = f"{base_url}/v1/messages"
+    # 调用 Claude API 进行分析
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        raise Exception("ANTHROPIC_API_KEY not set")
 
-        # 支持自定义模型名称
-        model_name = os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
+    # 超出单日/单任务 token 预算时直接失败，不再发起调用
+    token_ledger.check_budget(job_id)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                api_url,
-                headers={
-                    "x-api-key": api_key,
-                    "anthropic-version": "2023-06-01",
-                    "content-type": "application/json"
-                },
-                json={
-                    "model": model_name,
-                    "max_tokens": 2048,
-                    "messages": [{
-                        "role": "user",
-                        "content": f"{protocol}\n\n{context}"
-                    }]
-                },
-                timeout=60.0
-            )
+    # 投机预取的任务在获取 SEC 数据期间可能已被分析请求接管并提升了优先级
+    if job_id in analysis_jobs:
+        priority = analysis_jobs[job_id]["priority"]
 
-            if response.status_code != 200:
-                print(f"Claude API error: {response.status_code} - {response.text}")
-                # 如果 API 调用失败，返回 Mock 数据作为后备
-                return get_mock_data(context, protocol)
-
-            result = response.json()
-            text = result["content"][0]["text"]
-
-            # 尝试解析 JSON
-            try:
-                # 尝试从文本中提取 JSON
-                import re
-                json_match = re.search(r'\{[\s\S]*\}', text)
-                if json_match:
-                    return json.loads(json_match.group())
-                return json.loads(text)
-            except json.JSONDecodeError:
-                print(f"Failed to parse JSON from Claude response: {text[:200]}")
-                return get_mock_data(context, protocol)
+    # 每次 protocol 调用共用的任务参数（用量统计、截止时间、调度优先级）
+    call_options = {"ticker": ticker, "job_id": job_id, "deadline": deadline, "priority": priority}
 
-    except Exception as e:
-        print(f"Claude API exception: {str(e)}")
-        # 如果出现异常，返回 Mock 数据作为后备
-        return get_mock_data(context, protocol)
-
-
-def get_mock_data(context: str, protocol: str) -> Dict[str, Any]:
-    """获取 Mock 数据作为后备"""
-    # 从 context 中提取公司代码
-    ticker = ""
-    if "LEGN" in context:
-        ticker = "LEGN"
-    elif "NVDA" in context:
-        ticker = "NVDA"
-    elif "TSLA" in context:
-        ticker = "TSLA"
-
-    # 每个公司的 Mock 数据
-    mock_data = {
-        "LEGN": {
-            "reality": {
-                "narrative_label": "创新型 CAR-T 细胞疗法生物技术公司",
-                "economic_label": "单一产品商业化阶段的生物制药企业",
-                "reality_gap_score": 7
-            },
-            "survival": {
-                "runway_months": 18,
-                "financial_health": "中等风险 - 需密切监控现金流",
-                "key_risks": [
-                    "Carvykti 市场渗透速度不及预期",
-                    "竞争对手产品获批可能影响市场份额",
-                    "研发管线单薄，缺乏后续产品"
-                ]
-            },
-            "competition": {
-                "competitors": ["BMS (Abecma)", "J&J (Tecvayli)"],
-                "kill_switch": "FDA 对早期治疗线（二线）的批准进度",
-                "market_dynamics": "CAR-T 市场快速增长，但竞争加剧。"
-            }
-        },
-        "NVDA": {
-            "reality": {
-                "narrative_label": "AI 基础设施与加速计算平台公司",
-                "economic_label": "数据中心 GPU 垄断供应商",
-                "reality_gap_score": 3
-            },
-            "survival": {
-                "runway_months": 999,
-                "financial_health": "极度健康 - 现金流充裕",
-                "key_risks": ["AI 投资周期可能放缓", "竞争对手追赶", "出口限制"]
-            },
-            "competition": {
-                "competitors": ["AMD (MI300X)", "Intel (Gaudi)", "Google (TPU)"],
-                "kill_switch": "AI 训练需求是否持续增长",
-                "market_dynamics": "数据中心 GPU 市场 NVIDIA 占据 80%+ 份额。"
-            }
-        },
-        "TSLA": {
-            "reality": {
-                "narrative_label": "可持续能源与自动驾驶科技公司",
-                "economic_label": "电动汽车制造商",
-                "reality_gap_score": 6
-            },
-            "survival": {
-                "runway_months": 48,
-                "financial_health": "稳健 - 正现金流，但利润率承压",
-                "key_risks": ["价格战", "FSD 进展不及预期", "中国市场竞争"]
-            },
-            "competition": {
-                "competitors": ["比亚迪", "大众", "Rivian"],
-                "kill_switch": "FSD 能否实现 L4 级自动驾驶",
-                "market_dynamics": "电动车市场增速放缓，价格战激烈。"
+    completed = completed or {}
+
+    async def run_section(section: str, protocol: str) -> Dict[str, Any]:
+        if section in completed:
+            return completed[section]
+        result = await analyze_with_claude(
+            api_key,
+            protocol,
+            section_context(prepared, section),
+            protocol_name=section,
+            **call_options
+        )
+        # 每个模块完成后立即写检查点，进程中断后不必重新调用（降级结果不写，恢复时重试）
+        if job_id and not is_degraded(result):
+            await asyncio.to_thread(checkpoints.save_section, job_id, section, result)
+        return result
+
+    # 并行调用 5 个 Protocol 分析（包括新增的管线分析）；任一模块失败（超出预算、截止时间）时
+    # TaskGroup 取消其余模块，不再为注定失败的任务继续调用上游
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = {
+                section: group.create_task(run_section(section, protocol))
+                for section, (protocol, _) in ANALYSIS_SECTIONS.items()
             }
-        }
-    }
+    except ExceptionGroup as e:
+        # 以第一个失败模块的异常作为任务的错误（run_analysis_job 按异常类型记录状态）
+        raise e.exceptions[0]
 
-    company_data = mock_data.get(ticker, mock_data["LEGN"])
+    return assemble_result(ticker, prepared, {section: task.result() for section, task in tasks.items()})
 
-    if "business identity" in protocol.lower() or "forensic" in protocol.lower():
-        return company_data["reality"]
-    elif "survival" in protocol.lower() or "distressed" in protocol.lower():
-        return company_data["survival"]
-    elif "competitive" in protocol.lower() or "strategist" in protocol.lower():
-        return company_data["competition"]
-    elif "historical" in protocol.lower() or "revenue data" in protocol.lower():
-        # 返回历史营收数据
-        return {
-            "revenue_history": [
-                {"quarter": "2024-Q1", "revenue": 45.2},
-                {"quarter": "2024-Q2", "revenue": 58.7},
-                {"quarter": "2024-Q3", "revenue": 72.4},
-                {"quarter": "2024-Q4", "revenue": 85.1},
-                {"quarter": "2025-Q1", "revenue": 98.6},
-                {"quarter": "2025-Q2", "revenue": 112.3},
-                {"quarter": "2025-Q3", "revenue": 125.8}
-            ]
-        }
-    else:
-        return {"error": "Unknown protocol type"}
+def build_message_params(protocol: str, context: str, protocol_name: str, job_id: Optional[str] = None, model_name: Optional[str] = None) -> Dict[str, Any]:
+    """Messages API 请求体（实时调用与批量提交共用）"""
+    if model_name is None:
+        _, model_name = choose_route(protocol_name)
+    return {
+        "model": model_name,
+        "max_tokens": token_ledger.max_tokens_for(protocol_name, job_id),
+        "messages": [{
+            "role": "user",
+            "content": f"{protocol}\n\n{context}"
+        }]
+    }
+
+def parse_message(
+    message: Dict[str, Any],
+    protocol_name: str,
+    ticker: Optional[str] = None,
+    job_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """记录 token 用量并从 Messages API 返回的消息中解析 JSON，失败时返回降级后备结果"""
+    text = message["content"][0]["text"]
+
+    usage = message.get("usage") or {}
+    token_ledger.record(
+        protocol_name,
+        input_tokens=usage.get("input_tokens", 0),
+        output_tokens=usage.get("output_tokens", 0),
+        cached_tokens=usage.get("cache_read_input_tokens", 0),
+        ticker=ticker,
+        job_id=job_id
+    )
+    if message.get("stop_reason") == "max_tokens":
+        metrics.inc("llm_truncated_total", protocol=protocol_name)
+    set_attributes(**{
+        "gen_ai.response.model": message.get("model"),
+        "gen_ai.response.finish_reasons": message.get("stop_reason"),
+        "gen_ai.usage.input_tokens": usage.get("input_tokens", 0),
+        "gen_ai.usage.output_tokens": usage.get("output_tokens", 0),
+        "gen_ai.usage.cache_read_input_tokens": usage.get("cache_read_input_tokens", 0),
+        "llm.cache_hit": usage.get("cache_read_input_tokens", 0) > 0
+    })
+
+    # 尝试解析 JSON
+    with start_span("llm.parse_json", **{"llm.protocol": protocol_name, "llm.response_chars": len(text)}) as span:
+        try:
+            # 尝试从文本中提取 JSON
+            json_match = re.search(r'\{[\s\S]*\}', text)
+            if json_match:
+                return json.loads(json_match.group())
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"Failed to parse JSON from Claude response: {text[:200]}")
+            span.set_error(f"Invalid JSON: {e}")
+            span.set_attribute("llm.fallback", "degraded")
+            return fallbacks.get(ticker, protocol_name)
+
+async def analyze_with_claude(
+    api_key: str,
+    protocol: str,
+    context: str,
+    protocol_name: str = "",
+    ticker: Optional[str] = None,
+    job_id: Optional[str] = None,
+    deadline: Optional[float] = None,
+    priority: str = "interactive"
+) -> Dict[str, Any]:
+    """使用 Claude API 进行分析（按优先级排队获取提供方并发槽位，按路由表选择模型）"""
+    route, model_name = choose_route(protocol_name)
+    with start_span(
+        "llm.analyze_with_claude",
+        kind=SPAN_KIND_CLIENT,
+        ticker=ticker,
+        **{"gen_ai.system": "anthropic", "gen_ai.request.model": model_name, "llm.protocol": protocol_name, "llm.route": route, "scheduler.priority": priority}
+    ) as span:
+        if not provider_circuit.allow():
+            span.set_attribute("llm.fallback", "circuit_open")
+            return fallbacks.get(ticker, protocol_name)
+
+        started = None
+        elapsed = None
+        status_code = None
+        ok = False
+        interrupted = False
+        try:
+            # 支持中转 API - 从环境变量读取 base URL
+            base_url = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+            api_url = f"{base_url}/v1/messages"
+
+            queued = time.perf_counter()
+            async with provider_limiter.slot(priority, key=job_id):
+                span.set_attribute("scheduler.wait_ms", round((time.perf_counter() - queued) * 1000, 1))
+                # 并行的模块排队等待槽位期间，其他模块的用量可能已耗尽预算，发起调用前再检查一次
+                token_ledger.check_budget(job_id)
+                params = build_message_params(protocol, context, protocol_name, job_id, model_name=model_name)
+                timeout = time_left(deadline, 60.0)
+                started = time.perf_counter()
+                response = await http_client().post(
+                    api_url,
+                    headers={
+                        "x-api-key": api_key,
+                        "anthropic-version": "2023-06-01",
+                        "content-type": "application/json"
+                    },
+                    json=params,
+                    timeout=timeout
+                )
+                elapsed = time.perf_counter() - started
+                status_code = response.status_code
+
+                span.set_attribute("http.response.status_code", response.status_code)
+                if response.status_code != 200:
+                    print(f"Claude API error: {response.status_code} - {response.text}")
+                    span.set_error(f"HTTP {response.status_code}")
+                    span.set_attribute("llm.fallback", "degraded")
+                    # 如果 API 调用失败，返回带降级标记的后备结果
+                    return fallbacks.get(ticker, protocol_name)
+
+                result = parse_message(response.json(), protocol_name, ticker=ticker, job_id=job_id)
+                ok = True
+                return result
+
+        except (TokenBudgetExceeded, DeadlineExceeded):
+            raise
+        except asyncio.CancelledError:
+            # 任务截止时间到达时由 asyncio.timeout 取消，对这次调用来说就是超时；用户取消、停机等其他取消不计入
+            interrupted = deadline is None or time.monotonic() < deadline
+            raise
+        except Exception as e:
+            print(f"Claude API exception: {str(e)}")
+            span.set_error(str(e))
+            span.set_attribute("llm.fallback", "degraded")
+            # 如果出现异常，返回带降级标记的后备结果
+            return fallbacks.get(ticker, protocol_name)
+        finally:
+            # 已发出的调用只在这里记录一次结果：非 200、响应解析失败、超时和连接错误都算失败
+            if started is not None and not interrupted:
+                if elapsed is None:
+                    elapsed = time.perf_counter() - started
+                if status_code == 200:
+                    admission.record_latency(protocol_name, elapsed)
+                else:
+                    # 超时和连接错误是过载的信号，同样计入延迟估算
+                    admission.record_failure(protocol_name, elapsed)
+                if route:
+                    router.record(route, elapsed, ok=ok)
+                provider_circuit.record(ok=status_code == 200)
 
 if __name__ == "__main__":
     import uvicorn
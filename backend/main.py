@@ -1,21 +1,39 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+# 进程启动计时起点（尽量早于其他导入）
+_process_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import os
 from dotenv import load_dotenv
-import anthropic
-import google.generativeai as genai
-from sec_api import QueryApi
 import uuid
 from datetime import datetime
 import asyncio
 import json
 import re
 
-# 加载环境变量
+# 加载环境变量（必须在导入本地模块之前：这些模块在导入时读取配置）
 load_dotenv()
 
+import metrics
+from archive import AnalysisArchive, parse_as_of
+from checkpoints import CheckpointStore
+from company_registry import CompanyRegistry, BIOTECH_SIC_CODES
+from diagnostics import (
+    LoopLagMonitor, SamplingProfiler, new_profile_id, profiles, profiling_authorized, profiling_requested, store_profile
+)
+from providers import get_provider_async, init_timings
+from responses import json_response, parse_fields, project_fields
+from routing import Router
+from shutdown import ShutdownCoordinator
+from token_usage import token_ledger
+from tracked_companies import BIOTECH_COMPANIES
+from tracing import SPAN_KIND_CLIENT, SPAN_KIND_SERVER, UNRECORDED_ROUTES, current_span, get_trace, start_span
+
 # 初始化 FastAPI
 app = FastAPI(
     title="Veritas API",
@@ -30,21 +48,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 前端跨域读取退避、条件请求和链路追踪用到的响应头
+    expose_headers=["Retry-After", "ETag", "X-Trace-Id"],
 )
 
-# 初始化 API 客户端
-anthropic_client = anthropic.Anthropic(
-    api_key=os.getenv("ANTHROPIC_API_KEY"),
-    base_url=os.getenv("ANTHROPIC_BASE_URL")
-)
-sec_query_api = QueryApi(api_key=os.getenv("SEC_API_KEY"))
+# AI 引擎配置
+AI_ENGINE = os.getenv("AI_ENGINE", "dual")  # claude / gemini / dual / auto
 
-# 初始化 Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+# auto 模式下按 protocol 路由（见 routing.py）
+router = Router()
 
-# AI 引擎配置
-AI_ENGINE = os.getenv("AI_ENGINE", "dual")  # claude / gemini / dual
+# 当前配置实际会用到的提供方（SDK 在预热或首次使用时才导入，见 providers.py）
+ENGINE_PROVIDERS = {
+    "claude": ["claude"],
+    "gemini": ["gemini"],
+    "dual": ["claude", "gemini"],
+    "auto": ["claude", "gemini"],
+}
+SELECTED_PROVIDERS = ENGINE_PROVIDERS.get(AI_ENGINE, ["claude"]) + ["sec"]
+
+# 启动耗时报告（毫秒，均从进程启动计时起点算起）
+startup_report = {
+    "import_ms": round((time.perf_counter() - _process_started) * 1000, 1),
+    "provider_init_ms": init_timings,
+    "warmup_ms": None,
+    "first_request_ms": None,
+    "ready": False,
+    # 预热失败的提供方（name -> 错误），全部初始化成功才就绪
+    "provider_errors": {},
+}
 
 # 数据模型
 class AnalyzeRequest(BaseModel):
@@ -64,10 +96,26 @@ class AnalysisResult(BaseModel):
     ticker: str
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    trace_id: Optional[str] = None
+
+# 公司注册表（打包的 SEC ticker/CIK/SIC 数据集 + 重点跟踪公司的中文名等信息），首次查询时才加载
+company_registry = CompanyRegistry(tracked=BIOTECH_COMPANIES)
 
 # 临时存储（生产环境应使用数据库）
 analysis_jobs = {}
 
+# 各模块结果的检查点：进程重启（railway.json 失败时自动重启）后，中断的任务只补跑缺失的模块
+checkpoints = CheckpointStore()
+
+# 历史分析快照归档（按公司/财报，模块去重 + delta 存储）
+archive = AnalysisArchive()
+
+# 重启后正在恢复的任务（job_id -> asyncio.Task），同一公司的新请求直接等待其完成
+resuming_jobs: Dict[str, asyncio.Task] = {}
+
+# 收到 SIGTERM 后（早于 uvicorn 关闭监听、等待进行中的请求）不再接收新的分析请求
+shutdown = ShutdownCoordinator()
+
 # AI Prompts
 PROTOCOL_A = """
 Role: Senior Forensic Accountant.
@@ -113,22 +161,158 @@ Output JSON format:
 }
 """
 
+# 各分析模块：结果字段名 -> (Protocol, 任务说明)
+ANALYSIS_SECTIONS = {
+    "reality": (PROTOCOL_A, "Analyze the business identity."),
+    "survival": (PROTOCOL_B, "Analyze financial survival."),
+    "competition": (PROTOCOL_C, "Analyze competitive landscape."),
+}
+
 def extract_json_from_text(text: str) -> Dict[str, Any]:
     """从 AI 返回的文本中提取 JSON 对象"""
+    with start_span("llm.parse_json", **{"llm.response_chars": len(text)}) as span:
+        try:
+            # 尝试找到 JSON 代码块
+            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', text)
+            if json_match:
+                return json.loads(json_match.group(1))
+
+            # 尝试找到 JSON 对象
+            json_match = re.search(r'\{[\s\S]*\}', text)
+            if json_match:
+                return json.loads(json_match.group(0))
+
+            span.set_error("No JSON object found")
+            return {}
+        except json.JSONDecodeError as e:
+            span.set_error(f"Invalid JSON: {e}")
+            return {}
+
+async def warm_up_providers(names: Optional[List[str]] = None):
+    """后台预热所选提供方，全部初始化成功后实例才标记为就绪；失败的提供方记录在 provider_errors 中"""
+    errors = startup_report["provider_errors"]
+    for name in names or SELECTED_PROVIDERS:
+        try:
+            await get_provider_async(name)
+            errors.pop(name, None)
+        except Exception as e:
+            print(f"Provider {name} warm-up failed: {str(e)}")
+            errors[name] = str(e)
+    if startup_report["warmup_ms"] is None:
+        startup_report["warmup_ms"] = round((time.perf_counter() - _process_started) * 1000, 1)
+    startup_report["ready"] = not errors
+
+# 预热任务（/ready 在预热失败后会重试失败的提供方，同一时间只有一个）
+warm_up_task: Optional[asyncio.Task] = None
+
+# 公司注册表索引在线程中预热（保留引用，避免任务被回收）
+registry_warm_up_task: Optional[asyncio.Task] = None
+
+# 事件循环延迟监控（阻塞超过 LOOP_LAG_THRESHOLD_MS 时打印调用栈）
+lag_monitor = LoopLagMonitor()
+
+@app.on_event("startup")
+async def on_startup():
+    global warm_up_task, registry_warm_up_task
+    shutdown.install_signal_handlers()
+    lag_monitor.start()
+    warm_up_task = asyncio.create_task(warm_up_providers())
+    registry_warm_up_task = asyncio.create_task(asyncio.to_thread(company_registry.load))
+    checkpoints.purge()
+    resume_interrupted_jobs()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """进行中的请求由 uvicorn 等待完成（--timeout-graceful-shutdown）；仍在恢复的任务保留检查点"""
+    shutdown.begin()
+    lag_monitor.stop()
+    for task in resuming_jobs.values():
+        task.cancel()
+    if resuming_jobs:
+        await asyncio.wait(list(resuming_jobs.values()), timeout=5.0)
+    checkpoints.close()
+    archive.close()
+
+def resume_interrupted_jobs():
+    """恢复上次进程退出时中断的任务（沿用原 job_id），只补跑没有检查点的模块"""
+    for saved in checkpoints.interrupted_jobs():
+        job_id, ticker = saved["job_id"], saved["ticker"]
+        analysis_jobs[job_id] = {
+            "status": "processing",
+            "ticker": ticker,
+            "created_at": saved["created_at"],
+            "resumed": True,
+            "result": None,
+            "error": None
+        }
+        resuming_jobs[job_id] = asyncio.create_task(
+            run_analysis_job(job_id, ticker, saved["filing_type"] or "10-K", completed=saved["completed"])
+        )
+        metrics.inc("checkpoint_jobs_resumed_total")
+        print(f"Resuming analysis {job_id} ({ticker}): {len(saved['completed'])} sections checkpointed, {len(saved['remaining'])} remaining")
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """按需剖析：带 profile=1 或 X-Profile: 1 且令牌正确时，对整个请求采样"""
+    if not profiling_requested(
+        request.query_params.get("profile"),
+        request.headers.get("x-profile"),
+        request.headers.get("x-profile-token")
+    ):
+        return await call_next(request)
+
+    profile_id = new_profile_id()
+    profiler = SamplingProfiler()
+    profiler.start()
     try:
-        # 尝试找到 JSON 代码块
-        json_match = re.search(r'```json\s*([\s\S]*?)\s*```', text)
-        if json_match:
-            return json.loads(json_match.group(1))
-
-        # 尝试找到 JSON 对象
-        json_match = re.search(r'\{[\s\S]*\}', text)
-        if json_match:
-            return json.loads(json_match.group(0))
-
-        return {}
-    except json.JSONDecodeError:
-        return {}
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+        store_profile(profile_id, profiler)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+@app.middleware("http")
+async def record_first_request(request: Request, call_next):
+    """记录进程启动到第一个业务请求完成的耗时（不含健康检查/就绪探针）"""
+    response = await call_next(request)
+    if startup_report["first_request_ms"] is None and request.url.path not in ("/", "/ready"):
+        startup_report["first_request_ms"] = round((time.perf_counter() - _process_started) * 1000, 1)
+    return response
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """每个请求一个 server span（延续请求头中的 W3C traceparent），响应头 X-Trace-Id 返回 trace ID"""
+    with start_span(
+        request.method,
+        kind=SPAN_KIND_SERVER,
+        traceparent=request.headers.get("traceparent"),
+        **{"http.request.method": request.method, "url.path": request.url.path}
+    ) as span:
+        response = await call_next(request)
+        # span 名使用路由模板（如 /api/analyze/{job_id}），避免每个 ID 一个名字
+        route = request.scope.get("route")
+        if route is not None:
+            span.name = f"{request.method} {route.path}"
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+        elif request.method == "GET" and route is not None and route.path in UNRECORDED_ROUTES:
+            # 状态轮询、健康检查不保存 span
+            span.recorded = False
+        response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
+@app.get("/ready")
+async def ready():
+    """就绪检查：所选提供方全部预热成功前返回 503（附各提供方的失败原因），失败的提供方在下次检查时重试"""
+    global warm_up_task
+    if not startup_report["ready"]:
+        if startup_report["provider_errors"] and (warm_up_task is None or warm_up_task.done()):
+            warm_up_task = asyncio.create_task(warm_up_providers(list(startup_report["provider_errors"])))
+        raise HTTPException(status_code=503, detail=startup_report)
+    return startup_report
 
 @app.get("/")
 async def root():
@@ -136,12 +320,131 @@ async def root():
     return {
         "status": "healthy",
         "service": "Veritas API",
-        "version": "0.1.0"
+        "version": "0.1.0",
+        # 分析在请求内同步完成，没有投机预取和取消接口（前端据此跳过这两类请求）
+        "features": []
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def export_metrics():
+    """Prometheus 格式指标"""
+    return metrics.render()
+
+@app.get("/api/routing")
+async def get_routing_stats():
+    """各路由的延迟/错误率 EWMA 以及各 protocol 当前的候选顺序"""
+    return router.stats()
+
+@app.get("/api/traces/{trace_id}")
+async def get_trace_spans(trace_id: str):
+    """最近的 trace 中已结束的 span（OTLP JSON 格式，按开始时间排序）"""
+    spans = get_trace(trace_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return {"trace_id": trace_id, "spans": spans}
+
+@app.get("/api/usage")
+async def get_usage(job_id: Optional[str] = None):
+    """Token 用量统计（按 protocol / ticker / 天，可选指定 job）"""
+    usage = token_ledger.summary()
+    if job_id:
+        usage["job"] = token_ledger.by_job.get(job_id)
+    return usage
+
+@app.get("/api/profiles/{profile_id}", response_class=PlainTextResponse)
+async def download_profile(request: Request, profile_id: str):
+    """下载剖析结果（collapsed stack 格式，需 X-Profile-Token）"""
+    if not profiling_authorized(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Profiling not authorized")
+    if profile_id not in profiles:
+        raise HTTPException(status_code=404, detail="Profile not found or not finished yet")
+    return profiles[profile_id]
+
+@app.get("/api/companies/search")
+async def search_companies(
+    q: str = Query(..., min_length=1, description="ticker、英文名或中文名"),
+    limit: int = Query(default=10, ge=1, le=50),
+    sic: Optional[str] = Query(default=None, description="SIC 代码，逗号分隔；all 表示不过滤"),
+):
+    """公司检索（用于搜索框自动补全）"""
+    if sic == "all":
+        sic_codes = None
+    elif sic:
+        sic_codes = [code.strip() for code in sic.split(",") if code.strip()]
+    else:
+        sic_codes = BIOTECH_SIC_CODES
+
+    if not company_registry.loaded:
+        await asyncio.to_thread(company_registry.load)
+    results = company_registry.search(q, limit=limit, sic_codes=sic_codes)
+    return {
+        "query": q,
+        "results": results,
+        "total": len(results)
     }
 
+@app.get("/api/companies/{ticker}/history")
+async def get_company_history(
+    request: Request,
+    ticker: str,
+    as_of: Optional[str] = Query(default=None, description="ISO 日期或时间，返回该时间点的分析快照（默认最新）"),
+    filing: Optional[str] = Query(default=None, description="只看指定财报的快照，如 10-K 2024-02-28"),
+    limit: int = Query(default=20, ge=1, le=200),
+    fields: Optional[str] = Query(default=None, description="只返回快照 result 中的指定字段，如 analysis.survival"),
+):
+    """历史分析快照（本地归档，不调用 LLM）：快照列表 + as_of 时间点的完整结果"""
+    try:
+        as_of_ts = parse_as_of(as_of) if as_of else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid as_of: {as_of}")
+
+    snapshot = await asyncio.to_thread(archive.snapshot, ticker, as_of_ts, filing)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"No archived analysis for {ticker.upper()}")
+    paths = parse_fields(fields)
+    if paths:
+        snapshot["result"] = project_fields(snapshot["result"], paths)
+
+    snapshots = await asyncio.to_thread(archive.history, ticker, filing, limit)
+    return json_response(request, {
+        "ticker": ticker.upper(),
+        "as_of": as_of,
+        "snapshot": snapshot,
+        "snapshots": snapshots
+    })
+
+@app.get("/api/companies/{ticker}/history/diff")
+async def diff_company_history(
+    ticker: str,
+    from_id: int = Query(..., alias="from", description="起始快照 ID"),
+    to_id: int = Query(..., alias="to", description="目标快照 ID"),
+):
+    """两个历史快照之间的字段级差异"""
+    diff = await asyncio.to_thread(archive.diff, ticker, from_id, to_id)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return diff
+
 @app.get("/api/companies/{ticker}")
-async def get_company(ticker: str):
-    """获取公司基本信息"""
+async def get_company_endpoint(
+    request: Request,
+    ticker: str,
+    fields: Optional[str] = Query(default=None, description="只返回指定字段，逗号分隔"),
+):
+    """获取公司基本信息（支持 ETag/304 与字段投影）"""
+    company = await get_company(ticker)
+    paths = parse_fields(fields)
+    return json_response(request, project_fields(company, paths) if paths else company)
+
+async def get_company(ticker: str) -> Dict[str, Any]:
+    """按 ticker 查找公司信息"""
+    # 注册表命中时直接返回，不再为每次查询阻塞调用 sec-api
+    if not company_registry.loaded:
+        await asyncio.to_thread(company_registry.load)
+    entry = company_registry.get(ticker)
+    if entry:
+        return entry
+
     try:
         # 查询最新的 10-K 文件
         query = {
@@ -151,7 +454,8 @@ async def get_company(ticker: str):
             "sort": [{"filedAt": {"order": "desc"}}]
         }
 
-        filings = sec_query_api.get_filings(query)
+        sec_query_api = await get_provider_async("sec")
+        filings = await asyncio.to_thread(sec_query_api.get_filings, query)
 
         if not filings or len(filings.get("filings", [])) == 0:
             raise HTTPException(status_code=404, detail=f"No filings found for {ticker}")
@@ -176,60 +480,122 @@ async def analyze_company(request: AnalyzeRequest):
     """
     分析公司财报（异步任务）
     """
+    if shutdown.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "30"})
+
+    ticker = request.ticker.upper()
+
+    # 重启前中断的同一公司任务正在补跑剩余模块时，直接等待它完成（客户端重试时不重复付费）
+    resuming = next(
+        (task for resumed_id, task in resuming_jobs.items() if analysis_jobs[resumed_id]["ticker"] == ticker and not task.done()),
+        None
+    )
+    if resuming is not None:
+        job_id = await asyncio.shield(resuming)
+        return AnalyzeResponse(
+            job_id=job_id,
+            status=analysis_jobs[job_id]["status"],
+            ticker=ticker,
+            message="Resumed interrupted analysis"
+        )
+
     try:
         job_id = str(uuid.uuid4())
 
         # 创建分析任务
         analysis_jobs[job_id] = {
             "status": "processing",
-            "ticker": request.ticker.upper(),
+            "ticker": ticker,
             "created_at": datetime.now().isoformat(),
             "result": None,
-            "error": None
+            "error": None,
+            "trace_id": current_span().trace_id if current_span() else None
         }
+        checkpoints.create_job(
+            job_id, ticker, ANALYSIS_SECTIONS, filing_type=request.filing_type, created_at=analysis_jobs[job_id]["created_at"]
+        )
 
         # 在后台执行分析（简化版，实际应使用 Celery 等任务队列）
-        try:
-            result = await perform_analysis(request.ticker, request.filing_type)
-            analysis_jobs[job_id]["status"] = "completed"
-            analysis_jobs[job_id]["result"] = result
-        except Exception as e:
-            analysis_jobs[job_id]["status"] = "failed"
-            analysis_jobs[job_id]["error"] = str(e)
+        await run_analysis_job(job_id, request.ticker, request.filing_type)
 
         return AnalyzeResponse(
             job_id=job_id,
             status="processing",
-            ticker=request.ticker.upper(),
+            ticker=ticker,
             message="Analysis started"
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def run_analysis_job(job_id: str, ticker: str, filing_type: str = "10-K", completed: Optional[Dict[str, Any]] = None) -> str:
+    """执行分析任务并记录最终状态；completed 为检查点中已完成的模块"""
+    job = analysis_jobs[job_id]
+    with start_span("analysis.job", **{"job.id": job_id, "ticker": ticker.upper()}) as span:
+        try:
+            job["result"] = await perform_analysis(ticker, filing_type, job_id=job_id, completed=completed)
+            job["status"] = "completed"
+            await asyncio.to_thread(archive.record, job["result"])
+        except asyncio.CancelledError:
+            # 停机时被中断：保留检查点，下次启动时继续
+            job["status"] = "cancelled"
+            job["error"] = "Analysis interrupted by shutdown"
+            raise
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            span.set_error(str(e))
+        finally:
+            if resuming_jobs.get(job_id) is asyncio.current_task():
+                del resuming_jobs[job_id]
+            if job["status"] != "cancelled":
+                await asyncio.to_thread(checkpoints.finish_job, job_id, job["status"], job["error"])
+    return job_id
+
 @app.get("/api/analyze/{job_id}", response_model=AnalysisResult)
-async def get_analysis_result(job_id: str):
-    """查询分析结果"""
+async def get_analysis_result(
+    request: Request,
+    job_id: str,
+    fields: Optional[str] = Query(default=None, description="只返回 result 中的指定字段，如 analysis.survival"),
+):
+    """查询分析结果（支持 ETag/304 与字段投影）"""
     if job_id not in analysis_jobs:
         raise HTTPException(status_code=404, detail="Job not found")
 
     job = analysis_jobs[job_id]
+    paths = parse_fields(fields)
 
-    return AnalysisResult(
-        job_id=job_id,
-        status=job["status"],
-        ticker=job["ticker"],
-        result=job.get("result"),
-        error=job.get("error")
-    )
+    def payload() -> Dict[str, Any]:
+        result = job.get("result")
+        if result is not None and paths:
+            result = project_fields(result, paths)
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "ticker": job["ticker"],
+            "result": result,
+            "error": job.get("error"),
+            "trace_id": job.get("trace_id")
+        }
 
-async def perform_analysis(ticker: str, filing_type: str = "10-K") -> Dict[str, Any]:
+    # 任务结果只会整体替换（不会原地修改），状态、结果对象、错误和投影字段确定一个响应版本；
+    # 轮询时版本不变则不再序列化和哈希整个结果
+    version = ("job", job_id, job["status"], id(job.get("result")), job.get("error"), fields)
+    return json_response(request, payload, version=version)
+
+async def perform_analysis(
+    ticker: str,
+    filing_type: str = "10-K",
+    job_id: Optional[str] = None,
+    completed: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """
-    执行完整的财报分析
+    执行完整的财报分析（completed 中已有的模块不再调用）
     """
     # 1. 获取财报数据 - 先尝试 10-K，如果没有则尝试 20-F（外国公司年报）
     filing = None
     actual_filing_type = filing_type
 
+    sec_query_api = await get_provider_async("sec")
     for form_type in [filing_type, "20-F", "10-K"]:
         query = {
             "query": f"ticker:{ticker.upper()} AND formType:\"{form_type}\"",
@@ -237,7 +603,9 @@ async def perform_analysis(ticker: str, filing_type: str = "10-K") -> Dict[str,
             "size": "1",
             "sort": [{"filedAt": {"order": "desc"}}]
         }
-        filings = sec_query_api.get_filings(query)
+        with start_span("sec.get_filings", kind=SPAN_KIND_CLIENT, ticker=ticker.upper(), **{"sec.form_type": form_type}) as span:
+            filings = await asyncio.to_thread(sec_query_api.get_filings, query)
+            span.set_attribute("sec.filing_count", len((filings or {}).get("filings", [])))
         if filings and len(filings.get("filings", [])) > 0:
             filing = filings["filings"][0]
             actual_filing_type = form_type
@@ -251,26 +619,28 @@ async def perform_analysis(ticker: str, filing_type: str = "10-K") -> Dict[str,
     filing_url = filing.get("linkToFilingDetails", "")
 
     # 3. 调用 AI API 进行分析（根据配置使用 Claude/Gemini/双引擎）
-    # Protocol A: 业务实质还原
-    reality_text = await analyze_with_ai(
-        PROTOCOL_A,
-        f"Company: {company_name} ({ticker})\nAnalyze the business identity."
-    )
-    reality_json = extract_json_from_text(reality_text)
-
-    # Protocol B: 财务生存透视
-    survival_text = await analyze_with_ai(
-        PROTOCOL_B,
-        f"Company: {company_name} ({ticker})\nAnalyze financial survival."
-    )
-    survival_json = extract_json_from_text(survival_text)
-
-    # Protocol C: 战场推演
-    competition_text = await analyze_with_ai(
-        PROTOCOL_C,
-        f"Company: {company_name} ({ticker})\nAnalyze competitive landscape."
-    )
-    competition_json = extract_json_from_text(competition_text)
+    # 依次执行各 Protocol（A: 业务实质还原，B: 财务生存透视，C: 战场推演），
+    # 每个模块完成后立即写检查点，已有检查点的模块不再调用
+    completed = completed or {}
+    sections = {}
+    for section, (protocol, task) in ANALYSIS_SECTIONS.items():
+        if section in completed:
+            sections[section] = completed[section]
+            continue
+        # 每次调用前检查预算（前面模块的实际用量已计入）
+        token_ledger.check_budget(job_id)
+        text = await analyze_with_ai(
+            protocol,
+            f"Company: {company_name} ({ticker})\n{task}",
+            protocol_name=section,
+            ticker=ticker,
+            job_id=job_id
+        )
+        sections[section] = extract_json_from_text(text)
+        # 调用失败或无法解析（空结果）的模块不写检查点，恢复时重新调用
+        if job_id and sections[section]:
+            await asyncio.to_thread(checkpoints.save_section, job_id, section, sections[section])
+    reality_json, survival_json, competition_json = sections["reality"], sections["survival"], sections["competition"]
 
     # 构建符合前端期望的数据结构
     return {
@@ -300,42 +670,101 @@ async def perform_analysis(ticker: str, filing_type: str = "10-K") -> Dict[str,
         }
     }
 
-async def analyze_with_claude(protocol: str, context: str) -> str:
+async def analyze_with_claude(protocol: str, context: str, protocol_name: str = "", ticker: Optional[str] = None, job_id: Optional[str] = None, model: str = "claude-3-5-sonnet-20241022") -> str:
     """
     使用 Claude API 进行分析
     """
-    try:
-        message = anthropic_client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=2048,
-            messages=[{
-                "role": "user",
-                "content": f"{protocol}\n\n{context}"
-            }]
-        )
-
-        return message.content[0].text
-    except Exception as e:
-        return f"Claude analysis failed: {str(e)}"
+    with start_span(
+        "llm.analyze_with_claude",
+        kind=SPAN_KIND_CLIENT,
+        ticker=ticker,
+        **{"gen_ai.system": "anthropic", "gen_ai.request.model": model, "llm.protocol": protocol_name}
+    ) as span:
+        try:
+            anthropic_client = await get_provider_async("claude")
+            message = await asyncio.to_thread(
+                anthropic_client.messages.create,
+                model=model,
+                max_tokens=token_ledger.max_tokens_for(protocol_name, job_id),
+                messages=[{
+                    "role": "user",
+                    "content": f"{protocol}\n\n{context}"
+                }]
+            )
+
+            cached_tokens = getattr(message.usage, "cache_read_input_tokens", None) or 0
+            token_ledger.record(
+                protocol_name,
+                input_tokens=message.usage.input_tokens,
+                output_tokens=message.usage.output_tokens,
+                cached_tokens=cached_tokens,
+                ticker=ticker,
+                job_id=job_id
+            )
+            if message.stop_reason == "max_tokens":
+                metrics.inc("llm_truncated_total", protocol=protocol_name)
+            span.set_attributes(**{
+                "gen_ai.response.finish_reasons": message.stop_reason,
+                "gen_ai.usage.input_tokens": message.usage.input_tokens,
+                "gen_ai.usage.output_tokens": message.usage.output_tokens,
+                "gen_ai.usage.cache_read_input_tokens": cached_tokens,
+                "llm.cache_hit": cached_tokens > 0
+            })
+
+            return message.content[0].text
+        except Exception as e:
+            span.set_error(str(e))
+            return f"Claude analysis failed: {str(e)}"
 
-async def analyze_with_gemini(protocol: str, context: str) -> str:
+async def analyze_with_gemini(protocol: str, context: str, protocol_name: str = "", ticker: Optional[str] = None, job_id: Optional[str] = None, model: str = "gemini-2.0-flash") -> str:
     """
     使用 Gemini API 进行分析
     """
-    try:
-        response = gemini_model.generate_content(f"{protocol}\n\n{context}")
-        return response.text
-    except Exception as e:
-        return f"Gemini analysis failed: {str(e)}"
+    with start_span(
+        "llm.analyze_with_gemini",
+        kind=SPAN_KIND_CLIENT,
+        ticker=ticker,
+        **{"gen_ai.system": "gemini", "gen_ai.request.model": model, "llm.protocol": protocol_name}
+    ) as span:
+        try:
+            genai = await get_provider_async("gemini")
+            gemini_model = genai.GenerativeModel(model)
+            response = await asyncio.to_thread(
+                gemini_model.generate_content,
+                f"{protocol}\n\n{context}",
+                generation_config={"max_output_tokens": token_ledger.max_tokens_for(protocol_name, job_id)}
+            )
+
+            usage = response.usage_metadata
+            cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+            token_ledger.record(
+                protocol_name,
+                input_tokens=usage.prompt_token_count,
+                output_tokens=usage.candidates_token_count,
+                cached_tokens=cached_tokens,
+                ticker=ticker,
+                job_id=job_id
+            )
+            span.set_attributes(**{
+                "gen_ai.usage.input_tokens": usage.prompt_token_count,
+                "gen_ai.usage.output_tokens": usage.candidates_token_count,
+                "gen_ai.usage.cache_read_input_tokens": cached_tokens,
+                "llm.cache_hit": cached_tokens > 0
+            })
+
+            return response.text
+        except Exception as e:
+            span.set_error(str(e))
+            return f"Gemini analysis failed: {str(e)}"
 
-async def analyze_with_dual_engine(protocol: str, context: str) -> str:
+async def analyze_with_dual_engine(protocol: str, context: str, **usage_tags) -> str:
     """
     双引擎并行调用，使用先返回的结果
     """
     try:
         # 创建两个并行任务
-        claude_task = asyncio.create_task(analyze_with_claude(protocol, context))
-        gemini_task = asyncio.create_task(analyze_with_gemini(protocol, context))
+        claude_task = asyncio.create_task(analyze_with_claude(protocol, context, **usage_tags))
+        gemini_task = asyncio.create_task(analyze_with_gemini(protocol, context, **usage_tags))
 
         # 等待第一个完成的任务
         done, pending = await asyncio.wait(
@@ -353,18 +782,44 @@ async def analyze_with_dual_engine(protocol: str, context: str) -> str:
         return result
     except Exception as e:
         # 如果并行失败，回退到 Claude
-        return await analyze_with_claude(protocol, context)
+        return await analyze_with_claude(protocol, context, **usage_tags)
 
-async def analyze_with_ai(protocol: str, context: str) -> str:
+# 路由表中的提供方 -> 对应的调用函数
+ROUTE_HANDLERS = {
+    "anthropic": analyze_with_claude,
+    "gemini": analyze_with_gemini,
+}
+
+async def analyze_with_routing(protocol: str, context: str, **usage_tags) -> str:
+    """
+    按路由表为该 protocol 选择满足质量等级、当前最快且健康的提供方/模型
+    """
+    protocol_name = usage_tags.get("protocol_name", "")
+    route = router.choose(protocol_name, providers=ROUTE_HANDLERS.keys())
+    if route is None:
+        return await analyze_with_claude(protocol, context, **usage_tags)
+
+    target = router.routes[route]
+    started = time.perf_counter()
+    text = await ROUTE_HANDLERS[target["provider"]](protocol, context, model=target["model"], **usage_tags)
+    failed = text.startswith(("Claude analysis failed", "Gemini analysis failed"))
+    router.record(route, time.perf_counter() - started, ok=not failed)
+    return text
+
+async def analyze_with_ai(protocol: str, context: str, **usage_tags) -> str:
     """
     根据配置选择 AI 引擎
+
+    usage_tags（protocol_name / ticker / job_id）用于 token 用量统计与自适应 max_tokens
     """
-    if AI_ENGINE == "gemini":
-        return await analyze_with_gemini(protocol, context)
+    if AI_ENGINE == "auto":
+        return await analyze_with_routing(protocol, context, **usage_tags)
+    elif AI_ENGINE == "gemini":
+        return await analyze_with_gemini(protocol, context, **usage_tags)
     elif AI_ENGINE == "dual":
-        return await analyze_with_dual_engine(protocol, context)
+        return await analyze_with_dual_engine(protocol, context, **usage_tags)
     else:  # 默认使用 claude
-        return await analyze_with_claude(protocol, context)
+        return await analyze_with_claude(protocol, context, **usage_tags)
 
 if __name__ == "__main__":
     import uvicorn
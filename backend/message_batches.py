@@ -0,0 +1,91 @@
+"""
+Anthropic Message Batches API 客户端
+
+批量任务异步执行、价格更低且不占用实时调用的并发额度，适合全量定时刷新。
+可以通过 ANTHROPIC_BATCH_BASE_URL 指向本地的替代服务（例如测试用的 stand-in，见 tests/standin.py）。
+"""
+import json
+import os
+from typing import Optional, Dict, Any, List
+
+import httpx
+
+
+class MessageBatchError(Exception):
+    pass
+
+
+class MessageBatchClient:
+    def __init__(self, api_key: str, base_url: Optional[str] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.api_key = api_key
+        # 测试时可传入 httpx.ASGITransport，直接调用进程内的 stand-in
+        self._transport = transport
+        self.base_url = base_url or os.getenv(
+            "ANTHROPIC_BATCH_BASE_URL",
+            os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+        )
+
+    def _client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=self._transport)
+
+    @property
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+
+    async def create(self, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """提交批量请求，requests 中每项为 {"custom_id": ..., "params": Messages API 请求体}"""
+        async with self._client() as client:
+            response = await client.post(
+                f"{self.base_url}/v1/messages/batches",
+                headers=self._headers,
+                json={"requests": requests},
+                timeout=60.0
+            )
+        if response.status_code != 200:
+            raise MessageBatchError(f"Batch create failed: {response.status_code} - {response.text[:200]}")
+        return response.json()
+
+    async def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        async with self._client() as client:
+            response = await client.get(
+                f"{self.base_url}/v1/messages/batches/{batch_id}",
+                headers=self._headers,
+                timeout=30.0
+            )
+        if response.status_code != 200:
+            raise MessageBatchError(f"Batch retrieve failed: {response.status_code} - {response.text[:200]}")
+        return response.json()
+
+    async def results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        下载已结束批次的结果（JSONL），返回 custom_id -> result。
+        无法解析或缺少字段的行直接跳过，对应的请求由调用方按缺失处理（回退到实时调用）。
+        """
+        results_url = batch.get("results_url") or f"{self.base_url}/v1/messages/batches/{batch['id']}/results"
+        async with self._client() as client:
+            response = await client.get(results_url, headers=self._headers, timeout=120.0)
+        if response.status_code != 200:
+            raise MessageBatchError(f"Batch results failed: {response.status_code} - {response.text[:200]}")
+
+        results = {}
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                results[item["custom_id"]] = item["result"]
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Skipping malformed batch result line: {line[:200]} ({type(e).__name__})")
+        return results
+
+    async def cancel(self, batch_id: str):
+        async with self._client() as client:
+            await client.post(
+                f"{self.base_url}/v1/messages/batches/{batch_id}/cancel",
+                headers=self._headers,
+                timeout=30.0
+            )
@@ -0,0 +1,64 @@
+"""
+进程内指标 - 计数器 / 仪表 / 汇总，以 Prometheus 文本格式从 /metrics 导出
+
+不依赖 prometheus_client，只覆盖本服务用到的最小子集。
+"""
+from typing import Dict, Tuple
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+_counters: Dict[str, Dict[_Labels, float]] = {}
+_gauges: Dict[str, Dict[_Labels, float]] = {}
+_summaries: Dict[str, Dict[_Labels, Tuple[int, float]]] = {}
+_help: Dict[str, str] = {}
+
+
+def _key(labels: Dict[str, str]) -> _Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def describe(name: str, text: str):
+    _help[name] = text
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    series = _counters.setdefault(name, {})
+    key = _key(labels)
+    series[key] = series.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    _gauges.setdefault(name, {})[_key(labels)] = value
+
+
+def observe(name: str, value: float, **labels):
+    series = _summaries.setdefault(name, {})
+    key = _key(labels)
+    count, total = series.get(key, (0, 0.0))
+    series[key] = (count + 1, total + value)
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def render() -> str:
+    """导出 Prometheus 文本格式"""
+    lines = []
+    for kind, store in (("counter", _counters), ("gauge", _gauges)):
+        for name, series in sorted(store.items()):
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for name, series in sorted(_summaries.items()):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} summary")
+        for labels, (count, total) in series.items():
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+    return "\n".join(lines) + "\n"
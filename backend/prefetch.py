@@ -0,0 +1,90 @@
+"""
+投机预取 - 用户查看公司（GET /api/companies/{ticker}?prefetch=1）或在搜索框中选中公司时，
+在其点击"分析"之前以 background 优先级提前开始工作：预热上游连接、获取 SEC 财报元数据，
+重点跟踪公司还会直接启动一次填充缓存的完整分析。随后的 POST /api/analyze 接管这些工作。
+
+同时进行的预取数量有上限（PREFETCH_MAX_INFLIGHT），超过 PREFETCH_TTL_SECONDS 仍未被接管的
+预取会被取消（已完成的直接丢弃），因此预取本身的成本很低。
+"""
+import asyncio
+import os
+import time
+from typing import Optional, Dict, Any, Callable
+
+import metrics
+
+PREFETCH_MAX_INFLIGHT = int(os.getenv("PREFETCH_MAX_INFLIGHT", "2"))
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", "120"))
+
+metrics.describe("prefetch_started_total", "Speculative prefetches started, by kind")
+metrics.describe("prefetch_skipped_total", "Speculative prefetches not started, by reason")
+metrics.describe("prefetch_claimed_total", "Speculative prefetches taken over by an analysis request, by kind")
+metrics.describe("prefetch_cancelled_total", "Unused speculative prefetches cancelled or dropped, by kind")
+
+
+class SpeculativePrefetcher:
+    def __init__(self, max_inflight: int = PREFETCH_MAX_INFLIGHT, ttl: float = PREFETCH_TTL_SECONDS):
+        self.max_inflight = max_inflight
+        self.ttl = ttl
+        # ticker -> {"kind", "task", "job_id", "started_at"}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    def inflight(self) -> int:
+        return sum(1 for entry in self._entries.values() if not entry["task"].done())
+
+    def start(self, ticker: str, kind: str, launch: Callable[[], asyncio.Task], job_id: Optional[str] = None) -> bool:
+        """
+        开始一项预取；launch 创建并返回执行预取的任务。
+        同一公司已有预取或已达上限时不启动，返回 False。
+        """
+        if ticker in self._entries:
+            metrics.inc("prefetch_skipped_total", reason="duplicate")
+            return False
+        if self.inflight() >= self.max_inflight:
+            metrics.inc("prefetch_skipped_total", reason="capacity")
+            return False
+
+        entry = {
+            "kind": kind,
+            "task": launch(),
+            "job_id": job_id,
+            "started_at": time.time(),
+        }
+        self._entries[ticker] = entry
+        asyncio.get_running_loop().call_later(self.ttl, self._expire, ticker, entry)
+        metrics.inc("prefetch_started_total", kind=kind)
+        return True
+
+    def claim(self, ticker: str, kind: str) -> Optional[Dict[str, Any]]:
+        """接管某公司指定类型的预取（接管后不再过期取消）"""
+        entry = self._entries.get(ticker)
+        if entry is None or entry["kind"] != kind:
+            return None
+        del self._entries[ticker]
+        metrics.inc("prefetch_claimed_total", kind=kind)
+        return entry
+
+    def _expire(self, ticker: str, entry: Dict[str, Any]):
+        if self._entries.get(ticker) is not entry:
+            return
+        del self._entries[ticker]
+        if not entry["task"].done():
+            entry["task"].cancel()
+        metrics.inc("prefetch_cancelled_total", kind=entry["kind"])
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "max_inflight": self.max_inflight,
+            "ttl_seconds": self.ttl,
+            "inflight": self.inflight(),
+            "pending": {
+                ticker: {
+                    "kind": entry["kind"],
+                    "job_id": entry["job_id"],
+                    "done": entry["task"].done(),
+                    "age_seconds": round(now - entry["started_at"], 1),
+                }
+                for ticker, entry in self._entries.items()
+            },
+        }
@@ -0,0 +1,78 @@
+"""
+AI / 数据提供方注册表
+
+各 SDK（anthropic、google.generativeai、sec_api）只在第一次被选用时才导入并创建客户端，
+AI_ENGINE 只选了一个引擎时，另一个引擎的导入和初始化开销完全不用付。
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, Any
+
+# 提供方名称 -> 工厂函数（函数内部才 import 对应 SDK）
+_factories: Dict[str, Callable[[], Any]] = {}
+_instances: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+# 启动耗时报告：各提供方的导入+初始化耗时（毫秒）
+init_timings: Dict[str, float] = {}
+
+
+def register_provider(name: str):
+    """注册提供方工厂函数"""
+    def decorator(factory: Callable[[], Any]):
+        _factories[name] = factory
+        return factory
+    return decorator
+
+
+def get_provider(name: str) -> Any:
+    """获取提供方客户端，首次调用时导入 SDK 并初始化"""
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+
+    with _lock:
+        if name not in _instances:
+            if name not in _factories:
+                raise KeyError(f"Unknown provider: {name}")
+            started = time.perf_counter()
+            _instances[name] = _factories[name]()
+            init_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+            print(f"Provider {name} initialized in {init_timings[name]} ms")
+        return _instances[name]
+
+
+def is_initialized(name: str) -> bool:
+    return name in _instances
+
+
+@register_provider("claude")
+def _create_claude():
+    import anthropic
+    return anthropic.Anthropic(
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        base_url=os.getenv("ANTHROPIC_BASE_URL")
+    )
+
+
+@register_provider("gemini")
+def _create_gemini():
+    # 返回已配置的 SDK 模块，调用方按路由选择的模型创建 GenerativeModel
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai
+
+
+@register_provider("sec")
+def _create_sec_query_api():
+    from sec_api import QueryApi
+    return QueryApi(api_key=os.getenv("SEC_API_KEY"))
+
+
+async def get_provider_async(name: str) -> Any:
+    """异步获取提供方，尚未初始化时在线程中导入 SDK，避免阻塞事件循环"""
+    if name in _instances:
+        return _instances[name]
+    return await asyncio.to_thread(get_provider, name)
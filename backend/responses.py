@@ -0,0 +1,175 @@
+"""
+JSON 响应工具 - 字段投影、强 ETag / 304、按 Accept-Encoding 压缩
+
+前端轮询 /api/analyze/{job_id} 时，结果未变化直接返回 304，不再重复传输和序列化整个嵌套结果。
+"""
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Hashable, List, Tuple, Union
+
+from fastapi import Request, Response
+
+try:
+    import orjson
+except ImportError:  # 未安装时回退到标准库 json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 超过该字节数的响应才压缩
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# 已压缩响应体缓存：(ETag, 编码) -> 压缩后字节，轮询同一结果时不重复压缩
+_COMPRESSED_CACHE_SIZE = 256
+_compressed_cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+_ENCODING_SUFFIX = {"identity": "", "gzip": "-gz", "br": "-br"}
+
+# 按内容版本缓存的 (摘要, 响应体)：调用方提供 version 时，同一版本的重复轮询（包括 304）
+# 不再序列化和哈希整个结果
+_VERSION_CACHE_SIZE = 1024
+_version_cache: "OrderedDict[Hashable, Tuple[str, bytes]]" = OrderedDict()
+
+
+def dumps(payload: Any) -> bytes:
+    """序列化 JSON，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """解析 fields 参数，如 "analysis.survival,company_name" """
+    if not fields:
+        return None
+    paths = [path.strip() for path in fields.split(",") if path.strip()]
+    return paths or None
+
+
+def project_fields(data: Dict[str, Any], paths: List[str]) -> Dict[str, Any]:
+    """按点号路径只保留指定字段，不存在的路径直接忽略"""
+    projected: Dict[str, Any] = {}
+    for path in paths:
+        keys = path.split(".")
+        value: Any = data
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return projected
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """解析 Accept-Encoding，返回 编码 -> q 值（如 "br;q=0, gzip" -> {"br": 0.0, "gzip": 1.0}）"""
+    accepted: Dict[str, float] = {}
+    for part in header.lower().split(","):
+        name, _, params = part.partition(";")
+        name = name.strip()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def _negotiate_encoding(request: Request) -> str:
+    """选择 q 值最高的可用压缩编码（q=0 表示拒绝，"*" 匹配未列出的编码），同分时优先 br"""
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = "identity", 0.0
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compress(etag: str, encoding: str, body: bytes) -> bytes:
+    key = (etag, encoding)
+    cached = _compressed_cache.get(key)
+    if cached is not None:
+        _compressed_cache.move_to_end(key)
+        return cached
+
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=4)
+    else:
+        compressed = gzip.compress(body, compresslevel=5)
+
+    _compressed_cache[key] = compressed
+    if len(_compressed_cache) > _COMPRESSED_CACHE_SIZE:
+        _compressed_cache.popitem(last=False)
+    return compressed
+
+
+def _serialize(payload: Union[Any, Callable[[], Any]], version: Optional[Hashable]) -> Tuple[str, bytes]:
+    if version is not None:
+        cached = _version_cache.get(version)
+        if cached is not None:
+            _version_cache.move_to_end(version)
+            return cached
+
+    body = dumps(payload() if callable(payload) else payload)
+    entry = (hashlib.blake2b(body, digest_size=16).hexdigest(), body)
+    if version is not None:
+        _version_cache[version] = entry
+        if len(_version_cache) > _VERSION_CACHE_SIZE:
+            _version_cache.popitem(last=False)
+    return entry
+
+
+def json_response(
+    request: Request,
+    payload: Union[Any, Callable[[], Any]],
+    status_code: int = 200,
+    version: Optional[Hashable] = None
+) -> Response:
+    """
+    返回带强 ETag 的 JSON 响应
+
+    If-None-Match 命中时返回 304；响应体超过阈值且客户端支持时使用 br/gzip 压缩。
+    同一内容的不同压缩编码使用不同的 ETag 后缀，比较时视为同一版本。
+    version 为能标识内容版本的 key（内容变化时必须随之变化）：同一版本直接复用缓存的 ETag 和响应体，
+    此时 payload 可以是返回内容的函数，缓存命中时不会调用。
+    """
+    digest, body = _serialize(payload, version)
+
+    encoding = _negotiate_encoding(request) if len(body) >= COMPRESSION_MIN_SIZE else "identity"
+    etag = f'"{digest}{_ENCODING_SUFFIX[encoding]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in candidates or any(f'"{digest}{suffix}"' in candidates for suffix in _ENCODING_SUFFIX.values()):
+            return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        body = _compress(etag, encoding, body)
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,125 @@
+"""
+按 protocol 的提供方/模型路由
+
+每个 protocol 有一个质量等级要求（PROTOCOL_TIERS），每条路由（提供方 + 模型）有一个质量等级。
+请求会在满足等级要求的路由中，选择当前延迟 EWMA 最低且健康（错误率 EWMA 低于阈值）的一条。
+路由表可以通过 ROUTING_TABLE 环境变量（JSON）覆盖。
+"""
+import json
+import os
+import time
+from typing import Optional, Dict, Any, List, Iterable
+
+import metrics
+
+# 路由名 -> 提供方、模型、质量等级（数字越大质量越高）
+DEFAULT_ROUTES = {
+    "claude-sonnet": {"provider": "anthropic", "model": os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514"), "tier": 2},
+    "claude-haiku": {"provider": "anthropic", "model": os.getenv("ANTHROPIC_FAST_MODEL", "claude-3-5-haiku-20241022"), "tier": 1},
+    "gemini-flash": {"provider": "gemini", "model": os.getenv("GEMINI_MODEL", "gemini-2.0-flash"), "tier": 1},
+}
+
+# 各 protocol 需要的最低质量等级：简单的数据提取（history）不需要与战略推理相同的模型
+DEFAULT_PROTOCOL_TIERS = {
+    "reality": 2,
+    "survival": 2,
+    "competition": 2,
+    "history": 1,
+    "pipeline": 2,
+}
+
+EWMA_ALPHA = 0.2
+MAX_ERROR_RATE = 0.5
+# 不健康的路由冷却该秒数后允许试探一次
+UNHEALTHY_COOLDOWN = 30.0
+
+metrics.describe("route_decisions_total", "Routing decisions, by protocol and chosen route")
+metrics.describe("route_latency_seconds", "Latency of routed provider calls")
+metrics.describe("route_ewma_latency_seconds", "EWMA latency per route")
+metrics.describe("route_error_rate", "EWMA error rate per route")
+
+
+def _load_table() -> Dict[str, Any]:
+    raw = os.getenv("ROUTING_TABLE")
+    if not raw:
+        return {"routes": DEFAULT_ROUTES, "protocol_tiers": DEFAULT_PROTOCOL_TIERS}
+    table = json.loads(raw)
+    return {
+        "routes": table.get("routes", DEFAULT_ROUTES),
+        "protocol_tiers": table.get("protocol_tiers", DEFAULT_PROTOCOL_TIERS),
+    }
+
+
+class Router:
+    def __init__(self, routes: Optional[Dict[str, Dict[str, Any]]] = None, protocol_tiers: Optional[Dict[str, int]] = None):
+        table = _load_table()
+        self.routes = routes or table["routes"]
+        self.protocol_tiers = protocol_tiers or table["protocol_tiers"]
+        self._stats: Dict[str, Dict[str, Any]] = {
+            name: {"latency": None, "error_rate": 0.0, "calls": 0, "last_failure": 0.0}
+            for name in self.routes
+        }
+
+    def _healthy(self, name: str) -> bool:
+        stats = self._stats[name]
+        if stats["error_rate"] < MAX_ERROR_RATE:
+            return True
+        return time.monotonic() - stats["last_failure"] >= UNHEALTHY_COOLDOWN
+
+    def candidates(self, protocol: str, providers: Optional[Iterable[str]] = None) -> List[str]:
+        """满足 protocol 质量等级的路由，按（健康、延迟 EWMA）排序；没有样本的路由优先试探"""
+        required = self.protocol_tiers.get(protocol, max(self.protocol_tiers.values(), default=1))
+        allowed = set(providers) if providers is not None else None
+        eligible = [
+            name for name, route in self.routes.items()
+            if route["tier"] >= required and (allowed is None or route["provider"] in allowed)
+        ]
+
+        def key(name: str):
+            stats = self._stats[name]
+            latency = stats["latency"] if stats["latency"] is not None else 0.0
+            return (not self._healthy(name), latency, stats["error_rate"], self.routes[name]["tier"])
+
+        return sorted(eligible, key=key)
+
+    def choose(self, protocol: str, providers: Optional[Iterable[str]] = None) -> Optional[str]:
+        candidates = self.candidates(protocol, providers)
+        if not candidates:
+            return None
+        route = candidates[0]
+        metrics.inc("route_decisions_total", protocol=protocol, route=route)
+        return route
+
+    def record(self, route: str, latency: float, ok: bool):
+        """记录一次调用结果，更新延迟与错误率 EWMA"""
+        stats = self._stats[route]
+        stats["calls"] += 1
+        stats["error_rate"] = (1 - EWMA_ALPHA) * stats["error_rate"] + EWMA_ALPHA * (0.0 if ok else 1.0)
+        if ok:
+            previous = stats["latency"]
+            stats["latency"] = latency if previous is None else (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * latency
+        else:
+            stats["last_failure"] = time.monotonic()
+
+        metrics.observe("route_latency_seconds", latency, route=route, outcome="ok" if ok else "error")
+        if stats["latency"] is not None:
+            metrics.set_gauge("route_ewma_latency_seconds", stats["latency"], route=route)
+        metrics.set_gauge("route_error_rate", stats["error_rate"], route=route)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "routes": {
+                name: {
+                    **route,
+                    "ewma_latency_seconds": round(self._stats[name]["latency"], 3) if self._stats[name]["latency"] is not None else None,
+                    "error_rate": round(self._stats[name]["error_rate"], 3),
+                    "calls": self._stats[name]["calls"],
+                    "healthy": self._healthy(name),
+                }
+                for name, route in self.routes.items()
+            },
+            "protocols": {
+                protocol: {"tier": tier, "candidates": self.candidates(protocol)}
+                for protocol, tier in self.protocol_tiers.items()
+            },
+        }
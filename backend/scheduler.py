@@ -0,0 +1,176 @@
+"""
+按优先级调度 AI 提供方并发槽位
+
+interactive（用户发起的单次分析）、batch（批量分析）、background（定时刷新/预取）三类请求共享同一组
+提供方并发槽位。空出槽位时按权重公平分配（已获得槽位数 / 权重 越小越优先），同时按排队时长做老化补偿，
+保证低优先级请求不会被无限期饿死。
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any
+
+import metrics
+
+PRIORITY_WEIGHTS = {
+    "interactive": 8,
+    "batch": 3,
+    "background": 1,
+}
+
+# 提供方总并发数
+PROVIDER_CONCURRENCY = int(os.getenv("PROVIDER_CONCURRENCY", "8"))
+
+# 排队每满该秒数，相当于少占用了一个"权重单位"的份额
+AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "5"))
+
+metrics.describe("scheduler_queue_wait_seconds", "Time spent waiting for a provider slot, by priority")
+metrics.describe("scheduler_queue_depth", "Requests waiting for a provider slot, by priority")
+metrics.describe("scheduler_slots_in_use", "Provider slots currently in use")
+
+
+def _percentile(samples, q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+class PriorityLimiter:
+    """带优先级、加权公平和老化的并发限制器"""
+
+    def __init__(self, capacity: int = PROVIDER_CONCURRENCY, weights: Optional[Dict[str, int]] = None, aging_seconds: float = AGING_SECONDS):
+        self.capacity = capacity
+        self.weights = weights or PRIORITY_WEIGHTS
+        self.aging_seconds = aging_seconds
+        self.in_use = 0
+        self._waiters: Dict[str, deque] = {c: deque() for c in self.weights}
+        self._served: Dict[str, int] = {c: 0 for c in self.weights}
+        self._wait_samples: Dict[str, deque] = {c: deque(maxlen=500) for c in self.weights}
+
+    def queue_depth(self, priority: Optional[str] = None) -> int:
+        if priority:
+            return len(self._waiters[priority])
+        return sum(len(q) for q in self._waiters.values())
+
+    def _record_wait(self, priority: str, waited: float):
+        self._wait_samples[priority].append(waited)
+        metrics.observe("scheduler_queue_wait_seconds", waited, priority=priority)
+        self._update_gauges()
+
+    def _update_gauges(self):
+        for priority, queue in self._waiters.items():
+            metrics.set_gauge("scheduler_queue_depth", len(queue), priority=priority)
+        metrics.set_gauge("scheduler_slots_in_use", self.in_use)
+
+    async def acquire(self, priority: str = "interactive", key: Optional[str] = None):
+        """key 标识请求所属的任务（如 job_id），用于 promote 提升该任务排队中的请求"""
+        if priority not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        enqueued = time.monotonic()
+        if self.in_use < self.capacity and not self.queue_depth():
+            self.in_use += 1
+            self._served[priority] += 1
+            self._record_wait(priority, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (enqueued, future, key)
+        self._waiters[priority].append(entry)
+        self._update_gauges()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已分配但任务被取消，归还槽位
+                self.release()
+            else:
+                # 排队期间可能已被 promote 到其他优先级
+                for queue in self._waiters.values():
+                    if entry in queue:
+                        queue.remove(entry)
+                        break
+                self._update_gauges()
+            raise
+        self._record_wait(priority, time.monotonic() - enqueued)
+
+    def promote(self, key: str, priority: str):
+        """把某个任务正在排队的请求移到指定优先级（保留原排队时间）"""
+        if priority not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority}")
+        moved = []
+        for current, queue in self._waiters.items():
+            if current == priority:
+                continue
+            matching = [entry for entry in queue if entry[2] == key]
+            for entry in matching:
+                queue.remove(entry)
+            moved.extend(matching)
+        if moved:
+            target = self._waiters[priority]
+            self._waiters[priority] = deque(sorted([*target, *moved], key=lambda entry: entry[0]))
+            self._update_gauges()
+        return len(moved)
+
+    def release(self):
+        self.in_use -= 1
+        self._dispatch()
+
+    def _pick(self) -> Optional[str]:
+        now = time.monotonic()
+        best, best_score = None, None
+        for priority, queue in self._waiters.items():
+            if not queue:
+                continue
+            waited = now - queue[0][0]
+            score = self._served[priority] / self.weights[priority] - waited / self.aging_seconds
+            if best_score is None or score < best_score:
+                best, best_score = priority, score
+        return best
+
+    def _dispatch(self):
+        while self.in_use < self.capacity:
+            priority = self._pick()
+            if priority is None:
+                break
+            _, future, _ = self._waiters[priority].popleft()
+            if future.done():
+                continue
+            self.in_use += 1
+            self._served[priority] += 1
+            future.set_result(None)
+
+        # 没有排队请求时重置份额，避免历史用量长期影响后续分配
+        if not self.queue_depth():
+            for priority in self._served:
+                self._served[priority] = 0
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive", key: Optional[str] = None):
+        await self.acquire(priority, key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        classes = {}
+        for priority, samples in self._wait_samples.items():
+            p50, p95 = _percentile(samples, 0.5), _percentile(samples, 0.95)
+            classes[priority] = {
+                "weight": self.weights[priority],
+                "queued": len(self._waiters[priority]),
+                "wait_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "wait_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "samples": len(samples),
+            }
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "classes": classes,
+        }
@@ -0,0 +1,164 @@
+"""
+跨公司筛选索引
+
+把每家公司最近一次完成的分析结果拆成列式 numpy 数组，筛选、排序都在整列上向量化执行，
+不对每家公司逐个跑 Python 循环。
+"""
+import re
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+# 可筛选的数值字段 -> 在分析结果 analysis 中的位置
+SCREEN_FIELDS = {
+    "reality_gap_score": ("reality", "reality_gap_score"),
+    "quarterly_revenue": ("survival", "quarterly_revenue"),
+    "revenue_change_yoy": ("survival", "revenue_change_yoy"),
+    "net_income": ("survival", "net_income"),
+    "net_income_change": ("survival", "net_income_change"),
+    "cash_position": ("survival", "cash_position"),
+    "cash_change": ("survival", "cash_change"),
+    "runway_months": ("survival", "runway_months"),
+    "rd_intensity": ("survival", "rd_intensity"),
+}
+
+# 可投影但不可筛选的描述字段
+INFO_FIELDS = ("ticker", "company_name", "company_name_cn", "sector", "updated_at")
+
+_OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "=": np.equal,
+    "!=": np.not_equal,
+}
+
+_CONDITION_RE = re.compile(r"^\s*(\w+)\s*(<=|>=|!=|=|<|>)\s*([-+]?\d+(?:\.\d+)?)\s*%?\s*$")
+_NUMBER_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+
+def to_number(value: Any) -> float:
+    """把 AI 返回的数值（18、"+25%"、"65%"）统一转换为 float，无法解析时返回 NaN"""
+    if isinstance(value, bool) or value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value.replace(",", ""))
+        if match:
+            return float(match.group())
+    return np.nan
+
+
+def parse_condition(expression: str) -> Tuple[str, str, float]:
+    """解析筛选条件，如 "runway_months<12"、"rd_intensity>=50" """
+    match = _CONDITION_RE.match(expression)
+    if not match:
+        raise ValueError(f"无法解析筛选条件: {expression}")
+    field, op, value = match.groups()
+    if field not in SCREEN_FIELDS:
+        raise ValueError(f"不支持的筛选字段: {field}")
+    return field, op, float(value)
+
+
+class ScreeningIndex:
+    """列式筛选索引，每个 ticker 占一行，重复写入时原地覆盖"""
+
+    def __init__(self, capacity: int = 1024):
+        self._capacity = capacity
+        self._size = 0
+        self._rows: Dict[str, int] = {}
+        self._columns = {field: np.full(capacity, np.nan) for field in SCREEN_FIELDS}
+        self._info: Dict[str, List[Any]] = {field: [] for field in INFO_FIELDS}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _grow(self):
+        self._capacity *= 2
+        for field, column in self._columns.items():
+            grown = np.full(self._capacity, np.nan)
+            grown[:self._size] = column[:self._size]
+            self._columns[field] = grown
+
+    def upsert(self, ticker: str, result: Dict[str, Any], updated_at: Optional[str] = None):
+        """写入（或覆盖）一家公司的最新分析结果"""
+        ticker = ticker.upper()
+        row = self._rows.get(ticker)
+        if row is None:
+            if self._size == self._capacity:
+                self._grow()
+            row = self._size
+            self._rows[ticker] = row
+            self._size += 1
+            for values in self._info.values():
+                values.append(None)
+
+        analysis = result.get("analysis") or {}
+        for field, (section, key) in SCREEN_FIELDS.items():
+            self._columns[field][row] = to_number((analysis.get(section) or {}).get(key))
+
+        self._info["ticker"][row] = ticker
+        self._info["company_name"][row] = result.get("company_name", "")
+        self._info["company_name_cn"][row] = result.get("company_name_cn", "")
+        self._info["sector"][row] = result.get("sector", "")
+        self._info["updated_at"][row] = updated_at or datetime.now().isoformat()
+
+    def query(
+        self,
+        conditions: List[Tuple[str, str, float]],
+        sort: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 50,
+        fields: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        向量化筛选 + 排序 + 分页
+
+        sort 为字段名，前缀 "-" 表示降序；缺失值（NaN）始终排在最后。
+        """
+        size = self._size
+        mask = np.ones(size, dtype=bool)
+        for field, op, value in conditions:
+            # 缺失数据（NaN）的公司不满足任何条件（NaN != x 在 numpy 中为 True，需单独排除）
+            column = self._columns[field][:size]
+            mask &= ~np.isnan(column) & _OPERATORS[op](column, value)
+        matched = np.flatnonzero(mask)
+
+        if sort:
+            descending = sort.startswith("-")
+            sort_field = sort.lstrip("-+")
+            if sort_field not in SCREEN_FIELDS:
+                raise ValueError(f"不支持的排序字段: {sort_field}")
+            keys = self._columns[sort_field][matched]
+            order = np.argsort(-keys if descending else keys, kind="stable")
+            matched = matched[order]
+
+        page = matched[offset:offset + limit]
+
+        selected = fields or list(INFO_FIELDS[:2]) + list(SCREEN_FIELDS)
+        unknown = [f for f in selected if f not in SCREEN_FIELDS and f not in INFO_FIELDS]
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+
+        projected = {}
+        for field in selected:
+            if field in SCREEN_FIELDS:
+                column = self._columns[field][page]
+                projected[field] = [None if np.isnan(v) else v for v in column.tolist()]
+            else:
+                info = self._info[field]
+                projected[field] = [info[i] for i in page.tolist()]
+
+        rows = [
+            {field: projected[field][i] for field in selected}
+            for i in range(len(page))
+        ]
+        return {
+            "results": rows,
+            "total": int(matched.size),
+            "offset": offset,
+            "limit": limit,
+        }
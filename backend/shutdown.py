@@ -0,0 +1,52 @@
+"""
+停机协调 - 收到 SIGTERM / SIGINT 时立即进入 draining 状态
+
+uvicorn 收到信号后先关闭监听、等待进行中的请求结束（最长 --timeout-graceful-shutdown），
+最后才执行 shutdown 事件。如果到 shutdown 事件中才标记 draining，这段时间内仍在处理的请求
+（例如等待 SEC 数据后才创建任务的分析请求）看不到停机状态，后台任务的等待时间也会叠加在
+uvicorn 的等待之后。这里在 uvicorn 的信号处理之前插入一层：收到信号时立即标记 draining 并记录
+开始时间，shutdown 事件只再等待同一预算中剩余的时间。
+"""
+import signal
+import time
+from typing import Optional
+
+
+class ShutdownCoordinator:
+    def __init__(self):
+        self.started_at: Optional[float] = None
+
+    @property
+    def draining(self) -> bool:
+        return self.started_at is not None
+
+    def begin(self):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+            print("Shutdown requested, no longer accepting new analysis jobs")
+
+    def remaining(self, budget: float) -> float:
+        """从收到停机信号起算，budget 秒中还剩多少"""
+        if self.started_at is None:
+            return budget
+        return max(0.0, budget - (time.monotonic() - self.started_at))
+
+    def install_signal_handlers(self):
+        """
+        包装当前的 SIGTERM / SIGINT 处理函数（需在 uvicorn 安装信号处理之后调用，如 startup 事件中）。
+        没有可调用的处理函数（不在 uvicorn 下运行）或不在主线程时不做任何事。
+        """
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                self.begin()
+                previous(signum, frame)
+
+            try:
+                signal.signal(sig, handler)
+            except ValueError:
+                # 只有主线程能设置信号处理（例如 TestClient 在其他线程中执行 startup 事件）
+                return
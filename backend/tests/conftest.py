@@ -0,0 +1,94 @@
+"""
+测试公共设置：所有持久化文件写到临时目录，Anthropic 调用指向进程内启动的 stand-in（tests/standin.py）
+"""
+import importlib.util
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 必须在导入任何后端模块之前设置（模块导入时读取）
+_TMP_DIR = tempfile.mkdtemp(prefix="veritas-tests-")
+os.environ["ARCHIVE_DB"] = os.path.join(_TMP_DIR, "archive.db")
+os.environ["CHECKPOINT_DB"] = os.path.join(_TMP_DIR, "checkpoints.db")
+os.environ["LOOP_LAG_THRESHOLD_MS"] = "5000"
+os.environ["BULK_POLL_SECONDS"] = "0.01"
+os.environ.pop("SEC_API_KEY", None)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def standin_url():
+    """在后台线程中运行 stand-in，返回其地址"""
+    import uvicorn
+    import standin
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(standin.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def standin_state():
+    import standin
+    standin.reset()
+    yield standin
+    standin.reset()
+
+
+@pytest.fixture(scope="session")
+def simple_app(standin_url):
+    """加载 main-simple.py（文件名带连字符，不能直接 import）"""
+    os.environ["ANTHROPIC_API_KEY"] = "test-key"
+    os.environ["ANTHROPIC_BASE_URL"] = standin_url
+    spec = importlib.util.spec_from_file_location("main_simple", os.path.join(BACKEND_DIR, "main-simple.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def simple_client(simple_app):
+    """整个测试会话共用一个 TestClient（启动/关闭事件只执行一次，后台任务在同一事件循环中运行）"""
+    from fastapi.testclient import TestClient
+
+    with TestClient(simple_app.app) as client:
+        yield client
+
+
+def wait_for(client, url: str, done, timeout: float = 10.0):
+    """轮询 url 直到 done(响应 JSON) 为真"""
+    deadline = time.monotonic() + timeout
+    while True:
+        body = client.get(url).json()
+        if done(body) or time.monotonic() > deadline:
+            return body
+        time.sleep(0.02)
+
+
+@pytest.fixture(scope="session")
+def main_app():
+    """加载 main.py（部署版本）"""
+    spec = importlib.util.spec_from_file_location("main_app", os.path.join(BACKEND_DIR, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
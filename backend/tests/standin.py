@@ -0,0 +1,101 @@
+"""
+Anthropic API 的本地 stand-in（Messages + Message Batches），用于测试，不访问真实服务
+
+批量结果可以按 custom_id 注入故障（FAULTS[custom_id]）：
+- "errored"：该请求失败（result.type = errored）
+- "malformed"：结果行不是合法 JSON
+- "missing_result"：结果行缺少 result 字段
+- "empty_content"：消息 content 为空
+- "invalid_json"：消息文本不是 JSON
+
+实时调用（/v1/messages）的故障通过 REALTIME 注入：delay 为响应前等待的秒数，fault 为 "empty_content" 时返回空 content，"server_error" 时返回 500。
+"""
+import asyncio
+import json
+import uuid
+from typing import Dict, Any, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+app = FastAPI()
+
+# batch_id -> 请求列表
+batches: Dict[str, List[Dict[str, Any]]] = {}
+# custom_id -> 故障类型
+FAULTS: Dict[str, str] = {}
+# 实时调用次数（按 protocol 文本区分不方便，只记总数）
+calls = {"messages": 0}
+REALTIME: Dict[str, Any] = {"delay": 0.0, "fault": None}
+
+SECTION_RESULT = {"reality_gap_score": 4, "runway_months": 9, "rd_intensity": "70%"}
+
+
+def message(text: str = json.dumps(SECTION_RESULT)) -> Dict[str, Any]:
+    return {
+        "model": "standin",
+        "content": [{"type": "text", "text": text}],
+        "usage": {"input_tokens": 100, "output_tokens": 40},
+        "stop_reason": "end_turn",
+    }
+
+
+def reset():
+    batches.clear()
+    FAULTS.clear()
+    calls["messages"] = 0
+    REALTIME.update(delay=0.0, fault=None)
+
+
+@app.post("/v1/messages")
+async def create_message(request: Request):
+    calls["messages"] += 1
+    if REALTIME["delay"]:
+        await asyncio.sleep(REALTIME["delay"])
+    if REALTIME["fault"] == "server_error":
+        return JSONResponse({"type": "error", "error": {"type": "api_error"}}, status_code=500)
+    if REALTIME["fault"] == "empty_content":
+        return {**message(), "content": []}
+    return message()
+
+
+@app.post("/v1/messages/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    batch_id = "msgbatch_" + uuid.uuid4().hex[:8]
+    batches[batch_id] = body["requests"]
+    return {"id": batch_id, "processing_status": "in_progress"}
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    return {"id": batch_id, "processing_status": "ended"}
+
+
+@app.post("/v1/messages/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    return {"id": batch_id, "processing_status": "canceling"}
+
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def batch_results(batch_id: str):
+    lines = []
+    for item in batches.get(batch_id, []):
+        custom_id = item["custom_id"]
+        fault = FAULTS.get(custom_id)
+        if fault == "malformed":
+            lines.append('{"custom_id": "' + custom_id + '", "result": ')
+            continue
+        if fault == "missing_result":
+            lines.append(json.dumps({"custom_id": custom_id}))
+            continue
+        if fault == "errored":
+            result = {"type": "errored", "error": {"type": "api_error"}}
+        elif fault == "empty_content":
+            result = {"type": "succeeded", "message": {**message(), "content": []}}
+        elif fault == "invalid_json":
+            result = {"type": "succeeded", "message": message("not json")}
+        else:
+            result = {"type": "succeeded", "message": message()}
+        lines.append(json.dumps({"custom_id": custom_id, "result": result}))
+    return PlainTextResponse("\n".join(lines))
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+import admission as admission_module
+from admission import AdmissionController, FAILED_CALL_PENALTY
+from scheduler import PriorityLimiter
+
+
+def test_failed_calls_raise_latency_estimate():
+    admission = AdmissionController(PriorityLimiter(capacity=2))
+    admission.record_latency("reality", 2.0)
+    assert admission.call_latency() == 2.0
+
+    # 连接被拒绝之类的快速失败不能让估算变短
+    admission.record_failure("reality", 0.01)
+    assert admission.call_latency() == (2.0 + FAILED_CALL_PENALTY) / 2
+
+    # 超时按实际耗时计入
+    admission.record_failure("reality", FAILED_CALL_PENALTY + 40)
+    assert max(admission._latencies["reality"]) == FAILED_CALL_PENALTY + 40
+
+
+def test_cors_exposes_backoff_and_cache_headers(simple_client):
+    response = simple_client.get("/api/scheduler", headers={"Origin": "http://localhost:3000"})
+    exposed = {h.strip().lower() for h in response.headers["access-control-expose-headers"].split(",")}
+    assert {"retry-after", "etag", "x-trace-id"} <= exposed
+
+
+def test_rejects_interactive_with_503_and_low_priority_first(monkeypatch):
+    monkeypatch.setattr(admission_module, "MAX_ACTIVE_JOBS", 8)
+    limiter = PriorityLimiter(capacity=2)
+    admission = AdmissionController(limiter)
+    admission.record_latency("reality", 10.0)
+
+    # background 只能使用 1/4 的任务名额，被限流（429）；interactive 仍被接受
+    rejection = admission.check("background", active_jobs=2)
+    assert rejection.status_code == 429
+    # 需要一个任务（5 次调用）完成：5 / 2 个槽位 * 10 秒
+    assert rejection.retry_after == 25
+    assert admission.check("interactive", active_jobs=2) is None
+
+    rejection = admission.check("interactive", active_jobs=8)
+    assert rejection.status_code == 503
+    assert rejection.reason == "Too many analyses in progress"
+
+
+def test_rejects_when_estimated_wait_too_long():
+    limiter = PriorityLimiter(capacity=1)
+    admission = AdmissionController(limiter)
+    admission.record_latency("reality", 30.0)
+    limiter.in_use = 1
+
+    # 新任务的 5 次调用排在 1 次进行中的调用之后：估算等待 5 * 30 秒
+    rejection = admission.check("interactive", active_jobs=1)
+    assert rejection.status_code == 503
+    assert rejection.retry_after == 150 - admission_module.MAX_ESTIMATED_WAIT
+    assert admission.stats()["estimated_wait_seconds"] == 150
+
+
+@pytest.fixture
+def overloaded(simple_app, monkeypatch):
+    """任何新任务都超出任务数上限"""
+    monkeypatch.setattr(admission_module, "MAX_ACTIVE_JOBS", 0)
+    monkeypatch.setattr(simple_app, "latest_results", {})
+    return simple_app
+
+
+@pytest.mark.parametrize("priority, status_code", [("interactive", 503), ("batch", 429), ("background", 429)])
+def test_shed_request_gets_retry_after(overloaded, simple_client, priority, status_code):
+    response = simple_client.post("/api/analyze", json={"ticker": "REGN", "priority": priority})
+    assert response.status_code == status_code
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["detail"] == "Too many analyses in progress"
+
+
+def test_shed_request_served_from_fresh_cache(overloaded, simple_client):
+    result = {"ticker": "REGN", "company_name": "Regeneron", "analysis": {}}
+    overloaded.latest_results["REGN"] = {"result": result, "completed_at": time.time()}
+
+    response = simple_client.post("/api/analyze", json={"ticker": "REGN"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "completed"
+    assert body["message"] == "Server busy, served cached analysis"
+    assert simple_client.get(f"/api/analyze/{body['job_id']}").json()["result"] == result
+
+    # 过期的缓存不能代替拒绝
+    overloaded.latest_results["REGN"]["completed_at"] = time.time() - overloaded.RESULT_FRESH_SECONDS - 1
+    assert simple_client.post("/api/analyze", json={"ticker": "REGN"}).status_code == 503
@@ -0,0 +1,150 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from archive import AnalysisArchive, diff_values, filing_key, parse_as_of
+
+DAY = 86400
+
+
+def _result(version: int, **extra):
+    result = {
+        "ticker": "regn",
+        "filing_type": "10-K",
+        "sec_data": {"latest_filing": {"formType": "10-K", "filedAt": "2024-02-28T16:05:00-05:00"}},
+        "analysis": {
+            "reality": {"reality_gap_score": version},
+            "survival": {"runway_months": 24},
+        },
+    }
+    result.update(extra)
+    return result
+
+
+@pytest.fixture
+def archive():
+    archive = AnalysisArchive(":memory:", keyframe_interval=3)
+    yield archive
+    archive.close()
+
+
+def _keyframes(archive):
+    return [row["keyframe"] for row in archive._conn.execute("SELECT keyframe FROM snapshots ORDER BY id")]
+
+
+def test_replay_across_keyframes(archive):
+    ids = [archive.record(_result(version), created_at=1000.0 + version) for version in range(7)]
+
+    # 每 3 个快照一个完整清单，其余为 delta
+    assert _keyframes(archive) == [1, 0, 0, 1, 0, 0, 1]
+    for version, snapshot_id in enumerate(ids):
+        snapshot = archive.snapshot("REGN", snapshot_id=snapshot_id)
+        assert snapshot["result"]["analysis"]["reality"]["reality_gap_score"] == version
+        assert snapshot["result"]["analysis"]["survival"] == {"runway_months": 24}
+        assert snapshot["filing"] == "10-K 2024-02-28"
+
+
+def test_replay_after_keyframe_interval_lowered(tmp_path):
+    path = str(tmp_path / "archive.db")
+    archive = AnalysisArchive(path, keyframe_interval=8)
+    for version in range(5):
+        archive.record(_result(version), created_at=1000.0 + version)
+    archive.close()
+
+    # 重启后间隔调小：已有的 delta 链比新的间隔长，仍要从最近的完整清单开始还原
+    archive = AnalysisArchive(path, keyframe_interval=2)
+    assert archive.snapshot("REGN")["result"]["analysis"]["reality"]["reality_gap_score"] == 4
+    archive.record(_result(5), created_at=1005.0)
+    archive.record(_result(6), created_at=1006.0)
+    assert _keyframes(archive) == [1, 0, 0, 0, 0, 1, 0]
+    assert archive.snapshot("REGN")["result"]["analysis"]["reality"]["reality_gap_score"] == 6
+    assert archive.snapshot("REGN", as_of=1003.5)["result"]["analysis"]["reality"]["reality_gap_score"] == 3
+    archive.close()
+
+
+def test_delta_records_changed_and_removed_sections(archive):
+    archive.record(_result(1, note="first"), created_at=1000.0)
+    second = _result(1)
+    second["analysis"]["pipeline"] = {"pipeline": []}
+    snapshot_id = archive.record(second, created_at=2000.0)
+
+    manifest = json.loads(archive._conn.execute("SELECT manifest FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone()[0])
+    assert set(manifest["set"]) == {"analysis.pipeline"}
+    assert manifest["unset"] == ["note"]
+
+    snapshot = archive.snapshot("REGN")
+    assert snapshot["changed"] == ["analysis.pipeline", "note"]
+    assert "note" not in snapshot["result"]
+    assert snapshot["result"]["analysis"]["pipeline"] == {"pipeline": []}
+
+
+def test_unchanged_sections_are_stored_once(archive):
+    for version in range(3):
+        archive.record(_result(version), created_at=1000.0 + version)
+    (blobs,) = archive._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()
+    # ticker / filing_type / sec_data / survival 各一份，reality 每个版本一份
+    assert blobs == 4 + 3
+
+
+def test_snapshot_as_of_and_filing(archive):
+    archive.record(_result(1), created_at=1000.0)
+    archive.record(_result(2), created_at=2000.0)
+    archive.record(_result(3, filing_type="10-Q", sec_data={}), created_at=3000.0)
+
+    assert archive.snapshot("REGN", as_of=1500.0)["result"]["analysis"]["reality"]["reality_gap_score"] == 1
+    assert archive.snapshot("REGN", as_of=999.0) is None
+    assert archive.snapshot("regn", filing="10-K 2024-02-28")["result"]["analysis"]["reality"]["reality_gap_score"] == 2
+    assert archive.snapshot("REGN")["filing"] == "10-Q"
+    assert archive.snapshot("VRTX") is None
+    assert [item["created_at"] for item in archive.history("REGN", limit=2)] == ["1970-01-01T00:50:00Z", "1970-01-01T00:33:20Z"]
+
+
+def test_latest_snapshots_and_diff(archive):
+    first = archive.record(_result(1), created_at=1000.0)
+    second = archive.record(_result(5), created_at=2000.0)
+    archive.record({**_result(2), "ticker": "VRTX"}, created_at=1500.0)
+
+    latest = {item["ticker"]: item for item in archive.latest_snapshots()}
+    assert latest["REGN"]["snapshot_id"] == second
+    assert latest["VRTX"]["result"]["analysis"]["reality"]["reality_gap_score"] == 2
+
+    diff = archive.diff("REGN", first, second)
+    assert diff["changes"] == [
+        {"path": "analysis.reality.reality_gap_score", "op": "changed", "before": 1, "after": 5}
+    ]
+    assert archive.diff("REGN", first, 999) is None
+    # 快照 ID 属于其他公司时视为不存在
+    assert archive.diff("VRTX", first, second) is None
+
+
+def test_diff_values_added_and_removed():
+    changes = diff_values({"a": 1, "b": [1]}, {"b": [2], "c": None})
+    assert changes == [
+        {"path": "a", "op": "removed", "before": 1, "after": None},
+        {"path": "b", "op": "changed", "before": [1], "after": [2]},
+        {"path": "c", "op": "added", "before": None, "after": None},
+    ]
+
+
+def test_filing_key():
+    assert filing_key(_result(1)) == "10-K 2024-02-28"
+    assert filing_key({"filing_type": "10-Q", "filing_date": "2024-05-01"}) == "10-Q 2024-05-01"
+    assert filing_key({}) is None
+
+
+def test_parse_as_of_date_only_means_end_of_day_utc():
+    start = datetime(2024, 6, 30, tzinfo=timezone.utc).timestamp()
+    assert parse_as_of("2024-06-30") == pytest.approx(start + DAY - 0.001)
+    assert parse_as_of("2024-06-30") < datetime(2024, 7, 1, tzinfo=timezone.utc).timestamp()
+
+
+def test_parse_as_of_timezones():
+    utc_noon = datetime(2024, 6, 30, 12, tzinfo=timezone.utc).timestamp()
+    # 无时区按 UTC
+    assert parse_as_of("2024-06-30T12:00:00") == utc_noon
+    assert parse_as_of("2024-06-30T12:00:00Z") == utc_noon
+    assert parse_as_of("2024-06-30T20:00:00+08:00") == utc_noon
+    assert parse_as_of("2024-06-30T08:00:00-04:00") == utc_noon
+    with pytest.raises(ValueError):
+        parse_as_of("30/06/2024")
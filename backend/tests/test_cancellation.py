@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import wait_for
+from fallbacks import CircuitBreaker
+from prefetch import SpeculativePrefetcher
+
+
+@pytest.fixture
+def slow_app(simple_app, standin_state, monkeypatch):
+    """没有缓存和预取的 main-simple，模型调用每次耗时 1 秒"""
+    monkeypatch.setattr(simple_app, "latest_results", {})
+    monkeypatch.setattr(simple_app, "prefetcher", SpeculativePrefetcher())
+    # 超时的调用计为提供方失败，各测试使用独立的断路器
+    monkeypatch.setattr(simple_app, "provider_circuit", CircuitBreaker("anthropic"))
+    standin_state.REALTIME["delay"] = 1.0
+    return simple_app
+
+
+def _start(client, ticker: str) -> str:
+    return client.post("/api/analyze", json={"ticker": ticker}).json()["job_id"]
+
+
+def test_delete_cancels_running_job(slow_app, simple_client):
+    job_id = _start(simple_client, "ALNY")
+    assert job_id in slow_app.job_tasks
+
+    response = simple_client.delete(f"/api/analyze/{job_id}").json()
+    assert response["status"] == "cancelled"
+    assert response["message"] == "Analysis cancelled"
+    assert job_id not in slow_app.job_tasks
+    assert simple_client.get(f"/api/analyze/{job_id}").json()["error"] == "Analysis cancelled"
+    assert simple_client.delete("/api/analyze/unknown-job").status_code == 404
+
+
+def test_job_deadline_fails_job(slow_app, simple_client, monkeypatch):
+    monkeypatch.setattr(slow_app, "JOB_DEADLINE_SECONDS", 0.3)
+    job_id = _start(simple_client, "ALNY")
+
+    body = wait_for(simple_client, f"/api/analyze/{job_id}", lambda b: b["status"] != "processing", timeout=5)
+    assert body["status"] == "failed"
+    assert "deadline exceeded" in body["error"]
+    assert job_id not in slow_app.job_tasks
+
+
+def test_failed_section_cancels_siblings(slow_app, simple_client, monkeypatch):
+    cancelled = []
+
+    async def analyze_with_claude(api_key, protocol, context, protocol_name="", **options):
+        if protocol_name == "survival":
+            raise slow_app.DeadlineExceeded("Analysis deadline exceeded")
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(protocol_name)
+            raise
+
+    monkeypatch.setattr(slow_app, "analyze_with_claude", analyze_with_claude)
+
+    async def run():
+        with pytest.raises(slow_app.DeadlineExceeded):
+            await slow_app.perform_analysis("ALNY")
+
+    simple_client.portal.call(run)
+    assert sorted(cancelled) == sorted(set(slow_app.ANALYSIS_SECTIONS) - {"survival"})
+
+
+class DisconnectingRequest:
+    """TestClient 在响应结束前不会报告断开，直接调用事件流并模拟客户端断开"""
+
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+def test_sse_disconnect_of_last_watcher_cancels_job(slow_app, simple_client):
+    job_id = _start(simple_client, "ALNY")
+
+    async def watch():
+        request = DisconnectingRequest()
+        response = await slow_app.stream_analysis_events(request, job_id)
+        assert (await response.body_iterator.__anext__()).startswith("event: status")
+        return request, response.body_iterator
+
+    first_request, first = simple_client.portal.call(watch)
+    _, second = simple_client.portal.call(watch)
+    assert slow_app.job_watchers[job_id] == 2
+
+    async def disconnect_first():
+        first_request.disconnected = True
+        with pytest.raises(StopAsyncIteration):
+            await first.__anext__()
+
+    # 还有其他订阅者时任务继续
+    simple_client.portal.call(disconnect_first)
+    assert slow_app.analysis_jobs[job_id]["status"] == "processing"
+    assert job_id in slow_app.job_tasks
+
+    # 服务端在客户端断开时关闭生成器
+    simple_client.portal.call(second.aclose)
+    body = wait_for(simple_client, f"/api/analyze/{job_id}", lambda b: b["status"] != "processing", timeout=5)
+    assert body["status"] == "cancelled"
+    assert slow_app.job_watchers[job_id] == 0
+
+
+def test_sse_reports_result(slow_app, simple_client, standin_state):
+    standin_state.REALTIME["delay"] = 0.0
+    job_id = _start(simple_client, "ALNY")
+
+    with simple_client.stream("GET", f"/api/analyze/{job_id}/events") as response:
+        lines = [line for line in response.iter_lines() if line.startswith("data: ")]
+    done = json.loads(lines[-1][len("data: "):])
+    assert done["status"] == "completed"
+    assert done["result"]["ticker"] == "ALNY"
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import providers
+from archive import AnalysisArchive
+from checkpoints import CheckpointStore
+from conftest import wait_for
+
+SECTIONS = ["reality", "survival", "competition"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"))
+    yield store
+    store.close()
+
+
+def test_saved_sections_survive_restart(tmp_path, store):
+    store.create_job("job-1", "REGN", SECTIONS, filing_type="10-K", created_at="2024-06-30T00:00:00")
+    store.save_section("job-1", "reality", {"reality_gap_score": 4})
+    store.close()
+
+    reopened = CheckpointStore(str(tmp_path / "checkpoints.db"))
+    (job,) = reopened.interrupted_jobs()
+    assert job["job_id"] == "job-1"
+    assert job["remaining"] == ["survival", "competition"]
+    assert job["completed"] == {"reality": {"reality_gap_score": 4}}
+    reopened.close()
+
+
+def test_finished_and_stale_jobs_not_resumed(store):
+    store.create_job("done", "REGN", SECTIONS)
+    store.finish_job("done", "completed")
+    store.create_job("stale", "SMMT", SECTIONS)
+    store._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = 'stale'", (time.time() - 7200,))
+
+    assert store.interrupted_jobs(max_age=3600) == []
+    status = store._conn.execute("SELECT status FROM jobs WHERE job_id = 'stale'").fetchone()[0]
+    assert status == "failed"
+
+
+def test_purge_removes_old_finished_jobs(store):
+    store.create_job("old", "REGN", SECTIONS)
+    store.save_section("old", "reality", {})
+    store.finish_job("old", "completed")
+    store.create_job("running", "SMMT", SECTIONS)
+    store._conn.execute("UPDATE jobs SET updated_at = 0")
+
+    store.purge(older_than=60)
+    assert [row[0] for row in store._conn.execute("SELECT job_id FROM jobs")] == ["running"]
+    assert store.completed_sections("old") == {}
+
+
+def test_save_section_for_unknown_job_is_ignored(store):
+    store.save_section("missing", "reality", {"reality_gap_score": 1})
+    assert store.completed_sections("missing") == {}
+
+
+class FakeQueryApi:
+    def get_filings(self, query):
+        return {"filings": [{"companyName": "Regeneron", "linkToFilingDetails": "", "filedAt": "2024-02-28"}]}
+
+
+@pytest.fixture
+def main_resume(main_app, tmp_path, monkeypatch):
+    """main.py 使用独立的检查点/归档文件，SEC 查询和模型调用换成本地实现"""
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"))
+    monkeypatch.setattr(main_app, "checkpoints", store)
+    monkeypatch.setattr(main_app, "archive", AnalysisArchive(str(tmp_path / "archive.db")))
+    monkeypatch.setattr(main_app, "SELECTED_PROVIDERS", ["sec"])
+    monkeypatch.setitem(providers._instances, "sec", FakeQueryApi())
+    calls = []
+    answers = {"reality": {"reality_gap_score": 3}, "survival": {"runway_months": 20}, "competition": {"competitors": ["X"]}}
+    # 清除后模型调用一直等待，测试可以观察进行中的状态
+    release = threading.Event()
+    release.set()
+
+    async def analyze_with_ai(protocol, context, protocol_name="", **tags):
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        calls.append(protocol_name)
+        answer = answers[protocol_name]
+        return answer if isinstance(answer, str) else json.dumps(answer)
+
+    monkeypatch.setattr(main_app, "analyze_with_ai", analyze_with_ai)
+    return store, calls, answers, release
+
+
+def test_resume_runs_only_missing_sections(main_app, main_resume):
+    from fastapi.testclient import TestClient
+
+    store, calls, _, _ = main_resume
+    store.create_job("resume-1", "REGN", SECTIONS, filing_type="10-K")
+    store.save_section("resume-1", "reality", {"reality_gap_score": 8})
+
+    with TestClient(main_app.app) as client:
+        body = wait_for(client, "/api/analyze/resume-1", lambda b: b.get("status") != "processing")
+        assert body["status"] == "completed"
+        assert calls == ["survival", "competition"]
+        assert body["result"]["analysis"]["reality"]["reality_gap_score"] == 8
+        # 任务状态先于检查点更新（finish_job 在线程中执行）；关闭事件会关闭检查点存储，在此之前检查
+        deadline = time.monotonic() + 5
+        while store.interrupted_jobs() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.interrupted_jobs() == []
+
+
+def test_failed_section_not_checkpointed(main_app, main_resume):
+    store, calls, answers, _ = main_resume
+    answers["survival"] = "provider error: overloaded"
+    store.create_job("resume-2", "REGN", SECTIONS)
+    main_app.analysis_jobs["resume-2"] = {"status": "processing", "ticker": "REGN", "result": None, "error": None}
+
+    asyncio.run(main_app.perform_analysis("REGN", "10-K", job_id="resume-2"))
+    # 无法解析的模块没有检查点，恢复时会重新调用
+    assert set(store.completed_sections("resume-2")) == {"reality", "competition"}
+    assert store._conn.execute("SELECT remaining FROM jobs").fetchone()[0] == json.dumps(["survival"])
+
+
+def test_resuming_jobs_keyed_by_job_id(main_app, main_resume):
+    from fastapi.testclient import TestClient
+
+    store, calls, _, release = main_resume
+    # 同一公司的两个中断任务都要恢复，不能互相覆盖
+    store.create_job("resume-a", "REGN", SECTIONS)
+    store.create_job("resume-b", "REGN", SECTIONS)
+    release.clear()
+
+    with TestClient(main_app.app) as client:
+        assert set(main_app.resuming_jobs) == {"resume-a", "resume-b"}
+        release.set()
+        for job_id in ("resume-a", "resume-b"):
+            body = wait_for(client, f"/api/analyze/{job_id}", lambda b: b.get("status") != "processing")
+            assert body["status"] == "completed"
+    assert len(calls) == 6
+    assert main_app.resuming_jobs == {}
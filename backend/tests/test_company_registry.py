@@ -0,0 +1,103 @@
+import json
+import threading
+import zipfile
+
+import build_company_registry
+from company_registry import CompanyRegistry, BIOTECH_SIC_CODES
+from tracked_companies import BIOTECH_COMPANIES
+
+
+def _registry(tmp_path, rows, tracked=None) -> CompanyRegistry:
+    path = tmp_path / "registry.json"
+    path.write_text(json.dumps({"fields": ["cik", "name", "ticker", "exchange", "sic"], "data": rows}))
+    return CompanyRegistry(path=str(path), tracked=tracked)
+
+
+def test_sic_filter_applies_before_candidate_cap(tmp_path):
+    # 200 家非生物医药公司排在前缀 "A" 的最前面，会占满未分组索引的候选上限
+    rows = [[i, f"Alpha Software {i}", f"AA{i:03d}", "Nasdaq", "7372"] for i in range(200)]
+    rows += [[1000 + i, f"Axon Bio {i}", f"AX{i:02d}", "Nasdaq", "2834"] for i in range(15)]
+    registry = _registry(tmp_path, rows)
+
+    results = registry.search("a", limit=20, sic_codes=BIOTECH_SIC_CODES)
+    assert len(results) == 15
+    assert all(r["sic"] == "2834" for r in results)
+    assert len(registry.search("a", limit=20)) == 20
+
+
+def test_fuzzy_matches_respect_sic_filter(tmp_path):
+    rows = [[1, "Regeneron", "REGN", "Nasdaq", "2836"], [2, "Regency", "REGX", "NYSE", "6798"]]
+    registry = _registry(tmp_path, rows)
+
+    assert [r["ticker"] for r in registry.search("REGM", sic_codes=BIOTECH_SIC_CODES)] == ["REGN"]
+    assert {r["ticker"] for r in registry.search("REGM")} == {"REGN", "REGX"}
+
+
+def test_tracked_companies_searchable_by_chinese_name(tmp_path):
+    registry = _registry(tmp_path, [[1801198, "Legend Biotech Corp", "LEGN", "Nasdaq", "2834"]], tracked=BIOTECH_COMPANIES)
+
+    results = registry.search("传奇", sic_codes=BIOTECH_SIC_CODES)
+    assert [r["ticker"] for r in results] == ["LEGN"]
+    assert results[0]["match"] == "name_cn"
+    assert results[0]["tracked"] is True
+
+
+def test_concurrent_loads_build_index_once(tmp_path, monkeypatch):
+    registry = _registry(tmp_path, [[1, "Regeneron", "REGN", "Nasdaq", "2836"]])
+    builds = []
+    build = registry._build
+    monkeypatch.setattr(registry, "_build", lambda: builds.append(1) or build())
+    assert not registry.loaded
+
+    threads = [threading.Thread(target=registry.load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.loaded
+    assert builds == [1]
+    assert [r["ticker"] for r in registry.search("REGN")] == ["REGN"]
+
+
+TICKERS = {
+    "fields": ["cik", "name", "ticker", "exchange"],
+    "data": [
+        [872589, "Regeneron Pharmaceuticals", "REGN", "Nasdaq"],
+        [320193, "Apple Inc.", "AAPL", "Nasdaq"],
+        [1801198, "Legend Biotech Corp", "LEGN", "Nasdaq"],
+        [999999, "No Ticker Trust", "", None],
+    ],
+}
+
+
+def test_build_rows_merges_sic_and_filters():
+    sic = {872589: "2834", 320193: "3571"}
+    rows = build_company_registry.build_rows(TICKERS, sic)
+    assert rows == [
+        [872589, "Regeneron Pharmaceuticals", "REGN", "Nasdaq", "2834"],
+        [320193, "Apple Inc.", "AAPL", "Nasdaq", "3571"],
+        [1801198, "Legend Biotech Corp", "LEGN", "Nasdaq", ""],
+    ]
+    filtered = build_company_registry.build_rows(TICKERS, sic, BIOTECH_SIC_CODES)
+    assert [row[2] for row in filtered] == ["REGN"]
+
+
+def test_sic_from_submissions_zip(tmp_path):
+    path = tmp_path / "submissions.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("CIK0000872589.json", json.dumps({"cik": "872589", "sic": "2834"}))
+        archive.writestr("CIK0000320193.json", json.dumps({"cik": "320193", "sic": ""}))
+        archive.writestr("CIK0001801198.json", json.dumps({"cik": "1801198", "sic": "2836"}))
+    # 只读取请求的公司，没有 SIC 的公司不出现在结果中
+    assert build_company_registry.sic_from_zip(str(path), [872589, 320193, 555]) == {872589: "2834"}
+
+
+def test_written_registry_reused_and_loadable(tmp_path):
+    path = str(tmp_path / "registry.json")
+    rows = build_company_registry.build_rows(TICKERS, {872589: "2834", 1801198: "2834"})
+    build_company_registry.write_registry(path, rows)
+
+    assert build_company_registry.load_existing_sic(path) == {872589: "2834", 1801198: "2834"}
+    assert build_company_registry.load_existing_sic(str(tmp_path / "missing.json")) == {}
+    registry = CompanyRegistry(path=path, tracked=BIOTECH_COMPANIES)
+    assert [r["ticker"] for r in registry.search("传奇", sic_codes=BIOTECH_SIC_CODES)] == ["LEGN"]
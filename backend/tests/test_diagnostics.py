@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import diagnostics
+import metrics
+from diagnostics import LoopLagMonitor, SamplingProfiler, profiling_authorized, profiling_requested
+
+
+def _spin(seconds: float):
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        pass
+
+
+def job_work():
+    _spin(0.01)
+
+
+def child_work():
+    _spin(0.01)
+
+
+def noise_work():
+    _spin(0.01)
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+def test_loop_lag_monitor_reports_blocking_stack(capsys):
+    monitor = LoopLagMonitor(threshold_ms=100, interval=0.01)
+    blocked_before = metrics._counters.get("event_loop_blocked_total", {}).get((), 0)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_call()
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    asyncio.run(run())
+    assert monitor.max_lag >= 0.25
+    assert metrics._counters["event_loop_blocked_total"][()] == blocked_before + 1
+    output = capsys.readouterr().out
+    assert "Event loop blocked for" in output
+    assert "blocking_call" in output
+
+
+def test_profiler_keeps_only_samples_of_profiled_task():
+    async def child():
+        for _ in range(10):
+            child_work()
+            await asyncio.sleep(0)
+
+    async def job(profiler: SamplingProfiler):
+        profiler.start()
+        helper = asyncio.create_task(child())
+        for _ in range(10):
+            job_work()
+            await asyncio.sleep(0)
+        await helper
+        # 空闲等待的样本不计入
+        await asyncio.sleep(0.05)
+        profiler.stop()
+
+    async def noise():
+        for _ in range(20):
+            noise_work()
+            await asyncio.sleep(0)
+
+    async def run():
+        profiler = SamplingProfiler(interval=0.001)
+        await asyncio.gather(job(profiler), noise())
+        return profiler
+
+    profiler = asyncio.run(run())
+    collapsed = profiler.collapsed()
+    assert "job_work" in collapsed
+    assert "child_work" in collapsed
+    assert "noise_work" not in collapsed
+    assert "select" not in collapsed
+    assert profiler.other_samples > 0
+
+
+def test_profiling_authorized(monkeypatch):
+    monkeypatch.setattr(diagnostics, "PROFILE_TOKEN", "")
+    assert not profiling_authorized("")
+    assert not profiling_authorized("anything")
+
+    monkeypatch.setattr(diagnostics, "PROFILE_TOKEN", "secret")
+    assert profiling_authorized("secret")
+    assert not profiling_authorized("secret2")
+    assert not profiling_authorized(None)
+
+    assert profiling_requested("1", None, "secret")
+    assert profiling_requested(None, "true", "secret")
+    assert not profiling_requested(None, None, "secret")
+    assert not profiling_requested("1", None, "wrong")
@@ -0,0 +1,100 @@
+"""
+入口文件必须在导入本地模块之前加载 .env（很多模块在导入时读取配置）。
+把入口文件复制到临时目录，旁边放一个 .env，在子进程中加载后检查各模块实际使用的配置。
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+PROBE = """
+import importlib.util, json, sys
+sys.path.insert(0, {backend!r})
+spec = importlib.util.spec_from_file_location("entry", {entry!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+namespace = {{**sys.modules, **vars(module)}}
+print(json.dumps({{name: eval(expr, namespace) for name, expr in {expressions!r}.items()}}))
+"""
+
+
+def load_with_dotenv(tmp_path, entry: str, settings: dict, expressions: dict) -> dict:
+    """在子进程中加载入口文件（.env 写入 settings），返回各表达式的值"""
+    shutil.copy(os.path.join(BACKEND_DIR, entry), tmp_path / entry)
+    (tmp_path / ".env").write_text("".join(f"{key}={value}\n" for key, value in settings.items()))
+    env = {key: value for key, value in os.environ.items() if key not in settings}
+    script = PROBE.format(backend=BACKEND_DIR, entry=str(tmp_path / entry), expressions=expressions)
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("entry", ["main-simple.py", "main.py"])
+def test_router_models_from_dotenv(tmp_path, entry):
+    values = load_with_dotenv(
+        tmp_path, entry,
+        {"ANTHROPIC_MODEL": "my-model", "ANTHROPIC_FAST_MODEL": "my-fast-model"},
+        {
+            "sonnet": "router.routes['claude-sonnet']['model']",
+            "haiku": "router.routes['claude-haiku']['model']",
+        },
+    )
+    assert values == {"sonnet": "my-model", "haiku": "my-fast-model"}
+
+
+def test_trace_exporter_from_dotenv(tmp_path):
+    trace_file = tmp_path / "spans.jsonl"
+    values = load_with_dotenv(
+        tmp_path, "main-simple.py",
+        {"TRACE_EXPORTER": "file", "TRACE_FILE": str(trace_file)},
+        {
+            "exporter": "tracing.TRACE_EXPORTER",
+            "exported": "tracing._export(tracing.Span('probe', '1' * 32, None, tracing.SPAN_KIND_INTERNAL, {}))",
+        },
+    )
+    assert values["exporter"] == "file"
+    exported = json.loads(trace_file.read_text().splitlines()[-1])
+    assert exported["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] == "probe"
+
+
+def test_diagnostics_settings_from_dotenv(tmp_path):
+    values = load_with_dotenv(
+        tmp_path, "main.py",
+        {"PROFILE_TOKEN": "secret", "LOOP_LAG_THRESHOLD_MS": "250"},
+        {
+            "authorized": "diagnostics.profiling_authorized('secret')",
+            "threshold": "lag_monitor.threshold",
+        },
+    )
+    assert values == {"authorized": True, "threshold": 0.25}
+
+
+def test_checkpoint_db_from_dotenv(tmp_path):
+    path = str(tmp_path / "from-dotenv.db")
+    values = load_with_dotenv(tmp_path, "main.py", {"CHECKPOINT_DB": path}, {"path": "checkpoints.path"})
+    assert values == {"path": path}
+
+
+def test_archive_settings_from_dotenv(tmp_path):
+    path = str(tmp_path / "archive-from-dotenv.db")
+    values = load_with_dotenv(
+        tmp_path, "main-simple.py",
+        {"ARCHIVE_DB": path, "ARCHIVE_KEYFRAME_INTERVAL": "4"},
+        {"interval": "archive.keyframe_interval", "exists": "__import__('os').path.exists(" + repr(path) + ")"},
+    )
+    assert values == {"interval": 4, "exists": True}
+
+
+def test_provider_concurrency_from_dotenv(tmp_path):
+    values = load_with_dotenv(
+        tmp_path, "main-simple.py",
+        {"PROVIDER_CONCURRENCY": "3", "SCHEDULER_AGING_SECONDS": "12"},
+        {"capacity": "provider_limiter.capacity", "aging": "provider_limiter.aging_seconds"},
+    )
+    assert values == {"capacity": 3, "aging": 12.0}
@@ -0,0 +1,93 @@
+import functools
+import time
+
+import pytest
+
+from fallbacks import CircuitBreaker, FallbackStore, is_degraded
+
+
+def _analysis(score):
+    return {"ticker": "regn", "analysis": {"reality": {"reality_gap_score": score}, "survival": {"runway_months": 24}}}
+
+
+def test_unknown_ticker_gets_bare_degraded_marker():
+    store = FallbackStore()
+    section = store.get("REGN", "reality")
+    assert section == {"degraded": True, "degraded_source": None, "stale_as_of": None}
+    assert store.stats() == {"tickers": 0, "sections": 0, "by_source": {}}
+
+
+def test_last_good_result_served_per_ticker_and_section():
+    store = FallbackStore()
+    store.update(_analysis(4), completed_at=60)
+
+    section = store.get("regn", "reality")
+    assert section == {"reality_gap_score": 4, "degraded": True, "degraded_source": "last_good", "stale_as_of": "1970-01-01T00:01:00Z"}
+    # 不借用其他公司的数据
+    assert store.get("SMMT", "reality")["degraded_source"] is None
+    # 调用方修改返回值不影响后备数据
+    section["reality_gap_score"] = 9
+    assert store.get("REGN", "reality")["reality_gap_score"] == 4
+
+
+def test_degraded_sections_never_become_fallbacks():
+    store = FallbackStore()
+    store.update(_analysis(4), completed_at=60)
+    result = _analysis(5)
+    result["analysis"]["reality"] = store.get("REGN", "reality")
+    store.update(result, completed_at=120)
+
+    assert store.get("REGN", "reality")["stale_as_of"] == "1970-01-01T00:01:00Z"
+    assert store.get("REGN", "survival")["stale_as_of"] == "1970-01-01T00:02:00Z"
+
+
+def test_load_snapshots():
+    store = FallbackStore()
+    store.load_snapshots([{"ticker": "REGN", "created_at": "2024-06-30T00:00:00Z", "result": _analysis(3)}])
+    assert store.get("REGN", "reality")["stale_as_of"] == "2024-06-30T00:00:00Z"
+    assert store.stats() == {"tickers": 1, "sections": 2, "by_source": {"last_good": 2}}
+    assert is_degraded(store.get("REGN", "survival"))
+
+
+def test_circuit_breaker_opens_and_probes():
+    breaker = CircuitBreaker("test", failure_threshold=2, open_seconds=0.05)
+    breaker.record(ok=False)
+    assert breaker.allow()
+    breaker.record(ok=False)
+    assert breaker.is_open
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    # 冷却后只放行一次试探
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(ok=False)
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(ok=True)
+    assert not breaker.is_open
+    assert breaker.allow()
+
+
+@pytest.fixture
+def circuit(simple_app, monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=2, open_seconds=60)
+    monkeypatch.setattr(simple_app, "provider_circuit", breaker)
+    return breaker
+
+
+def test_open_circuit_skips_provider_calls(simple_app, simple_client, standin_state, circuit):
+    standin_state.REALTIME["fault"] = "server_error"
+    call = functools.partial(
+        simple_app.analyze_with_claude, "test-key", "PROTOCOL", "context", protocol_name="reality", ticker="REGN"
+    )
+    for _ in range(2):
+        assert simple_client.portal.call(call)["degraded"] is True
+    assert circuit.is_open
+    assert standin_state.calls["messages"] == 2
+
+    # 断开期间直接返回后备结果，不再调用提供方
+    assert simple_client.portal.call(call)["degraded"] is True
+    assert standin_state.calls["messages"] == 2
@@ -0,0 +1,46 @@
+import asyncio
+
+import httpx
+
+import standin
+from conftest import wait_for
+from message_batches import MessageBatchClient
+
+
+def _client() -> MessageBatchClient:
+    return MessageBatchClient("test-key", base_url="http://standin", transport=httpx.ASGITransport(app=standin.app))
+
+
+def test_results_skip_malformed_lines(standin_state):
+    standin_state.FAULTS.update({"a-reality": "malformed", "a-survival": "missing_result"})
+
+    async def run():
+        client = _client()
+        batch = await client.create([
+            {"custom_id": custom_id, "params": {}}
+            for custom_id in ("a-reality", "a-survival", "a-competition")
+        ])
+        return await client.results(await client.retrieve(batch["id"]))
+
+    results = asyncio.run(run())
+    assert list(results) == ["a-competition"]
+    assert results["a-competition"]["type"] == "succeeded"
+
+
+def test_bulk_refresh_falls_back_to_realtime_for_bad_items(simple_client, standin_state):
+    standin_state.FAULTS.update({
+        "LEGN-reality": "errored",
+        "LEGN-survival": "malformed",
+        "LEGN-competition": "missing_result",
+        "LEGN-history": "empty_content",
+        "LEGN-pipeline": "invalid_json",
+    })
+
+    bulk = simple_client.post("/api/bulk", json={"tickers": ["LEGN", "REGN"]}).json()
+    bulk = wait_for(simple_client, f"/api/bulk/{bulk['bulk_id']}", lambda b: b["status"] in ("completed", "failed"))
+
+    assert bulk["status"] == "completed"
+    assert bulk["realtime_fallbacks"] == 5
+    assert standin_state.calls["messages"] == 5
+    for ticker in ("LEGN", "REGN"):
+        assert bulk["tickers"][ticker] == {"status": "completed"}
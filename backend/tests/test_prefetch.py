@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+import metrics
+from conftest import wait_for
+from prefetch import SpeculativePrefetcher
+
+
+async def _idle():
+    await asyncio.sleep(3600)
+
+
+def _count(name: str, **labels) -> float:
+    return metrics._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+
+def test_duplicate_and_capacity_skipped():
+    async def run():
+        prefetcher = SpeculativePrefetcher(max_inflight=2, ttl=60)
+        launched = []
+
+        def launch():
+            task = asyncio.create_task(_idle())
+            launched.append(task)
+            return task
+
+        assert prefetcher.start("REGN", "prepare", launch)
+        assert not prefetcher.start("REGN", "analysis", launch)
+        assert prefetcher.start("VRTX", "prepare", launch)
+        assert not prefetcher.start("BEAM", "prepare", launch)
+        # 已完成的预取不占用并发名额
+        launched[0].cancel()
+        await asyncio.sleep(0)
+        assert prefetcher.inflight() == 1
+        assert prefetcher.start("BEAM", "prepare", launch)
+        for task in launched:
+            task.cancel()
+        return len(launched)
+
+    assert asyncio.run(run()) == 3
+
+
+def test_unclaimed_prefetch_cancelled_after_ttl():
+    async def run():
+        prefetcher = SpeculativePrefetcher(ttl=0.05)
+        cancelled_before = _count("prefetch_cancelled_total", kind="prepare")
+        prefetcher.start("REGN", "prepare", lambda: asyncio.create_task(_idle()))
+        task = prefetcher._entries["REGN"]["task"]
+        await asyncio.sleep(0.1)
+        assert task.cancelled()
+        assert prefetcher.claim("REGN", "prepare") is None
+        assert _count("prefetch_cancelled_total", kind="prepare") == cancelled_before + 1
+
+    asyncio.run(run())
+
+
+def test_claimed_prefetch_not_expired():
+    async def run():
+        prefetcher = SpeculativePrefetcher(ttl=0.05)
+        prefetcher.start("REGN", "prepare", lambda: asyncio.create_task(asyncio.sleep(0.1, result="ready")))
+        assert prefetcher.claim("REGN", "analysis") is None
+        entry = prefetcher.claim("REGN", "prepare")
+        # 接管后即使超过 TTL 也不会被取消
+        return await entry["task"]
+
+    assert asyncio.run(run()) == "ready"
+
+
+@pytest.fixture
+def fresh_app(simple_app, standin_state, monkeypatch):
+    """没有缓存结果、使用独立预取器的 main-simple"""
+    monkeypatch.setattr(simple_app, "latest_results", {})
+    monkeypatch.setattr(simple_app, "prefetcher", SpeculativePrefetcher())
+    standin_state.REALTIME["delay"] = 0.2
+    return simple_app
+
+
+def test_analyze_attaches_to_prefetched_analysis(fresh_app, simple_client):
+    prefetched = simple_client.post("/api/prefetch/REGN").json()
+    assert prefetched == {"ticker": "REGN", "prefetch": "analysis"}
+    job_id = fresh_app.prefetcher.stats()["pending"]["REGN"]["job_id"]
+
+    response = simple_client.post("/api/analyze", json={"ticker": "REGN"}).json()
+    assert response["job_id"] == job_id
+    assert response["message"] == "Attached to prefetched analysis"
+    assert fresh_app.analysis_jobs[job_id]["priority"] == "interactive"
+    body = wait_for(simple_client, f"/api/analyze/{job_id}", lambda b: b["status"] != "processing")
+    assert body["status"] == "completed"
+
+
+def test_prefetch_after_analyze_does_not_start_another(fresh_app, simple_client):
+    # 前端几乎同时发出两个请求，分析请求先到达
+    job_id = simple_client.post("/api/analyze", json={"ticker": "VRTX"}).json()["job_id"]
+    assert simple_client.post("/api/prefetch/VRTX").json()["prefetch"] is None
+    assert fresh_app.prefetcher.stats()["pending"] == {}
+    assert [j for j, job in fresh_app.analysis_jobs.items() if job["ticker"] == "VRTX" and job["status"] == "processing"] == [job_id]
+    wait_for(simple_client, f"/api/analyze/{job_id}", lambda b: b["status"] != "processing")
+
+
+def test_root_advertises_optional_endpoints(simple_client, main_app):
+    from fastapi.testclient import TestClient
+
+    assert simple_client.get("/").json()["features"] == ["prefetch", "cancel"]
+    assert TestClient(main_app.app).get("/").json()["features"] == []
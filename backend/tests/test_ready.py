@@ -0,0 +1,27 @@
+import providers
+from conftest import wait_for
+
+
+def test_ready_reports_provider_failures(main_app, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("missing API key")
+        return object()
+
+    monkeypatch.setitem(providers._factories, "broken", broken)
+    monkeypatch.setattr(main_app, "SELECTED_PROVIDERS", ["broken"])
+
+    with TestClient(main_app.app) as client:
+        body = wait_for(client, "/ready", lambda b: b.get("detail", {}).get("warmup_ms") is not None)
+        assert body["detail"]["ready"] is False
+        assert body["detail"]["provider_errors"] == {"broken": "missing API key"}
+
+        # 失败的提供方在下一次就绪检查时重试
+        body = wait_for(client, "/ready", lambda b: b.get("ready") is True)
+        assert body["ready"] is True
+        assert body["provider_errors"] == {}
@@ -0,0 +1,51 @@
+from starlette.requests import Request
+
+from responses import json_response
+
+
+def _request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(k.replace("_", "-").lower().encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+BIG = {"text": "x" * 4096}
+
+
+def test_q_zero_disables_encoding():
+    assert json_response(_request(accept_encoding="br;q=0, gzip"), BIG).headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in json_response(_request(accept_encoding="br;q=0, gzip;q=0"), BIG).headers
+    assert "content-encoding" not in json_response(_request(accept_encoding="*;q=0"), BIG).headers
+    assert json_response(_request(accept_encoding="gzip;q=1.0, br;q=0.5"), BIG).headers["content-encoding"] == "gzip"
+
+
+def test_versioned_response_skips_serialization_on_repeat():
+    calls = []
+
+    def payload():
+        calls.append(1)
+        return {"status": "completed"}
+
+    first = json_response(_request(), payload, version=("test", 1))
+    etag = first.headers["etag"]
+    second = json_response(_request(if_none_match=etag), payload, version=("test", 1))
+    assert second.status_code == 304
+    assert len(calls) == 1
+
+    # 版本变化时重新生成
+    json_response(_request(), payload, version=("test", 2))
+    assert len(calls) == 2
+
+
+def test_job_poll_etag_changes_with_status(simple_app, simple_client):
+    simple_app.analysis_jobs["etag-job"] = {"status": "processing", "ticker": "LEGN", "result": None, "error": None}
+    etag = simple_client.get("/api/analyze/etag-job").headers["etag"]
+    assert simple_client.get("/api/analyze/etag-job", headers={"If-None-Match": etag}).status_code == 304
+
+    simple_app.analysis_jobs["etag-job"].update(status="completed", result={"ticker": "LEGN"})
+    response = simple_client.get("/api/analyze/etag-job", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["result"] == {"ticker": "LEGN"}
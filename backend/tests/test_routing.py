@@ -0,0 +1,68 @@
+import asyncio
+import contextlib
+import functools
+import time
+
+import pytest
+
+from routing import Router
+
+
+@pytest.fixture
+def router(simple_app, monkeypatch):
+    router = Router(routes={"only": {"provider": "anthropic", "model": "standin", "tier": 2}})
+    monkeypatch.setattr(simple_app, "router", router)
+    return router
+
+
+def _call(simple_app, **kwargs):
+    return functools.partial(
+        simple_app.analyze_with_claude, "test-key", "PROTOCOL", "context",
+        protocol_name="reality", ticker="REGN", **kwargs
+    )
+
+
+def test_success_recorded_once(simple_app, simple_client, standin_state, router):
+    assert simple_client.portal.call(_call(simple_app))["reality_gap_score"] == 4
+    stats = router.stats()["routes"]["only"]
+    assert stats["calls"] == 1
+    assert stats["error_rate"] == 0.0
+
+
+def test_unparseable_response_recorded_once_as_failure(simple_app, simple_client, standin_state, router):
+    standin_state.REALTIME["fault"] = "empty_content"
+    result = simple_client.portal.call(_call(simple_app))
+    assert result["degraded"] is True
+    stats = router.stats()["routes"]["only"]
+    assert stats["calls"] == 1
+    assert stats["error_rate"] > 0
+
+
+def test_deadline_recorded_as_failure(simple_app, simple_client, standin_state, router):
+    standin_state.REALTIME["delay"] = 1.0
+
+    async def run():
+        deadline = time.monotonic() + 0.2
+        # 与 run_analysis_job 相同：截止时间由 asyncio.timeout 强制执行，httpx 超时也可能先到
+        with contextlib.suppress(TimeoutError):
+            async with asyncio.timeout(0.2):
+                await _call(simple_app, deadline=deadline)()
+
+    simple_client.portal.call(run)
+    stats = router.stats()["routes"]["only"]
+    assert stats["calls"] == 1
+    assert stats["error_rate"] > 0
+
+
+def test_cancelled_call_not_recorded(simple_app, simple_client, standin_state, router):
+    standin_state.REALTIME["delay"] = 1.0
+
+    async def run():
+        task = asyncio.create_task(_call(simple_app, deadline=time.monotonic() + 30)())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    simple_client.portal.call(run)
+    assert router.stats()["routes"]["only"]["calls"] == 0
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from scheduler import PriorityLimiter
+
+
+async def _hold(limiter: PriorityLimiter, priority: str, order: list, release: asyncio.Event, key=None):
+    async with limiter.slot(priority, key=key):
+        order.append(priority)
+        await release.wait()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_interactive_jumps_ahead_of_queued_background():
+    async def run():
+        limiter = PriorityLimiter(capacity=1, aging_seconds=3600)
+        order, release = [], asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, "background", order, asyncio.Event()))
+        await _settle()
+        waiting = [asyncio.create_task(_hold(limiter, "background", order, release)) for _ in range(3)]
+        await _settle()
+        interactive = asyncio.create_task(_hold(limiter, "interactive", order, release))
+        await _settle()
+        assert limiter.queue_depth("background") == 3 and limiter.queue_depth("interactive") == 1
+
+        holder.cancel()
+        release.set()
+        await asyncio.gather(*waiting, interactive)
+        return order
+
+    assert asyncio.run(run()) == ["background", "interactive", "background", "background", "background"]
+
+
+def test_cancelled_waiter_frees_its_place():
+    async def run():
+        limiter = PriorityLimiter(capacity=1)
+        order, release = [], asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, "interactive", order, release))
+        await _settle()
+        cancelled = asyncio.create_task(_hold(limiter, "interactive", order, release))
+        queued = asyncio.create_task(_hold(limiter, "batch", order, release))
+        await _settle()
+        assert limiter.queue_depth() == 2
+
+        cancelled.cancel()
+        await _settle()
+        assert limiter.queue_depth() == 1
+        release.set()
+        await asyncio.gather(holder, queued)
+        assert cancelled.cancelled()
+        return order, limiter.in_use, limiter.queue_depth()
+
+    order, in_use, depth = asyncio.run(run())
+    assert order == ["interactive", "batch"]
+    assert (in_use, depth) == (0, 0)
+
+
+def test_cancelled_after_grant_returns_slot():
+    async def run():
+        limiter = PriorityLimiter(capacity=1)
+        await limiter.acquire("interactive")
+        waiter = asyncio.create_task(limiter.acquire("batch"))
+        await _settle()
+        # 槽位刚分配给排队者、它还没恢复运行时被取消
+        limiter.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return limiter.in_use
+
+    assert asyncio.run(run()) == 0
+
+
+def test_provider_concurrency_limit():
+    async def run():
+        limiter = PriorityLimiter(capacity=3)
+        active, peak = 0, 0
+
+        async def call(priority):
+            nonlocal active, peak
+            async with limiter.slot(priority):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.001)
+                active -= 1
+
+        await asyncio.gather(*(call(p) for p in ["interactive", "batch", "background"] * 10))
+        return peak, limiter.in_use, limiter.stats()
+
+    peak, in_use, stats = asyncio.run(run())
+    assert peak == 3
+    assert in_use == 0
+    assert stats["capacity"] == 3
+    assert all(c["samples"] == 10 and c["queued"] == 0 for c in stats["classes"].values())
+
+
+def test_promote_moves_queued_request():
+    async def run():
+        limiter = PriorityLimiter(capacity=1, aging_seconds=3600)
+        order, release = [], asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, "batch", order, asyncio.Event()))
+        await _settle()
+        other = asyncio.create_task(_hold(limiter, "batch", order, release))
+        await _settle()
+        promoted = asyncio.create_task(_hold(limiter, "background", order, release, key="job-1"))
+        await _settle()
+        assert limiter.promote("job-1", "interactive") == 1
+
+        holder.cancel()
+        release.set()
+        await asyncio.gather(other, promoted)
+        return order
+
+    # 提升后的请求按 interactive 份额调度，先于更早排队的 batch 请求
+    assert asyncio.run(run()) == ["batch", "background", "batch"]
+
+
+def test_unknown_priority_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(PriorityLimiter().acquire("urgent"))
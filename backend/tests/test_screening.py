@@ -0,0 +1,90 @@
+import math
+
+import pytest
+
+from screening import ScreeningIndex, parse_condition, to_number
+
+
+def _result(**survival):
+    reality = {"reality_gap_score": survival.pop("reality_gap_score", None)}
+    return {"company_name": "Test", "analysis": {"reality": reality, "survival": survival}}
+
+
+@pytest.fixture
+def index():
+    index = ScreeningIndex(capacity=2)
+    index.upsert("AAA", _result(runway_months=6, rd_intensity="70%", reality_gap_score=8))
+    index.upsert("BBB", _result(runway_months=30, rd_intensity="45%", reality_gap_score=3))
+    index.upsert("CCC", _result(runway_months=10, rd_intensity=None, reality_gap_score=5))
+    index.upsert("DDD", _result(runway_months=None, rd_intensity="+80%"))
+    return index
+
+
+def test_to_number():
+    assert to_number(18) == 18.0
+    assert to_number("+25%") == 25.0
+    assert to_number("1,234.5") == 1234.5
+    assert math.isnan(to_number(None))
+    assert math.isnan(to_number(True))
+    assert math.isnan(to_number("N/A"))
+
+
+def test_parse_condition():
+    assert parse_condition("runway_months<12") == ("runway_months", "<", 12.0)
+    assert parse_condition(" rd_intensity >= 50% ") == ("rd_intensity", ">=", 50.0)
+    with pytest.raises(ValueError):
+        parse_condition("company_name=1")
+    with pytest.raises(ValueError):
+        parse_condition("runway_months<<12")
+
+
+def test_conditions_combine_and_skip_missing_values(index):
+    page = index.query([parse_condition("runway_months<12")], fields=["ticker"])
+    assert [r["ticker"] for r in page["results"]] == ["AAA", "CCC"]
+
+    page = index.query([parse_condition("runway_months<12"), parse_condition("rd_intensity>=50")], fields=["ticker"])
+    assert [r["ticker"] for r in page["results"]] == ["AAA"]
+
+    # NaN 不满足任何比较，包括 !=
+    page = index.query([parse_condition("runway_months!=6")], fields=["ticker"])
+    assert [r["ticker"] for r in page["results"]] == ["BBB", "CCC"]
+
+
+def test_sort_puts_missing_values_last(index):
+    page = index.query([], sort="-rd_intensity", fields=["ticker", "rd_intensity"])
+    assert [r["ticker"] for r in page["results"]] == ["DDD", "AAA", "BBB", "CCC"]
+    assert page["results"][-1]["rd_intensity"] is None
+
+    page = index.query([], sort="runway_months", fields=["ticker"])
+    assert [r["ticker"] for r in page["results"]] == ["AAA", "CCC", "BBB", "DDD"]
+
+
+def test_pagination_and_upsert_overwrites(index):
+    page = index.query([], sort="runway_months", offset=1, limit=2, fields=["ticker"])
+    assert [r["ticker"] for r in page["results"]] == ["CCC", "BBB"]
+    assert page["total"] == 4
+
+    index.upsert("aaa", _result(runway_months=40))
+    assert len(index) == 4
+    page = index.query([parse_condition("runway_months>35")], fields=["ticker", "runway_months"])
+    assert page["results"] == [{"ticker": "AAA", "runway_months": 40.0}]
+
+
+def test_unknown_fields_rejected(index):
+    with pytest.raises(ValueError):
+        index.query([], sort="company_name")
+    with pytest.raises(ValueError):
+        index.query([], fields=["nope"])
+
+
+def test_screening_index_restored_from_archive(simple_app, simple_client, monkeypatch):
+    simple_app.archive.record({
+        "ticker": "ZZZZ",
+        "company_name": "Archived Co",
+        "analysis": {"survival": {"runway_months": 3}},
+    })
+    monkeypatch.setattr(simple_app, "screening_index", ScreeningIndex())
+
+    simple_client.portal.call(simple_app.restore_from_archive)
+    body = simple_client.get("/api/screen", params={"where": "runway_months<4", "fields": "ticker,company_name"}).json()
+    assert {"ticker": "ZZZZ", "company_name": "Archived Co"} in body["results"]
@@ -0,0 +1,31 @@
+import signal
+
+from shutdown import ShutdownCoordinator
+
+
+def test_signal_marks_draining_before_previous_handler():
+    seen = []
+    original = signal.getsignal(signal.SIGTERM)
+    coordinator = ShutdownCoordinator()
+    try:
+        # 模拟 uvicorn 已安装的处理函数
+        signal.signal(signal.SIGTERM, lambda signum, frame: seen.append(coordinator.draining))
+        coordinator.install_signal_handlers()
+        assert not coordinator.draining
+
+        signal.raise_signal(signal.SIGTERM)
+        assert seen == [True]
+        assert coordinator.draining
+    finally:
+        signal.signal(signal.SIGTERM, original)
+
+
+def test_remaining_budget_counts_from_signal():
+    coordinator = ShutdownCoordinator()
+    assert coordinator.remaining(25) == 25
+
+    coordinator.begin()
+    coordinator.started_at -= 20
+    assert 4.9 < coordinator.remaining(25) <= 5
+    coordinator.started_at -= 10
+    assert coordinator.remaining(25) == 0
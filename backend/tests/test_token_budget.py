@@ -0,0 +1,36 @@
+import functools
+
+import pytest
+
+import token_usage
+from token_usage import TokenBudgetExceeded, token_ledger
+
+
+def test_budget_checked_before_each_call(simple_app, simple_client, standin_state, monkeypatch):
+    monkeypatch.setattr(token_usage, "JOB_TOKEN_BUDGET", 1000)
+    call = functools.partial(
+        simple_app.analyze_with_claude, "test-key", "PROTOCOL", "context",
+        protocol_name="reality", ticker="LEGN", job_id="budget-job"
+    )
+
+    assert simple_client.portal.call(call)["reality_gap_score"] == 4
+
+    # 同一任务中其他模块的调用已用完预算
+    token_ledger.record("survival", input_tokens=900, output_tokens=100, job_id="budget-job")
+    with pytest.raises(TokenBudgetExceeded):
+        simple_client.portal.call(call)
+    assert standin_state.calls["messages"] == 1
+
+
+def test_job_usage_keeps_most_recent_jobs(monkeypatch):
+    monkeypatch.setattr(token_usage, "MAX_TRACKED_JOBS", 3)
+    ledger = token_usage.TokenLedger()
+    for job_id in ("a", "b", "c"):
+        ledger.record("reality", input_tokens=10, job_id=job_id)
+    # 仍在调用的任务刷新其位置，淘汰最久未使用的任务
+    ledger.record("survival", input_tokens=10, job_id="a")
+    ledger.record("reality", input_tokens=10, job_id="d")
+
+    assert list(ledger.by_job) == ["c", "a", "d"]
+    assert ledger.by_job["a"]["calls"] == 2
+    assert sum(bucket["calls"] for bucket in ledger.by_protocol.values()) == 5
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from contextvars import Context
+
+import pytest
+
+import tracing
+from tracing import get_trace, start_span
+
+
+@pytest.fixture
+def traces(monkeypatch):
+    monkeypatch.setattr(tracing, "recent_traces", OrderedDict())
+    monkeypatch.setattr(tracing, "_stored_spans", 0)
+    return tracing
+
+
+def _trace(spans: int) -> str:
+    with start_span("root") as root:
+        for _ in range(spans - 1):
+            with start_span("child"):
+                pass
+    return root.trace_id
+
+
+def test_evicts_by_span_count(traces, monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_STORED_SPANS", 5)
+    first, second, third = _trace(2), _trace(2), _trace(2)
+
+    assert get_trace(first) is None
+    assert len(get_trace(second)) == 2
+    assert len(get_trace(third)) == 2
+    assert traces._stored_spans == 4
+
+
+def test_long_running_trace_survives_short_traces(traces, monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_STORED_SPANS", 50)
+    with start_span("analysis.job") as job:
+        with start_span("llm.call"):
+            pass
+        # 任务进行中其他请求产生的大量短 trace（各自独立的上下文）
+        for _ in range(20):
+            Context().run(_trace, 1)
+        with start_span("llm.call"):
+            pass
+    assert [span["name"] for span in get_trace(job.trace_id)] == ["analysis.job", "llm.call", "llm.call"]
+
+
+def test_poll_and_health_requests_not_recorded(traces, simple_client):
+    for url in ("/", "/metrics", "/api/analyze/unknown-job", "/api/bulk/unknown"):
+        response = simple_client.get(url)
+        assert response.headers["X-Trace-Id"]
+        assert get_trace(response.headers["X-Trace-Id"]) is None, url
+
+    response = simple_client.get("/api/scheduler")
+    spans = get_trace(response.headers["X-Trace-Id"])
+    assert spans[0]["name"] == "GET /api/scheduler"
@@ -0,0 +1,148 @@
+"""
+Token 用量统计与自适应 max_tokens
+
+- 按 protocol / job / ticker / 天 累计 input、output、cached token
+- 每个 protocol 的输出上限根据近期实际输出长度的分位数自动调整
+- 单个 job、单日的 token 预算，超出后拒绝继续调用
+"""
+import math
+import os
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+
+import metrics
+
+# 各 protocol 的初始输出上限（样本不足时使用）
+DEFAULT_MAX_TOKENS = {
+    "reality": 512,
+    "survival": 1024,
+    "competition": 1024,
+    "history": 768,
+    "pipeline": 2048,
+}
+MAX_TOKENS_CEILING = int(os.getenv("MAX_TOKENS_CEILING", "4096"))
+MAX_TOKENS_FLOOR = 256
+
+# 样本数达到该值后才按分位数调整
+_MIN_SAMPLES = 20
+_WINDOW = 200
+_PERCENTILE = 0.99
+_HEADROOM = 1.25
+
+# 预算（0 表示不限制）
+JOB_TOKEN_BUDGET = int(os.getenv("JOB_TOKEN_BUDGET", "60000"))
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", "0"))
+
+# 按 job 统计最多保留的任务数（LRU）：结束的任务仍可通过 /api/usage?job_id= 查询，但不会无限增长；
+# 远大于同时进行的任务数，进行中任务的预算统计不会被淘汰
+MAX_TRACKED_JOBS = int(os.getenv("TOKEN_USAGE_MAX_JOBS", "1000"))
+
+metrics.describe("llm_tokens_total", "LLM tokens consumed, by protocol and kind")
+metrics.describe("llm_max_tokens", "Current adaptive max_tokens per protocol")
+
+
+class TokenBudgetExceeded(Exception):
+    pass
+
+
+def _empty() -> Dict[str, int]:
+    return {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "calls": 0}
+
+
+def _add(bucket: Dict[str, int], input_tokens: int, output_tokens: int, cached_tokens: int):
+    bucket["input_tokens"] += input_tokens
+    bucket["output_tokens"] += output_tokens
+    bucket["cached_tokens"] += cached_tokens
+    bucket["calls"] += 1
+
+
+class TokenLedger:
+    def __init__(self):
+        self.by_protocol: Dict[str, Dict[str, int]] = {}
+        self.by_ticker: Dict[str, Dict[str, int]] = {}
+        self.by_job: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        self.by_day: Dict[str, Dict[str, int]] = {}
+        self._output_samples: Dict[str, deque] = {}
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def record(
+        self,
+        protocol: str,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        cached_tokens: int = 0,
+        ticker: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ):
+        """记录一次调用的 token 用量"""
+        buckets = [
+            self.by_protocol.setdefault(protocol, _empty()),
+            self.by_day.setdefault(self._today(), _empty()),
+        ]
+        if ticker:
+            buckets.append(self.by_ticker.setdefault(ticker.upper(), _empty()))
+        if job_id:
+            buckets.append(self._job_bucket(job_id))
+        for bucket in buckets:
+            _add(bucket, input_tokens, output_tokens, cached_tokens)
+
+        self._output_samples.setdefault(protocol, deque(maxlen=_WINDOW)).append(output_tokens)
+
+        metrics.inc("llm_tokens_total", input_tokens, protocol=protocol, kind="input")
+        metrics.inc("llm_tokens_total", output_tokens, protocol=protocol, kind="output")
+        metrics.inc("llm_tokens_total", cached_tokens, protocol=protocol, kind="cached")
+
+    def _job_bucket(self, job_id: str) -> Dict[str, int]:
+        bucket = self.by_job.get(job_id)
+        if bucket is None:
+            bucket = self.by_job[job_id] = _empty()
+            while len(self.by_job) > MAX_TRACKED_JOBS:
+                self.by_job.popitem(last=False)
+        else:
+            self.by_job.move_to_end(job_id)
+        return bucket
+
+    def _used(self, bucket: Optional[Dict[str, int]]) -> int:
+        if not bucket:
+            return 0
+        return bucket["input_tokens"] + bucket["output_tokens"]
+
+    def check_budget(self, job_id: Optional[str] = None):
+        """超出单日或单个 job 预算时抛出 TokenBudgetExceeded"""
+        if DAILY_TOKEN_BUDGET and self._used(self.by_day.get(self._today())) >= DAILY_TOKEN_BUDGET:
+            raise TokenBudgetExceeded(f"Daily token budget exhausted ({DAILY_TOKEN_BUDGET})")
+        if job_id and JOB_TOKEN_BUDGET and self._used(self.by_job.get(job_id)) >= JOB_TOKEN_BUDGET:
+            raise TokenBudgetExceeded(f"Job token budget exhausted ({JOB_TOKEN_BUDGET})")
+
+    def max_tokens_for(self, protocol: str, job_id: Optional[str] = None) -> int:
+        """当前 protocol 的输出上限：近期输出 p99 × 1.25，并受剩余 job 预算约束"""
+        limit = DEFAULT_MAX_TOKENS.get(protocol, 2048)
+        samples = self._output_samples.get(protocol)
+        if samples and len(samples) >= _MIN_SAMPLES:
+            ordered = sorted(samples)
+            index = min(len(ordered) - 1, math.ceil(_PERCENTILE * len(ordered)) - 1)
+            limit = math.ceil(ordered[index] * _HEADROOM)
+        limit = max(MAX_TOKENS_FLOOR, min(limit, MAX_TOKENS_CEILING))
+
+        if job_id and JOB_TOKEN_BUDGET:
+            remaining = JOB_TOKEN_BUDGET - self._used(self.by_job.get(job_id))
+            limit = max(1, min(limit, remaining))
+
+        metrics.set_gauge("llm_max_tokens", limit, protocol=protocol)
+        return limit
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "by_protocol": self.by_protocol,
+            "by_ticker": self.by_ticker,
+            "by_day": self.by_day,
+            "max_tokens": {protocol: self.max_tokens_for(protocol) for protocol in DEFAULT_MAX_TOKENS},
+            "budgets": {"job": JOB_TOKEN_BUDGET, "daily": DAILY_TOKEN_BUDGET},
+        }
+
+
+token_ledger = TokenLedger()
@@ -0,0 +1,212 @@
+"""
+链路追踪 - 生成 OpenTelemetry 兼容的 span（W3C traceparent 传播 + OTLP JSON 导出）
+
+- 当前 span 保存在 contextvars 中：asyncio.create_task / asyncio.gather / asyncio.to_thread 都会复制上下文，
+  因此 HTTP 请求的 trace 会延续到后台分析任务、并发的 protocol 调用和线程池中的 SDK 调用。
+- 不需要外部 collector：TRACE_EXPORTER=file 时把结束的 span 以 OTLP JSON Lines 写入 TRACE_FILE
+  （可直接交给 collector 的 otlpjsonfile receiver），console 时打印到标准输出，未设置时不导出。
+- 最近的 trace 保存在内存中（按 span 总数淘汰最久未更新的 trace），可通过 /api/traces/{trace_id} 查看；
+  状态轮询和健康检查请求（UNRECORDED_ROUTES）的 span 不保存也不导出，避免高频轮询把分析任务的 trace 挤出去。
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List
+
+import metrics
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")  # "" / console / file
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "veritas-api")
+# 内存中最多保存的 span 数（所有 trace 合计）
+MAX_STORED_SPANS = int(os.getenv("TRACE_MAX_STORED_SPANS", "5000"))
+
+# 不记录 span 的路由（状态轮询、健康检查）；请求仍返回 X-Trace-Id，出错（5xx）时照常记录
+UNRECORDED_ROUTES = {"/", "/ready", "/metrics", "/api/analyze/{job_id}", "/api/bulk/{bulk_id}", "/api/traces/{trace_id}"}
+
+# OTLP 枚举值
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+metrics.describe("trace_spans_total", "Finished trace spans, by name and status")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+
+# 最近的 trace（trace_id -> span 列表，OTLP JSON 格式）
+recent_traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+_stored_spans = 0
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _attribute_value(v)} for k, v in attributes.items() if v is not None]
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.events: List[Dict[str, Any]] = []
+        self.status_code = 0
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        # 为 False 时结束后不保存、不导出
+        self.recorded = True
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"timeUnixNano": str(time.time_ns()), "name": name, "attributes": _attributes(attributes)})
+
+    def set_error(self, message: str):
+        self.status_code = STATUS_ERROR
+        self.status_message = message
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _attributes(self.attributes),
+            "events": self.events,
+            "status": {"code": self.status_code, "message": self.status_message} if self.status_code else {},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """解析 W3C traceparent（00-<trace_id>-<span_id>-<flags>），返回 (trace_id, span_id)"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attributes(**attributes):
+    """给当前 span 添加属性（没有活动 span 时忽略）"""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attributes(**attributes)
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, traceparent: Optional[str] = None, **attributes):
+    """
+    开启一个 span 并设为当前 span；parent 为当前 span，或 traceparent 指定的远端 span。
+    退出时记录耗时和状态（异常、取消都会标记为错误）并导出。
+    """
+    parent = _current_span.get()
+    remote = parse_traceparent(traceparent) if parent is None else None
+    if parent is not None:
+        trace_id, parent_span_id = parent.trace_id, parent.span_id
+    elif remote:
+        trace_id, parent_span_id = remote
+    else:
+        trace_id, parent_span_id = secrets.token_hex(16), None
+
+    span = Span(name, trace_id, parent_span_id, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.add_event("exception", **{"exception.type": type(e).__name__, "exception.message": str(e)})
+        span.set_error(str(e) or type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_ns = time.time_ns()
+        _export(span)
+
+
+def _export(span: Span):
+    global _stored_spans
+    if not span.recorded:
+        return
+    otlp = span.to_otlp()
+    metrics.inc("trace_spans_total", span=span.name, status="error" if span.status_code == STATUS_ERROR else "ok")
+
+    # span 也可能在 asyncio.to_thread 的工作线程中结束
+    with _export_lock:
+        recent_traces.setdefault(span.trace_id, []).append(otlp)
+        recent_traces.move_to_end(span.trace_id)
+        _stored_spans += 1
+        # 按 span 数而不是 trace 数淘汰：分析任务的 trace 在任务进行中持续有新 span 结束，会一直排在后面
+        while _stored_spans > MAX_STORED_SPANS and len(recent_traces) > 1:
+            _, evicted = recent_traces.popitem(last=False)
+            _stored_spans -= len(evicted)
+
+    if not TRACE_EXPORTER:
+        return
+    line = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": "veritas"}, "spans": [otlp]}],
+        }]
+    }, ensure_ascii=False)
+    with _export_lock:
+        if TRACE_EXPORTER != "file":
+            print(line)
+            return
+        # 导出失败不影响业务请求
+        try:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"Trace export failed: {str(e)}")
+
+
+def get_trace(trace_id: str) -> Optional[List[Dict[str, Any]]]:
+    """某条 trace 已结束的 span（按开始时间排序）"""
+    with _export_lock:
+        spans = list(recent_traces.get(trace_id) or [])
+    if not spans:
+        return None
+    return sorted(spans, key=lambda s: int(s["startTimeUnixNano"]))
@@ -0,0 +1,94 @@
+"""
+重点跟踪的生物医药公司（中文名、研究方向、核心产品等），补充注册表中的 SEC 数据
+"""
+
+BIOTECH_COMPANIES = {
+    "LEGN": {
+        "ticker": "LEGN",
+        "company_name": "Legend Biotech Corporation",
+        "company_name_cn": "传奇生物",
+        "cik": "0001801198",
+        "sic": "2834",
+        "sector": "Biotechnology",
+        "focus": "CAR-T细胞疗法",
+        "key_products": ["Carvykti (cilta-cel)"],
+        "therapeutic_areas": ["多发性骨髓瘤", "血液肿瘤"]
+    },
+    "SMMT": {
+        "ticker": "SMMT",
+        "company_name": "Summit Therapeutics Inc.",
+        "company_name_cn": "Summit Therapeutics",
+        "cik": "0001499620",
+        "sic": "2834",
+        "sector": "Biotechnology",
+        "focus": "PD-1/VEGF双抗",
+        "key_products": ["Ivonescimab (依沃西单抗)"],
+        "therapeutic_areas": ["非小细胞肺癌", "实体瘤"]
+    },
+    "LLY": {
+        "ticker": "LLY",
+        "company_name": "Eli Lilly and Company",
+        "company_name_cn": "礼来",
+        "cik": "0000059478",
+        "sic": "2834",
+        "sector": "Pharmaceuticals",
+        "focus": "GLP-1/糖尿病/肥胖症",
+        "key_products": ["Mounjaro", "Zepbound", "Verzenio"],
+        "therapeutic_areas": ["糖尿病", "肥胖症", "肿瘤"]
+    },
+    "MRNA": {
+        "ticker": "MRNA",
+        "company_name": "Moderna, Inc.",
+        "company_name_cn": "Moderna",
+        "cik": "0001682852",
+        "sic": "2836",
+        "sector": "Biotechnology",
+        "focus": "mRNA技术平台",
+        "key_products": ["Spikevax (COVID疫苗)"],
+        "therapeutic_areas": ["传染病", "肿瘤", "罕见病"]
+    },
+    "REGN": {
+        "ticker": "REGN",
+        "company_name": "Regeneron Pharmaceuticals, Inc.",
+        "company_name_cn": "再生元",
+        "cik": "0000872589",
+        "sic": "2834",
+        "sector": "Biotechnology",
+        "focus": "单克隆抗体",
+        "key_products": ["Eylea", "Dupixent", "Libtayo"],
+        "therapeutic_areas": ["眼科", "免疫", "肿瘤"]
+    },
+    "VRTX": {
+        "ticker": "VRTX",
+        "company_name": "Vertex Pharmaceuticals Incorporated",
+        "company_name_cn": "福泰制药",
+        "cik": "0000875320",
+        "sic": "2834",
+        "sector": "Biotechnology",
+        "focus": "基因疗法/囊性纤维化",
+        "key_products": ["Trikafta", "Casgevy"],
+        "therapeutic_areas": ["囊性纤维化", "镰刀型细胞贫血症", "疼痛"]
+    },
+    "BMRN": {
+        "ticker": "BMRN",
+        "company_name": "BioMarin Pharmaceutical Inc.",
+        "company_name_cn": "BioMarin",
+        "cik": "0001048477",
+        "sic": "2834",
+        "sector": "Biotechnology",
+        "focus": "罕见病",
+        "key_products": ["Voxzogo", "Roctavian"],
+        "therapeutic_areas": ["软骨发育不全", "血友病A", "罕见病"]
+    },
+    "ALNY": {
+        "ticker": "ALNY",
+        "company_name": "Alnylam Pharmaceuticals, Inc.",
+        "company_name_cn": "Alnylam",
+        "cik": "0001178670",
+        "sic": "2834",
+        "sector": "Biotechnology",
+        "focus": "RNAi疗法",
+        "key_products": ["Onpattro", "Amvuttra", "Givlaari"],
+        "therapeutic_areas": ["罕见病", "心血管", "肝病"]
+    }
+}
@@ -9,9 +9,28 @@ export interface CompanyInfo {
   sector: string;
 }
 
+export interface CompanySearchResult {
+  ticker: string;
+  company_name: string;
+  company_name_cn?: string;
+  cik: string;
+  sic: string;
+  exchange?: string;
+  focus?: string;
+  tracked: boolean;
+  match: 'exact' | 'ticker_prefix' | 'name_prefix' | 'name_cn' | 'fuzzy';
+}
+
+// 提供方不可用时，模块可能来自降级后备结果；没有后备数据的公司只有标记，其余字段缺失
+export interface DegradedMarker {
+  degraded?: boolean;
+  degraded_source?: 'last_good' | null;
+  stale_as_of?: string | null;
+}
+
 export interface AnalysisResult {
   job_id: string;
-  status: 'processing' | 'completed' | 'failed';
+  status: 'processing' | 'completed' | 'failed' | 'cancelled';
   ticker: string;
   result?: {
     company_name: string;
@@ -21,39 +40,43 @@ export interface AnalysisResult {
     key_products?: string[];
     therapeutic_areas?: string[];
     sec_data?: any;
+    // 部分模块来自降级后备结果（提供方不可用时）
+    degraded?: boolean;
+    degraded_sections?: string[];
+    stale_as_of?: string | null;
     analysis: {
-      reality: {
-        narrative_label: string;
-        economic_label: string;
-        reality_gap_score: number;
+      reality: DegradedMarker & {
+        narrative_label?: string;
+        economic_label?: string;
+        reality_gap_score?: number;
         key_insight?: string;
       };
-      survival: {
+      survival: DegradedMarker & {
         quarterly_revenue?: number;
         revenue_change_yoy?: string;
         net_income?: number;
         net_income_change?: string;
         cash_position?: number;
         cash_change?: string;
-        runway_months: number | null;
+        runway_months?: number | null;
         rd_intensity?: string;
-        financial_health: string;
-        key_risks: string[];
+        financial_health?: string;
+        key_risks?: string[];
       };
-      competition: {
-        competitors: string[];
-        kill_switch: string;
-        market_dynamics: string;
+      competition: DegradedMarker & {
+        competitors?: string[];
+        kill_switch?: string;
+        market_dynamics?: string;
         competitive_advantage?: string;
       };
-      history?: {
-        revenue_history: Array<{
+      history?: DegradedMarker & {
+        revenue_history?: Array<{
           quarter: string;
           revenue: number;
         }>;
       };
-      pipeline?: {
-        pipeline: Array<{
+      pipeline?: DegradedMarker & {
+        pipeline?: Array<{
           name: string;
           stage: string;
           indication: string;
@@ -69,14 +92,52 @@ export interface AnalysisResult {
   error?: string;
 }
 
-export async function getCompanyInfo(ticker: string): Promise<CompanyInfo> {
-  const response = await fetch(`${API_BASE}/api/companies/${ticker}`);
+export async function getCompanyInfo(ticker: string, prefetch = false): Promise<CompanyInfo> {
+  // prefetch 时后端会为随后的分析请求提前获取 SEC 数据、预热连接
+  const response = await fetch(`${API_BASE}/api/companies/${ticker}${prefetch ? '?prefetch=1' : ''}`);
   if (!response.ok) {
     throw new Error(`Failed to fetch company info: ${response.statusText}`);
   }
   return response.json();
 }
 
+export async function searchCompanies(query: string, signal?: AbortSignal): Promise<CompanySearchResult[]> {
+  const response = await fetch(
+    `${API_BASE}/api/companies/search?q=${encodeURIComponent(query)}&limit=8`,
+    { signal }
+  );
+  if (!response.ok) {
+    throw new Error(`Failed to search companies: ${response.statusText}`);
+  }
+  const data = await response.json();
+  return data.results;
+}
+
+// 后端支持的可选接口（健康检查返回的 features）；main.py 没有预取和取消接口
+let backendFeatures: Promise<string[]> | null = null;
+
+function getBackendFeatures(): Promise<string[]> {
+  if (!backendFeatures) {
+    backendFeatures = fetch(`${API_BASE}/`)
+      .then((response) => (response.ok ? response.json() : {}))
+      .then((data) => (Array.isArray(data.features) ? data.features : []))
+      .catch(() => {
+        backendFeatures = null;
+        return [];
+      });
+  }
+  return backendFeatures;
+}
+
+export function prefetchCompany(ticker: string): void {
+  // 搜索框选中公司时调用，投机预取失败不影响后续流程
+  getBackendFeatures().then((features) => {
+    if (features.includes('prefetch')) {
+      fetch(`${API_BASE}/api/prefetch/${ticker}`, { method: 'POST', keepalive: true }).catch(() => {});
+    }
+  });
+}
+
 export async function analyzeCompany(ticker: string): Promise<AnalysisResult> {
   const controller = new AbortController();
   const timeoutId = setTimeout(() => controller.abort(), 120000); // 120秒超时
@@ -93,6 +154,11 @@ export async function analyzeCompany(ticker: string): Promise<AnalysisResult> {
 
     clearTimeout(timeoutId);
 
+    if (response.status === 429 || response.status === 503) {
+      const retryAfter = response.headers.get('Retry-After');
+      throw new Error(retryAfter ? `服务繁忙，请 ${retryAfter} 秒后重试` : '服务繁忙，请稍后重试');
+    }
+
     if (!response.ok) {
       throw new Error(`Failed to analyze company: ${response.statusText}`);
     }
@@ -107,8 +173,8 @@ export async function analyzeCompany(ticker: string): Promise<AnalysisResult> {
   }
 }
 
-export async function getAnalysisResult(jobId: string): Promise<AnalysisResult> {
-  const response = await fetch(`${API_BASE}/api/analyze/${jobId}`);
+export async function getAnalysisResult(jobId: string, signal?: AbortSignal): Promise<AnalysisResult> {
+  const response = await fetch(`${API_BASE}/api/analyze/${jobId}`, { signal });
 
   if (!response.ok) {
     throw new Error(`Failed to fetch analysis result: ${response.statusText}`);
@@ -116,3 +182,41 @@ export async function getAnalysisResult(jobId: string): Promise<AnalysisResult>
 
   return response.json();
 }
+
+export async function cancelAnalysis(jobId: string): Promise<void> {
+  if (!(await getBackendFeatures()).includes('cancel')) {
+    return;
+  }
+  // keepalive 保证页面卸载时请求仍能发出
+  await fetch(`${API_BASE}/api/analyze/${jobId}`, { method: 'DELETE', keepalive: true });
+}
+
+export async function waitForAnalysis(
+  jobId: string,
+  signal?: AbortSignal,
+  intervalMs = 1500
+): Promise<AnalysisResult> {
+  // 轮询直到任务结束；结果未变化时服务端返回 304，浏览器直接复用缓存
+  while (true) {
+    // 传入 signal：离开页面时正在进行的轮询请求也会立即中止
+    const result = await getAnalysisResult(jobId, signal);
+    if (result.status !== 'processing') {
+      return result;
+    }
+    await new Promise<void>((resolve, reject) => {
+      if (signal?.aborted) {
+        reject(new DOMException('Aborted', 'AbortError'));
+        return;
+      }
+      const timeoutId = setTimeout(() => {
+        signal?.removeEventListener('abort', onAbort);
+        resolve();
+      }, intervalMs);
+      const onAbort = () => {
+        clearTimeout(timeoutId);
+        reject(new DOMException('Aborted', 'AbortError'));
+      };
+      signal?.addEventListener('abort', onAbort, { once: true });
+    });
+  }
+}